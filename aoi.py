@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+import collections
+import json
+import numpy as np
+
+# A named area of interest, a bounding box and optionally the polygon of [lat, lon] vertices within it
+Area = collections.namedtuple('Area', ['name', 'minLat', 'maxLat', 'minLon', 'maxLon', 'polygon'])
+
+#
+# Loads the areas of a JSON area file, a list of objects with a name and either the bounding co-ordinates
+# (minimumLatitude, maximumLatitude, minimumLongitude, maximumLongitude) or a polygon of [lat, lon] vertices, e.g.
+# [{"name": "fairbanks", "minimumLatitude": 64.5, "maximumLatitude": 65.5, "minimumLongitude": -149,
+#   "maximumLongitude": -146}, {"name": "delta", "polygon": [[63.5, -146], [64.2, -145], [63.8, -144]]}]
+# Areas without a name are named area1, area2, ... and a polygon's bounding box defaults to that of its vertices
+# Returns a list of Areas
+#
+def loadAreas(path):
+  with open(path) as f:
+    entries = json.load(f)
+
+  areas = []
+  for i, entry in enumerate(entries):
+    name = str(entry.get('name', 'area' + str(i + 1)))
+
+    polygon = entry.get('polygon')
+    if polygon is not None:
+      polygon = tuple((float(lat), float(lon)) for lat, lon in polygon)
+      if len(polygon) < 3:
+        raise ValueError("The polygon of area " + name + " needs at least 3 vertices")
+      lats, lons = zip(*polygon)
+      bounds = {'minimumLatitude': min(lats), 'maximumLatitude': max(lats), 'minimumLongitude': min(lons),
+                'maximumLongitude': max(lons)}
+    else:
+      bounds = {}
+
+    try:
+      areas.append(Area(name, *([float(entry.get(key, bounds.get(key))) for key in (
+        'minimumLatitude', 'maximumLatitude', 'minimumLongitude', 'maximumLongitude')] + [polygon])))
+    except TypeError:
+      raise ValueError("Area " + name + " needs bounding co-ordinates or a polygon")
+
+  names = [area.name for area in areas]
+  if len(set(names)) != len(names):
+    raise ValueError("Area names must be unique")
+  return areas
+
+
+#
+# Returns the bounding box (minLat, maxLat, minLon, maxLon) of every area together
+#
+def unionBounds(areas):
+  return (min(area.minLat for area in areas), max(area.maxLat for area in areas),
+          min(area.minLon for area in areas), max(area.maxLon for area in areas))
+
+
+#
+# Finds the area's pixels in the given latitude and longitude arrays in the same way as frp.readGranule
+# Returns the (row start, row end, col start, col end) of the area, or None if it is not in the arrays
+#
+def areaCore(lat, lon, area):
+  boundCrds = np.where((area.minLat < lat) & (lat < area.maxLat) & (lon < area.maxLon) & (area.minLon < lon))
+
+  if np.size(boundCrds) == 0 or (np.min(boundCrds[0]) == np.max(boundCrds[0])) or (
+        np.min(boundCrds[1]) == np.max(boundCrds[1])):
+    return None
+
+  return np.min(boundCrds[0]), np.max(boundCrds[0]), np.min(boundCrds[1]), np.max(boundCrds[1])
+
+
+#
+# Tests which points lie inside a polygon of (lat, lon) vertices with the even-odd rule
+#
+def inPolygon(lats, lons, polygon):
+  lats = np.asarray(lats)
+  lons = np.asarray(lons)
+  inside = np.zeros(np.shape(lats), dtype=bool)
+  for (lat1, lon1), (lat2, lon2) in zip(polygon, polygon[1:] + polygon[:1]):
+    crosses = (lat1 > lats) != (lat2 > lats)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      crossLon = lon1 + (lats - lat1) * (lon2 - lon1) / (lat2 - lat1)
+    inside ^= crosses & (lons < crossLon)
+  return inside
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+import math
+import threading
+import numpy as np
+
+# Coefficients for radiance calculations
+COEFF1 = 119104200
+COEFF2 = 14387.752
+
+# Central wavelength of each emissive band and the correction applied to its brightness temperature
+# (L. Giglio, personal communication) as (lambda, gain, offset), band 32 is not corrected
+BANDS = {
+  21: (3.959, 1.00009, 0.05167),
+  22: (3.959, 1.00010, 0.05332),
+  31: (11.009, 1.00046, 0.09968),
+  32: (12.02, None, None)
+}
+
+# Number of values a 16 bit DN can take
+N_DN = 65536
+
+# Maximum number of lookup tables kept, a table is 512KB at double precision
+MAX_TABLES = 64
+
+# Lookup tables keyed by band, scale, offset and data type, shared by every thread under the lock
+_tables = {}
+_tablesLock = threading.Lock()
+
+
+#
+# Converts scaled radiances to the (corrected) brightness temperature of a band
+#
+def planckInversion(radiance, band):
+  wavelength, gain, offset = BANDS[band]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    temperature = COEFF2 / (wavelength * (np.log(COEFF1 / (((math.pow(wavelength, 5)) * radiance) + 1))))
+  if gain is not None:
+    temperature = gain * temperature - offset
+  return temperature
+
+
+#
+# Returns the lookup table of the brightness temperature of every DN of a band for the radiance scale and offset
+# Tables are built on first use and cached, as the scale and offset rarely change between HDFs
+#
+def lookupTable(band, scale, offset, dtype=np.float64):
+  key = (band, scale, offset, np.dtype(dtype).str)
+  with _tablesLock:
+    table = _tables.get(key)
+    if table is None:
+      if len(_tables) >= MAX_TABLES:
+        _tables.clear()
+      radiance = (np.arange(N_DN, dtype=np.uint16).astype(dtype) - offset) * scale
+      table = planckInversion(radiance, band)
+      _tables[key] = table
+  return table
+
+
+#
+# Converts the DNs of a band to brightness temperature with a single table lookup
+# DNs that are not 16 bit integers are converted directly
+#
+def brightnessTemperature(dn, band, scale, offset, dtype=np.float64):
+  dn = np.asarray(dn)
+  if dn.dtype != np.uint16:
+    return planckInversion((dn.astype(dtype) - offset) * scale, band)
+  return lookupTable(band, scale, offset, dtype)[dn]
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+import collections
+import datetime
+import os.path
+
+# Platform of each MODIS product prefix
+PLATFORMS = {'MOD': 'Terra', 'MYD': 'Aqua'}
+
+# A MODIS HDF parsed from its file name, e.g. MOD021KM.A2015189.2140.006.2015190083030.hdf
+Granule = collections.namedtuple('Granule', ['name', 'product', 'platform', 'acquired', 'collection', 'produced'])
+
+#
+# Parses a MODIS HDF file name into a Granule, returns None if the name is not a MODIS HDF
+#
+def parseName(name):
+  filSplt = os.path.basename(name).split('.')
+  if len(filSplt) < 5 or filSplt[-1] != 'hdf' or filSplt[0][:3] not in PLATFORMS:
+    return None
+
+  # Acquisition date and time, AYYYYDDD.HHMM - parsed by hand as strptime dominates the cost on large orders
+  datJul, tim = filSplt[1], filSplt[2]
+  if len(datJul) != 8 or not datJul[1:].isdigit() or len(tim) != 4 or not tim.isdigit():
+    return None
+  try:
+    acquired = datetime.datetime(int(datJul[1:5]), 1, 1, int(tim[:2]), int(tim[2:])) + datetime.timedelta(
+      days=int(datJul[5:]) - 1)
+  except ValueError:
+    return None
+
+  return Granule(name, filSplt[0], PLATFORMS[filSplt[0][:3]], acquired, filSplt[3], filSplt[4])
+
+
+#
+# Tests whether a Granule is a HDF02 (calibrated radiances)
+#
+def isMOD02(granule):
+  return granule.product[3:5] == '02'
+
+
+#
+# Tests whether a Granule is a HDF03 (geolocation)
+#
+def isMOD03(granule):
+  return granule.product[3:5] == '03'
+
+
+#
+# Pairs every HDF02 with the HDF03 of the same platform and acquisition time, preferring the same collection
+# Returns a list of (HDF02, HDF03) name pairs and a list of the HDF02 names that have no HDF03
+#
+def pairGranules(names):
+  granules = [g for g in (parseName(name) for name in names) if g is not None]
+
+  # Hash the HDF03s once so that each HDF02 is paired with a lookup
+  geolocation = {}
+  for granule in granules:
+    if isMOD03(granule):
+      geolocation.setdefault((granule.platform, granule.acquired, granule.collection), granule.name)
+      geolocation.setdefault((granule.platform, granule.acquired), granule.name)
+
+  pairs = []
+  solitary = []
+  for granule in granules:
+    if not isMOD02(granule):
+      continue
+    hdf03 = geolocation.get((granule.platform, granule.acquired, granule.collection),
+                            geolocation.get((granule.platform, granule.acquired)))
+    if hdf03 is None:
+      solitary.append(granule.name)
+    else:
+      pairs.append((granule.name, hdf03))
+
+  return pairs, solitary
+
+
+#
+# Parses a FTP directory listing into an ordered dictionary of file sizes keyed by file name
+#
+def parseListing(listing):
+  sizes = collections.OrderedDict()
+  for line in listing.splitlines():
+    parts = line.split()
+
+    # -rw-r--r-- 1 owner group size month day time/year name
+    if len(parts) >= 9 and parts[-5].isdigit():
+      sizes[parts[-1]] = int(parts[-5])
+
+  return sizes
@@ -1,66 +1,159 @@
+#!/usr/bin/python
+
 import argparse
-import subprocess
+import json
+import multiprocessing
 import os
+import zlib
+
+# Bytes read at once when calculating a checksum
+CHUNK_SIZE = 4194304
+
+# Files verified at once default, minimum and maximum
+DEF_WORKERS = multiprocessing.cpu_count()
+MIN_WORKERS = 1
+MAX_WORKERS = 64
+
+# Every byte value with its bits in reverse order
+# zlib calculates the bit-reflected CRC-32, reflecting the input and result gives the CRC-32 used by POSIX cksum
+REVERSED_BITS = bytes(bytearray(int('{:08b}'.format(i)[::-1], 2) for i in range(256)))
+
+
+#
+# Reverses the order of the bits of a 32 bit value
+#
+def reverseBits32(value):
+  return int('{:032b}'.format(value)[::-1], 2)
+
+
+#
+# Reads a file in chunks of CHUNK_SIZE bytes, yielding each chunk
+#
+def readChunks(path):
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      yield chunk
+
+
+#
+# Calculates the checksum of a file in the same way as the POSIX cksum utility
+# This is the CRC-32 (polynomial 0x04C11DB7, most significant bit first) of the file followed by its length
+# Returns the checksum and the size in bytes
+#
+def posixChecksum(path):
+
+  # zlib takes the complement of the CRC register, so this starts from an empty register as cksum does
+  crc = 0xffffffff
+  size = 0
+  for chunk in readChunks(path):
+    crc = zlib.crc32(chunk.translate(REVERSED_BITS), crc)
+    size += len(chunk)
+
+  # The length is appended least significant byte first, with as few bytes as it needs
+  length = bytearray()
+  n = size
+  while n > 0:
+    length.append(n & 0xff)
+    n >>= 8
+  crc = zlib.crc32(bytes(length).translate(REVERSED_BITS), crc)
+
+  register = ~crc & 0xffffffff
+  return ~reverseBits32(register) & 0xffffffff, size
+
+
+#
+# Reads the HDF entries of an order checksum file
+# Returns a list of (checksum, size, file) with the checksum and size as integers
+#
+def readChecksumFile(path):
+  with open(path) as f:
+    validated = f.readlines()
+
+  entries = []
+  for v in validated:
+    if ".hdf" in v:
+
+      # Get the checksum, size and filename, lines that cannot be read are reported and skipped
+      parts = v.split()
+      try:
+        entries.append((int(parts[0]), int(parts[1]), parts[2]))
+      except (IndexError, ValueError):
+        print("Skipping unreadable checksum line: " + v.strip())
+
+  return entries
+
+
+#
+# Verifies a file against its entry in the checksum file
+# Returns the file and whether it is verified, corrupt or missing
+#
+def verifyEntry(entry):
+  vChecksum, vSize, vFile = entry
 
-# Arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("-f", "--file", help="Order checksum file", type=str, required=True)
-args = parser.parse_args()
+  # The file is not present
+  if not os.path.isfile(vFile):
+    return vFile, "missing"
 
-# Read the checksum file
-with open(args.file) as f:
-  validated = f.readlines()
+  # The checksum and size match - file validated
+  if posixChecksum(vFile) == (vChecksum, vSize):
+    return vFile, "verified"
 
-# Filter the checksum file
-filtered = []
-for v in validated:
-  if ".hdf" in v:
-    filtered.append(v)
-validated = filtered
+  # The file must be invalid
+  return vFile, "corrupt"
 
-# Invalid and missing lists
-invalid = []
-missing = []
 
-# For each entry in the validated list
-for v in validated:
+#
+# Command line entry point, verifies the HDFs of an order checksum file in parallel
+#
+def main(argv=None):
 
-  # Get the checksum, size and filename
-  parts = v.split()
-  vChecksum = parts[0]
-  vSize = parts[1]
-  vFile = parts[2]
+  # Arguments
+  parser = argparse.ArgumentParser()
+  parser.add_argument("-f", "--file", help="Order checksum file", type=str, required=True)
+  parser.add_argument("-w", "--workers",
+                      help="the number of files verified at once default:" + str(DEF_WORKERS) + " min:" + str(
+                        MIN_WORKERS) + " max:" + str(MAX_WORKERS),
+                      default=DEF_WORKERS, type=int)
+  parser.add_argument("-s", "--summary", help="Write a JSON summary of the verified, corrupt and missing files",
+                      default=None, type=str)
+  args = parser.parse_args(argv)
 
-  # The file is not present
-  if not os.path.isfile(vFile):
+  entries = readChecksumFile(args.file)
 
-    # Add it to the missing list
-    missing.append(vFile)
-    continue
+  # Invalid and missing lists
+  results = {"verified": [], "corrupt": [], "missing": []}
 
-  # Get the cksum output of the downloaded file
-  output = subprocess.check_output("cksum " + vFile, shell=True)
-  parts = output.split()
-  checksum = parts[0]
-  size = parts[1]
+  # Files are read and checksummed in worker processes, reported in the order of the checksum file
+  pool = multiprocessing.Pool(max(MIN_WORKERS, min(args.workers, MAX_WORKERS)))
+  try:
+    for vFile, status in pool.imap(verifyEntry, entries):
+      results[status].append(vFile)
+      if status == "verified":
+        print(vFile + " verified")
+  finally:
+    pool.close()
+    pool.join()
 
-  # The checksum and size match - file validated
-  if checksum == vChecksum and size == vSize:
+  invalid = results["corrupt"]
+  missing = results["missing"]
 
-    print vFile + " verified"
+  # Output any results
+  print("\n" + str(len(invalid)) + " corrupt files found - please redownload and rerun")
 
-  # The the file must be invalid
-  else:
+  for f in invalid:
+    print(f)
 
-    invalid.append(vFile)
+  print("\n" + str(len(missing)) + " missing files detected - please download and rerun")
 
-# Output any results
-print "\n" + str(len(invalid)) + " corrupt files found - please redownload and rerun"
+  for f in missing:
+    print(f)
 
-for f in invalid:
-  print f
+  if args.summary:
+    summary = dict((status, {"count": len(files), "files": files}) for status, files in results.items())
+    with open(args.summary, 'w') as f:
+      json.dump(summary, f, indent=2, sort_keys=True)
 
-print "\n" + str(len(missing)) + " missing files detected - please download and rerun"
 
-for f in missing:
-  print f
\ No newline at end of file
+# We are running from the command line
+if __name__ == "__main__":
+  main()
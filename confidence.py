@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+import numpy as np
+
+#
+# Detection confidence of fire pixels (Giglio 2003, Section 2.3)
+#
+# The original implementation looped over the fires and carried the confidence of the previous fire forward
+# whenever a value was at or below the bottom of a ramp (or NaN), so such a fire inherited the confidence
+# of whichever fire preceded it in row-major order instead of scoring zero. The legacy mode reproduces this
+# carry-over exactly for comparison with earlier outputs, otherwise values below a ramp score zero.
+#
+
+#
+# Ramp function, 0 at or below rampMin rising linearly to 1 at rampMax
+# In legacy mode values at or below rampMin (and NaN) take the confidence of the previous value instead
+#
+def ramp(values, rampMin, rampMax, legacy=False):
+  values = np.asarray(values)
+  with np.errstate(invalid='ignore'):
+    above = values > rampMin
+    conf = np.where(values >= rampMax, 1.0, np.where(above, (values - rampMin) / (rampMax - rampMin), 0.0))
+
+  if legacy:
+    # Forward fill from the last value above the ramp, values before the first one carry the initial zero
+    scored = above | (values >= rampMax)
+    last = np.maximum.accumulate(np.where(scored, np.arange(1, len(conf) + 1), 0))
+    conf = np.concatenate(([0.0], conf))[last]
+
+  return conf
+
+
+#
+# Geometric mean of the confidence tests, calculated in log space so that a single zero test gives zero confidence
+#
+def geometricMean(logSum, nTests):
+  return np.exp(logSum / nTests)
+
+
+#
+# Detection confidence of every fire in one pass
+# The brightness temperatures select the day or night ramp, the adjacent cloud and water tests are day only
+# Returns the confidence between 0 and 1 of each fire
+#
+def detectionConfidence(b22, z4, zDeltaT, nCloudAdj, nWaterAdj, dayFlag, legacy=False):
+  dayFlag = np.asarray(dayFlag, dtype=bool)
+
+  with np.errstate(divide='ignore'):
+
+    # Fire detection confidence test 19
+    if legacy:
+      logC1 = np.where(dayFlag, np.log(ramp(b22, 310, 340, legacy)), np.log(ramp(b22, 305, 320, legacy)))
+    else:
+      logC1 = np.log(np.where(dayFlag, ramp(b22, 310, 340), ramp(b22, 305, 320)))
+
+    # Fire detection confidence test 20
+    logC2 = np.log(ramp(z4, 2.5, 6, legacy))
+
+    # Fire detection confidence test 21
+    logC3 = np.log(ramp(zDeltaT, 3, 6, legacy))
+
+    # Fire detection confidence test 22 - not used for night fires
+    logC4 = np.log(1 - ramp(nCloudAdj, 0, 6, legacy))
+
+    # Fire detection confidence test 23 - not used for night fires
+    logC5 = np.log(1 - ramp(nWaterAdj, 0, 6, legacy))
+
+  logSum = logC1 + logC2 + logC3
+  return np.where(dayFlag, geometricMean(logSum + logC4 + logC5, 5), geometricMean(logSum, 3))
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+import argparse
+import sqlite3
+import os.path
+import numpy as np
+from osgeo import gdal
+
+# Default name of the footprint index, kept next to the HDFs it describes
+DEF_INDEX_NAME = "footprints.sqlite"
+
+#
+# Opens the footprint index at the given path, creating it if it does not exist yet
+#
+def openIndex(path):
+  conn = sqlite3.connect(path, timeout=60)
+  conn.execute(
+    "CREATE TABLE IF NOT EXISTS footprints ("
+    "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, minLat REAL, maxLat REAL, minLon REAL, maxLon REAL)")
+  conn.commit()
+  return conn
+
+
+#
+# Calculates the latitude/longitude bounding box of a swath's geolocation arrays
+# Returns (minLat, maxLat, minLon, maxLon), or None if the swath has no valid geolocation
+#
+def geolocationBounds(lat, lon):
+  bounds = []
+  for crds, limit in ((lat, 90), (lon, 180)):
+
+    # Fill values (-999) fall outside the valid range and are ignored
+    crds = crds[(crds >= -limit) & (crds <= limit)]
+    if np.size(crds) == 0:
+      return None
+    bounds += [float(np.min(crds)), float(np.max(crds))]
+
+  return tuple(bounds)
+
+
+#
+# Reads the latitude/longitude bounding box of a HDF03 geolocation file
+# Returns (minLat, maxLat, minLon, maxLon), or None if the file has no valid geolocation
+#
+def readFootprint(filMOD03):
+  crds = []
+  for layer in ('Latitude', 'Longitude'):
+    file_template = 'HDF4_EOS:EOS_SWATH:%s:MODIS_Swath_Type_GEO:%s'
+    g = gdal.Open(file_template % (filMOD03, layer))
+    if g is None:
+      raise IOError
+    crds.append(g.ReadAsArray())
+
+  return geolocationBounds(*crds)
+
+
+#
+# Looks up the footprint of a HDF03 in the index
+# Returns whether the file is indexed and unchanged since, and its footprint
+#
+def lookupFootprint(conn, filMOD03):
+  path = os.path.abspath(filMOD03)
+  stat = os.stat(path)
+
+  row = conn.execute(
+    "SELECT mtime, size, minLat, maxLat, minLon, maxLon FROM footprints WHERE path = ?", (path,)).fetchone()
+  if row is None or row[0] != stat.st_mtime or row[1] != stat.st_size:
+    return False, None
+  if row[2] is None:
+    return True, None
+  return True, tuple(row[2:])
+
+
+#
+# Stores the footprint of a HDF03 in the index
+#
+def storeFootprint(conn, filMOD03, bounds):
+  path = os.path.abspath(filMOD03)
+  stat = os.stat(path)
+
+  values = bounds if bounds is not None else (None, None, None, None)
+  conn.execute(
+    "INSERT OR REPLACE INTO footprints VALUES (?, ?, ?, ?, ?, ?, ?)", (path, stat.st_mtime, stat.st_size) + values)
+  conn.commit()
+
+
+#
+# Returns the footprint of a HDF03 from the index
+# The footprint is read from the HDF03 and stored when the file is not indexed or has changed since
+#
+def footprint(conn, filMOD03):
+  indexed, bounds = lookupFootprint(conn, filMOD03)
+  if not indexed:
+    bounds = readFootprint(filMOD03)
+    storeFootprint(conn, filMOD03, bounds)
+  return bounds
+
+
+#
+# Tests whether a footprint can contain pixels inside the bounding co-ordinates
+# Swaths crossing the antimeridian span all longitudes and are always kept
+#
+def intersects(bounds, minLat, maxLat, minLon, maxLon):
+  if bounds is None:
+    return False
+  return bounds[0] < maxLat and minLat < bounds[1] and bounds[2] < maxLon and minLon < bounds[3]
+
+
+# We are running from the command line
+if __name__ == "__main__":
+
+  # Argument parser, run with -h for more info
+  parser = argparse.ArgumentParser()
+
+  # The HDF03 files to index
+  parser.add_argument("HDF03", help="the HDF03 geolocation files to index", type=str, nargs='+')
+  # Index location
+  parser.add_argument("-i", "--index", help="the footprint index file default:" + DEF_INDEX_NAME,
+                      default=DEF_INDEX_NAME, type=str)
+
+  args = parser.parse_args()
+
+  conn = openIndex(args.index)
+  for hdf03 in args.HDF03:
+    print(hdf03 + " " + str(footprint(conn, hdf03)))
+  conn.close()
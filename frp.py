@@ -3,15 +3,36 @@
 from scipy import ndimage
 import numpy as np
 from osgeo import gdal
-import datetime
-from scipy.stats import gmean
 import math
 import argparse
+import collections
+import copy
+import functools
+import json
 import os.path
+import sqlite3
+import sys
 import time
-
-# Start time
-start = time.time()
+import threading
+import multiprocessing
+import multiprocessing.pool
+import pipeline
+import footprints
+import calibration
+import catalog
+import granulecache
+import confidence
+import aoi
+
+try:
+  import hdf_ftp
+except ImportError:
+  hdf_ftp = None
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 
 # Maximum latitude default, minimum and maximum
 DEF_MAX_LAT = 65.525
@@ -63,464 +84,824 @@ DEF_DEC_PLC = 2
 MIN_DEC_PLC = 0
 MAX_DEC_PLC = 5
 
-# Argument parser, run with -h for more info
-parser = argparse.ArgumentParser()
-
-# Command line arguments
-parser.add_argument(
-  "-v", "--verbose", help="turn on verbose output", action="store_true")
-
-parser.add_argument(
-  "-maxLat", "--maximumLatitude",
-  help="the maximum latitude default:" + str(DEF_MAX_LAT) + " min:" + str(MIN_MAX_LAT) + " max:" + str(MAX_MAX_LAT),
-  default=DEF_MAX_LAT, type=float)
-
-parser.add_argument(
-  "-minLat", "--minimumLatitude",
-  help="the minimum latitude default:" + str(DEF_MIN_LAT) + " min:" + str(MIN_MIN_LAT) + " max:" + str(MAX_MIN_LAT),
-  default=DEF_MIN_LAT, type=float)
-
-parser.add_argument(
-  "-maxLon", "--maximumLongitude",
-  help="the maximum longitude default:" + str(DEF_MAX_LON) + " min:" + str(MIN_MAX_LON) + " max:" + str(MAX_MAX_LON),
-  default=DEF_MAX_LON, type=float)
-
-parser.add_argument(
-  "-minLon", "--minimumLongitude",
-  help="the minimum longitude default:" + str(DEF_MIN_LON) + " min:" + str(MIN_MIN_LON) + " max:" + str(MAX_MIN_LON),
-  default=DEF_MIN_LON, type=float)
-
-parser.add_argument(
-  "-rf", "--reductionFactor",
-  help="the reduction factor default:" + str(DEF_RED_FAC) + " min:" + str(MIN_RED_FAC) + " max:" + str(MAX_RED_FAC),
-  default=DEF_RED_FAC, type=float)
-
-parser.add_argument(
-  "-minK", "--minimumKernel",
-  help="the minimum kernel size default:" + str(DEF_MIN_KER) + " min:" + str(MIN_MIN_KER) + " max:" + str(MAX_MIN_KER),
-  default=DEF_MIN_KER, type=int)
-
-parser.add_argument(
-  "-maxK", "--maximumKernel",
-  help="the maximum kernel size default:" + str(DEF_MAX_KER) + " min:" + str(MIN_MAX_KER) + " max:" + str(MAX_MAX_KER),
-  default=DEF_MAX_KER, type=int)
-
-parser.add_argument(
-  "-winObv", "--windowObservations",
-  help="the amount of window observations default:" + str(DEF_WIN_OBV) + " min:" + str(MIN_WIN_OBV) + " max:" + str(
-    MAX_WIN_OBV),
-  default=DEF_WIN_OBV, type=int)
-
-parser.add_argument(
-  "-vldFrc", "--validFraction",
-  help="valid fraction of valid observations default:" + str(DEF_VLD_FRC) + " min:" + str(MIN_VLD_FRC) + " max:" + str(
-    MAX_VLD_FRC),
-  default=DEF_VLD_FRC, type=float)
-
-parser.add_argument(
-  "-dec", "--decimal",
-  help="Set the decimal places in the output default:" + str(DEF_DEC_PLC) + " min:" + str(MIN_DEC_PLC) + " max:" + str(
-    MAX_DEC_PLC),
-  default=DEF_DEC_PLC, type=float)
-
-parser.add_argument(
-  "-dir", "--directory",
-  help="Set the directory to load HDF files from default:/",
-  default=".", type=str)
-
-# Parse the command line arguments
-args = parser.parse_args()
-
-# Argument validation
-if args.minimumLatitude < MIN_MIN_LAT:
-  args.minimumLatitude = MIN_MIN_LAT
-  if args.verbose:
-    print("Raising minimum latitude to lower bound", MIN_MIN_LAT)
-elif args.minimumLatitude > MAX_MIN_LAT:
-  args.minimumLatitude = MAX_MIN_LAT
-  if args.verbose:
-    print("Lowering minimum latitude to upper bound", MAX_MIN_LAT)
+# Worker process count default, minimum and maximum
+DEF_WORKERS = 1
+MIN_WORKERS = 1
+MAX_WORKERS = 256
 
-if args.maximumLatitude < MIN_MAX_LAT:
-  args.maximumLatitude = MIN_MAX_LAT
-  if args.verbose:
-    print("Raising maximum latitude to lower bound", MIN_MAX_LAT)
-elif args.maximumLatitude > MAX_MAX_LAT:
-  args.maximumLatitude = MAX_MAX_LAT
-  if args.verbose:
-    print("Lowering maximum latitude to upper bound", MAX_MAX_LAT)
+# Worker thread count default, minimum and maximum
+DEF_THREADS = 1
+MIN_THREADS = 1
+MAX_THREADS = 256
 
-if args.minimumLongitude < MIN_MIN_LON:
-  args.minimumLongitude = MIN_MIN_LON
-  if args.verbose:
-    print("Raising minimum longitude to lower bound", MIN_MIN_LON)
-elif args.minimumLongitude > MAX_MIN_LON:
-  args.minimumLongitude = MAX_MIN_LON
-  if args.verbose:
-    print("Lowering minimum longitude to upper bound", MAX_MIN_LON)
+# Row blocks per area default, minimum and maximum
+DEF_BLOCKS = 1
+MIN_BLOCKS = 1
+MAX_BLOCKS = 64
 
-if args.maximumLongitude < MIN_MAX_LON:
-  args.maximumLongitude = MIN_MAX_LON
-  if args.verbose:
-    print("Raising maximum longitude to lower bound", MIN_MAX_LON)
-elif args.maximumLongitude > MAX_MAX_LON:
-  args.maximumLongitude = MAX_MAX_LON
-  if args.verbose:
-    print("Lowering maximum longitude to upper bound", MAX_MAX_LON)
+# Prefetch depth default, minimum and maximum
+DEF_PREFETCH = 0
+MIN_PREFETCH = 0
+MAX_PREFETCH = 64
 
-if args.reductionFactor < MIN_RED_FAC:
-  args.reductionFactor = MIN_RED_FAC
-  if args.verbose:
-    print("Raising reduction factor to lower bound", MIN_RED_FAC)
-elif args.reductionFactor > MAX_RED_FAC:
-  args.reductionFactor = MAX_RED_FAC
-  if args.verbose:
-    print("Lowering reduction factor to upper bound", MAX_RED_FAC)
+# Reader process count default, minimum and maximum
+DEF_READERS = 1
+MIN_READERS = 1
+MAX_READERS = 64
 
-if args.minimumKernel < MIN_MIN_KER:
-  args.minimumKernel = MIN_MIN_KER
-  if args.verbose:
-    print("Raising minimum kernel size to lower bound", MIN_MIN_KER)
-if args.minimumKernel > MAX_MIN_KER:
-  args.minimumKernel = MAX_MIN_KER
-  if args.verbose:
-    print("Lowering minimum kernel size to upper bound", MAX_MIN_KER)
+# Concurrent download connection count default, minimum and maximum, the same as hdf_ftp's
+DEF_CONNECTIONS = 1
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 32
 
-if args.maximumKernel < MIN_MAX_KER:
-  args.maximumKernel = MIN_MAX_KER
-  if args.verbose:
-    print("Raising maximum kernel size to lower bound", MIN_MAX_KER)
-if args.maximumKernel > MAX_MAX_KER:
-  args.maximumKernel = MAX_MAX_KER
-  if args.verbose:
-    print("Lowering maximum kernel size to upper bound", MAX_MAX_KER)
+# Granule cache size in MB default, minimum and maximum
+DEF_CACHE_SIZE = 10240
+MIN_CACHE_SIZE = 0
+MAX_CACHE_SIZE = 1048576
 
-if args.windowObservations < MIN_WIN_OBV:
-  args.windowObservations = MIN_WIN_OBV
-  if args.verbose:
-    print("Raising window observation count to lower bound", MIN_WIN_OBV)
-elif args.windowObservations > MAX_WIN_OBV:
-  args.windowObservations = MAX_WIN_OBV
-  if args.verbose:
-    print("Lowering window observation count to upper bound", MAX_WIN_OBV)
+# Number of neighbour values gathered at once when calculating background statistics
+BG_STATS_CHUNK = 4194304
 
-if args.validFraction < MIN_VLD_FRC:
-  args.validFraction = MIN_VLD_FRC
-  if args.verbose:
-    print("Raising valid fraction of observations to lower bound", MIN_VLD_FRC)
-elif args.validFraction > MAX_VLD_FRC:
-  args.validFraction = MAX_VLD_FRC
-  if args.verbose:
-    print("Lowering valid fraction of observations to upper bound", MAX_VLD_FRC)
+# Halo of the cached granules, the largest any kernel size can need, so that a cached granule serves every kernel size
+CACHE_HALO = MAX_MAX_KER // 2
 
-if args.decimal < MIN_DEC_PLC:
-  args.decimal = MIN_DEC_PLC
-  if args.verbose:
-    print("Raising decimal output to lower bound", MIN_DEC_PLC)
-elif args.decimal > MAX_DEC_PLC:
-  args.decimal = MAX_DEC_PLC
-  if args.verbose:
-    print("Lowering decimal output to upper bound", MAX_DEC_PLC)
+# Columns of the detections, in the order they are written to the CSV
+DETECTION_COLUMNS = ['FRPline', 'FRPsample', 'FRPlats', 'FRPlons', 'FRPT21', 'FRPT31', 'FRPMeanT21', 'FRPMeanT31',
+                     'FRPMeanDT', 'FRPMADT21', 'FRPMADT31', 'FRP_MAD_DT', 'FRPpower', 'FRP_AdjCloud', 'FRP_AdjWater',
+                     'FRP_NumValid', 'FRP_confidence']
+
+# Arguments that can differ between the configurations of a sweep, the others are shared as the HDFs are read once
+SWEEP_ARGUMENTS = ['reductionFactor', 'minimumKernel', 'maximumKernel', 'windowObservations', 'validFraction',
+                   'decimal', 'legacyConfidence']
+
+# Kernel summing the 8 pixels adjacent to the centre
+ADJ_KERNEL = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.int32)
 
-# Verbose output configured settings
-if args.verbose:
-  print("Minimum latitude set to", args.minimumLatitude)
-  print("Maximum latitude set to", args.maximumLatitude)
-  print("Minimum longitude set to", args.minimumLongitude)
-  print("Maximum longitude set to", args.maximumLongitude)
-  print("Reduction factor set to", args.reductionFactor)
-  print("Minimum kernel size set to", args.minimumKernel)
-  print("Maximum kernel size set to", args.maximumKernel)
-  print("Window observation count set to", args.windowObservations)
-  print("Valid fraction of observations set to", args.validFraction)
-  print("Decimal output set to", args.decimal)
-  print("HDF loading directory set to", args.directory)
+# Footprint indexes this process could not open or write, e.g. in a read-only HDF directory, they are not used again
+_unusableIndexes = set()
 
 #
-# Finds the number of adjacent values in the input array whose value is 1
+# Builds the command line argument parser, run with -h for more info
 #
-def adj(kernel):
-  nghbors = kernel[range(0, 4) + range(5, 9)]
-  cloudNghbors = kernel[np.where(nghbors == 1)]
-  nCloudNghbr = len(cloudNghbors)
-  return nCloudNghbr
+def buildParser():
+  parser = argparse.ArgumentParser()
+
+  # Command line arguments
+  parser.add_argument(
+    "-v", "--verbose", help="turn on verbose output", action="store_true")
+
+  parser.add_argument(
+    "-maxLat", "--maximumLatitude",
+    help="the maximum latitude default:" + str(DEF_MAX_LAT) + " min:" + str(MIN_MAX_LAT) + " max:" + str(MAX_MAX_LAT),
+    default=DEF_MAX_LAT, type=float)
+
+  parser.add_argument(
+    "-minLat", "--minimumLatitude",
+    help="the minimum latitude default:" + str(DEF_MIN_LAT) + " min:" + str(MIN_MIN_LAT) + " max:" + str(MAX_MIN_LAT),
+    default=DEF_MIN_LAT, type=float)
+
+  parser.add_argument(
+    "-maxLon", "--maximumLongitude",
+    help="the maximum longitude default:" + str(DEF_MAX_LON) + " min:" + str(MIN_MAX_LON) + " max:" + str(MAX_MAX_LON),
+    default=DEF_MAX_LON, type=float)
+
+  parser.add_argument(
+    "-minLon", "--minimumLongitude",
+    help="the minimum longitude default:" + str(DEF_MIN_LON) + " min:" + str(MIN_MIN_LON) + " max:" + str(MAX_MIN_LON),
+    default=DEF_MIN_LON, type=float)
+
+  parser.add_argument(
+    "-rf", "--reductionFactor",
+    help="the reduction factor default:" + str(DEF_RED_FAC) + " min:" + str(MIN_RED_FAC) + " max:" + str(MAX_RED_FAC),
+    default=DEF_RED_FAC, type=float)
+
+  parser.add_argument(
+    "-minK", "--minimumKernel",
+    help="the minimum kernel size default:" + str(DEF_MIN_KER) + " min:" + str(MIN_MIN_KER) + " max:" + str(MAX_MIN_KER),
+    default=DEF_MIN_KER, type=int)
+
+  parser.add_argument(
+    "-maxK", "--maximumKernel",
+    help="the maximum kernel size default:" + str(DEF_MAX_KER) + " min:" + str(MIN_MAX_KER) + " max:" + str(MAX_MAX_KER),
+    default=DEF_MAX_KER, type=int)
+
+  parser.add_argument(
+    "-winObv", "--windowObservations",
+    help="the amount of window observations default:" + str(DEF_WIN_OBV) + " min:" + str(MIN_WIN_OBV) + " max:" + str(
+      MAX_WIN_OBV),
+    default=DEF_WIN_OBV, type=int)
+
+  parser.add_argument(
+    "-vldFrc", "--validFraction",
+    help="valid fraction of valid observations default:" + str(DEF_VLD_FRC) + " min:" + str(MIN_VLD_FRC) + " max:" + str(
+      MAX_VLD_FRC),
+    default=DEF_VLD_FRC, type=float)
+
+  parser.add_argument(
+    "-dec", "--decimal",
+    help="Set the decimal places in the output default:" + str(DEF_DEC_PLC) + " min:" + str(MIN_DEC_PLC) + " max:" + str(
+      MAX_DEC_PLC),
+    default=DEF_DEC_PLC, type=int)
+
+  parser.add_argument(
+    "-dir", "--directory",
+    help="Set the directory to load HDF files from default:/",
+    default=".", type=str)
+
+  parser.add_argument(
+    "-fpi", "--footprintIndex",
+    help="Set the footprint index used to skip HDFs outside the area, empty to disable default:" + os.path.join(
+      "<directory>", footprints.DEF_INDEX_NAME),
+    default=None, type=str)
+
+  parser.add_argument(
+    "-w", "--workers",
+    help="the number of worker processes used to process HDFs default:" + str(DEF_WORKERS) + " min:" + str(
+      MIN_WORKERS) + " max:" + str(MAX_WORKERS),
+    default=DEF_WORKERS, type=int)
+
+  parser.add_argument(
+    "-t", "--threads",
+    help="the number of threads used to process HDFs in a single worker process default:" + str(
+      DEF_THREADS) + " min:" + str(MIN_THREADS) + " max:" + str(MAX_THREADS),
+    default=DEF_THREADS, type=int)
+
+  parser.add_argument(
+    "-b", "--blocks",
+    help="the number of row blocks each area is split into and processed on in parallel threads default:" + str(
+      DEF_BLOCKS) + " min:" + str(MIN_BLOCKS) + " max:" + str(MAX_BLOCKS),
+    default=DEF_BLOCKS, type=int)
+
+  parser.add_argument(
+    "-p", "--prefetch",
+    help="the number of HDF pairs read ahead into shared memory by reader processes while worker processes detect "
+         "fires, 0 reads and detects in the same process default:" + str(DEF_PREFETCH) + " min:" + str(
+      MIN_PREFETCH) + " max:" + str(MAX_PREFETCH),
+    default=DEF_PREFETCH, type=int)
+
+  parser.add_argument(
+    "-r", "--readers",
+    help="the number of reader processes when prefetching default:" + str(DEF_READERS) + " min:" + str(
+      MIN_READERS) + " max:" + str(MAX_READERS),
+    default=DEF_READERS, type=int)
+
+  parser.add_argument(
+    "-cd", "--cacheDir",
+    help="Set the directory of the calibrated granule cache, repeat runs over the same HDFs and area read the cached "
+         "arrays instead of the HDFs default:no cache",
+    default=None, type=str)
+
+  parser.add_argument(
+    "-cs", "--cacheSize",
+    help="the maximum size of the granule cache in MB default:" + str(DEF_CACHE_SIZE) + " min:" + str(
+      MIN_CACHE_SIZE) + " max:" + str(MAX_CACHE_SIZE),
+    default=DEF_CACHE_SIZE, type=int)
+
+  parser.add_argument(
+    "-aoi", "--areaFile",
+    help="Set a JSON file of named areas (bounding boxes or polygons) to process in a single pass over the HDFs "
+         "instead of the bounding co-ordinates, the fires of each are written to a directory named after it "
+         "default:no area file",
+    default=None, type=str)
+
+  parser.add_argument(
+    "-sw", "--sweep",
+    help="Set a JSON file of configurations to run in a single pass over the HDFs, a list of objects with a name and "
+         "any of " + ", ".join(SWEEP_ARGUMENTS) + ", the fires of each are written to a directory named after it "
+         "default:no sweep",
+    default=None, type=str)
+
+  parser.add_argument(
+    "-o", "--orders",
+    help="Download the HDFs of these orders to the directory and detect the fires of each pair as soon as it has "
+         "arrived and been verified against the order's checksum file, only file sizes are checked if the order has "
+         "none. Only pairs whose footprint intersects the area are downloaded default:no download",
+    default=None, type=str, nargs='+')
+
+  parser.add_argument(
+    "--host",
+    help="Set the FTP directory holding the orders default:" + (hdf_ftp.DEF_HOST if hdf_ftp else "LAADS orders"),
+    default=None, type=str)
+
+  parser.add_argument(
+    "-c", "--connections",
+    help="the number of HDFs of the orders downloaded at once default:" + str(DEF_CONNECTIONS) + " min:" + str(
+      MIN_CONNECTIONS) + " max:" + str(MAX_CONNECTIONS),
+    default=DEF_CONNECTIONS, type=int)
+
+  parser.add_argument(
+    "-lm", "--lowMemory", help="calculate brightness temperatures in single precision to reduce memory use",
+    action="store_true")
+
+  parser.add_argument(
+    "-lc", "--legacyConfidence",
+    help="carry the previous fire's confidence over to fires below a confidence ramp, as earlier versions did",
+    action="store_true")
+
+  return parser
+
 
 #
-# Creates a mask for context tests (must ignore pixels immediately to the right and left of center)
+# Clamps the arguments to their bounds, reporting any change in verbose mode
 #
-def makeFootprint(kSize):
-  fpZeroLine = (kSize - 1) / 2
-  fpZeroColStart = fpZeroLine - 1
-  fpZeroColEnd = fpZeroColStart + 3
-  fp = np.ones((kSize, kSize), dtype='int_')
-  fp[fpZeroLine, fpZeroColStart:fpZeroColEnd] = -5
-  return fp
+def validateArgs(args):
+
+  # The bounding co-ordinates of an area file cover all of its areas, the granules are read once for all of them
+  args.areas = aoi.loadAreas(args.areaFile) if args.areaFile else []
+  if args.areas:
+    args.minimumLatitude, args.maximumLatitude, args.minimumLongitude, args.maximumLongitude = aoi.unionBounds(
+      args.areas)
+
+  # Argument validation
+  if args.minimumLatitude < MIN_MIN_LAT:
+    args.minimumLatitude = MIN_MIN_LAT
+    if args.verbose:
+      print("Raising minimum latitude to lower bound", MIN_MIN_LAT)
+  elif args.minimumLatitude > MAX_MIN_LAT:
+    args.minimumLatitude = MAX_MIN_LAT
+    if args.verbose:
+      print("Lowering minimum latitude to upper bound", MAX_MIN_LAT)
+
+  if args.maximumLatitude < MIN_MAX_LAT:
+    args.maximumLatitude = MIN_MAX_LAT
+    if args.verbose:
+      print("Raising maximum latitude to lower bound", MIN_MAX_LAT)
+  elif args.maximumLatitude > MAX_MAX_LAT:
+    args.maximumLatitude = MAX_MAX_LAT
+    if args.verbose:
+      print("Lowering maximum latitude to upper bound", MAX_MAX_LAT)
+
+  if args.minimumLongitude < MIN_MIN_LON:
+    args.minimumLongitude = MIN_MIN_LON
+    if args.verbose:
+      print("Raising minimum longitude to lower bound", MIN_MIN_LON)
+  elif args.minimumLongitude > MAX_MIN_LON:
+    args.minimumLongitude = MAX_MIN_LON
+    if args.verbose:
+      print("Lowering minimum longitude to upper bound", MAX_MIN_LON)
+
+  if args.maximumLongitude < MIN_MAX_LON:
+    args.maximumLongitude = MIN_MAX_LON
+    if args.verbose:
+      print("Raising maximum longitude to lower bound", MIN_MAX_LON)
+  elif args.maximumLongitude > MAX_MAX_LON:
+    args.maximumLongitude = MAX_MAX_LON
+    if args.verbose:
+      print("Lowering maximum longitude to upper bound", MAX_MAX_LON)
+
+  if args.reductionFactor < MIN_RED_FAC:
+    args.reductionFactor = MIN_RED_FAC
+    if args.verbose:
+      print("Raising reduction factor to lower bound", MIN_RED_FAC)
+  elif args.reductionFactor > MAX_RED_FAC:
+    args.reductionFactor = MAX_RED_FAC
+    if args.verbose:
+      print("Lowering reduction factor to upper bound", MAX_RED_FAC)
+
+  if args.minimumKernel < MIN_MIN_KER:
+    args.minimumKernel = MIN_MIN_KER
+    if args.verbose:
+      print("Raising minimum kernel size to lower bound", MIN_MIN_KER)
+  if args.minimumKernel > MAX_MIN_KER:
+    args.minimumKernel = MAX_MIN_KER
+    if args.verbose:
+      print("Lowering minimum kernel size to upper bound", MAX_MIN_KER)
+
+  if args.maximumKernel < MIN_MAX_KER:
+    args.maximumKernel = MIN_MAX_KER
+    if args.verbose:
+      print("Raising maximum kernel size to lower bound", MIN_MAX_KER)
+  if args.maximumKernel > MAX_MAX_KER:
+    args.maximumKernel = MAX_MAX_KER
+    if args.verbose:
+      print("Lowering maximum kernel size to upper bound", MAX_MAX_KER)
+
+  if args.windowObservations < MIN_WIN_OBV:
+    args.windowObservations = MIN_WIN_OBV
+    if args.verbose:
+      print("Raising window observation count to lower bound", MIN_WIN_OBV)
+  elif args.windowObservations > MAX_WIN_OBV:
+    args.windowObservations = MAX_WIN_OBV
+    if args.verbose:
+      print("Lowering window observation count to upper bound", MAX_WIN_OBV)
+
+  if args.validFraction < MIN_VLD_FRC:
+    args.validFraction = MIN_VLD_FRC
+    if args.verbose:
+      print("Raising valid fraction of observations to lower bound", MIN_VLD_FRC)
+  elif args.validFraction > MAX_VLD_FRC:
+    args.validFraction = MAX_VLD_FRC
+    if args.verbose:
+      print("Lowering valid fraction of observations to upper bound", MAX_VLD_FRC)
+
+  if args.decimal < MIN_DEC_PLC:
+    args.decimal = MIN_DEC_PLC
+    if args.verbose:
+      print("Raising decimal output to lower bound", MIN_DEC_PLC)
+  elif args.decimal > MAX_DEC_PLC:
+    args.decimal = MAX_DEC_PLC
+    if args.verbose:
+      print("Lowering decimal output to upper bound", MAX_DEC_PLC)
+
+  if args.workers < MIN_WORKERS:
+    args.workers = MIN_WORKERS
+    if args.verbose:
+      print("Raising worker count to lower bound", MIN_WORKERS)
+  elif args.workers > MAX_WORKERS:
+    args.workers = MAX_WORKERS
+    if args.verbose:
+      print("Lowering worker count to upper bound", MAX_WORKERS)
+
+  if args.threads < MIN_THREADS:
+    args.threads = MIN_THREADS
+    if args.verbose:
+      print("Raising thread count to lower bound", MIN_THREADS)
+  elif args.threads > MAX_THREADS:
+    args.threads = MAX_THREADS
+    if args.verbose:
+      print("Lowering thread count to upper bound", MAX_THREADS)
+
+  if args.blocks < MIN_BLOCKS:
+    args.blocks = MIN_BLOCKS
+    if args.verbose:
+      print("Raising row block count to lower bound", MIN_BLOCKS)
+  elif args.blocks > MAX_BLOCKS:
+    args.blocks = MAX_BLOCKS
+    if args.verbose:
+      print("Lowering row block count to upper bound", MAX_BLOCKS)
+
+  if args.prefetch < MIN_PREFETCH:
+    args.prefetch = MIN_PREFETCH
+    if args.verbose:
+      print("Raising prefetch depth to lower bound", MIN_PREFETCH)
+  elif args.prefetch > MAX_PREFETCH:
+    args.prefetch = MAX_PREFETCH
+    if args.verbose:
+      print("Lowering prefetch depth to upper bound", MAX_PREFETCH)
+
+  if args.readers < MIN_READERS:
+    args.readers = MIN_READERS
+    if args.verbose:
+      print("Raising reader count to lower bound", MIN_READERS)
+  elif args.readers > MAX_READERS:
+    args.readers = MAX_READERS
+    if args.verbose:
+      print("Lowering reader count to upper bound", MAX_READERS)
+
+  if args.connections < MIN_CONNECTIONS:
+    args.connections = MIN_CONNECTIONS
+    if args.verbose:
+      print("Raising connection count to lower bound", MIN_CONNECTIONS)
+  elif args.connections > MAX_CONNECTIONS:
+    args.connections = MAX_CONNECTIONS
+    if args.verbose:
+      print("Lowering connection count to upper bound", MAX_CONNECTIONS)
+
+  if args.cacheSize < MIN_CACHE_SIZE:
+    args.cacheSize = MIN_CACHE_SIZE
+    if args.verbose:
+      print("Raising cache size to lower bound", MIN_CACHE_SIZE)
+  elif args.cacheSize > MAX_CACHE_SIZE:
+    args.cacheSize = MAX_CACHE_SIZE
+    if args.verbose:
+      print("Lowering cache size to upper bound", MAX_CACHE_SIZE)
+
+  # Threads share a single process, so they are not combined with worker processes
+  if args.workers > 1 and args.threads > 1:
+    args.threads = MIN_THREADS
+    if args.verbose:
+      print("Using a single thread per worker process as more than one worker process is used")
+
+  if args.footprintIndex is None:
+    args.footprintIndex = os.path.join(args.directory, footprints.DEF_INDEX_NAME)
+
+  args.sweepConfigs = loadSweep(args) if args.sweep else []
+
+  return args
 
 
 #
-# Returns the number of valid (non-background fire, non-cloud, non-water) neighbors for context tests
+# Loads the configurations of the sweep file given by args, e.g. [{"name": "rf09", "reductionFactor": 0.9}]
+# Every configuration starts from args, is validated in the same way and is named sweep1, sweep2, ... without a name
+# Returns a list of (name, config)
 #
-def nValidFilt(kernel, kSize, minKsize):
-  nghbrCnt = -4
-  kernel = kernel.reshape((kSize, kSize))
+def loadSweep(args):
+  with open(args.sweep) as f:
+    entries = json.load(f)
+
+  actions = dict((action.dest, action) for action in buildParser()._actions)
+  sweepConfigs = []
+  for i, entry in enumerate(entries):
+    entry = dict(entry)
+    name = str(entry.pop('name', 'sweep' + str(i + 1)))
+    config = copy.copy(args)
+    config.sweep = None
+    config.areaFile = None
+    for argName, value in entry.items():
+      if argName not in SWEEP_ARGUMENTS:
+        raise ValueError("Sweep configuration " + name + " sets " + argName + ", only " + ", ".join(
+          SWEEP_ARGUMENTS) + " can differ")
+      setattr(config, argName, sweepValue(actions[argName], name, argName, value))
+    sweepConfigs.append((name, validateArgs(config)))
+
+  names = [name for name, config in sweepConfigs]
+  if len(set(names)) != len(names):
+    raise ValueError("Sweep configuration names must be unique")
+  return sweepConfigs
 
-  centerVal = kernel[((kSize - 1) / 2), ((kSize - 1) / 2)]
 
-  if (kSize == minKsize) | (centerVal == -4):
-    fpMask = makeFootprint(kSize)
-    kernel[np.where(fpMask < 0)] = -5
-    nghbrs = kernel[np.where(kernel > 0)]
-    nghbrCnt = len(nghbrs)
+#
+# Converts a value of a sweep configuration with the type of its command line argument, as if it had been given there
+# Flags only take true or false, and numbers are not truncated, raises a ValueError for any other value
+#
+def sweepValue(action, name, argName, value):
+  try:
+    if action.type is None:
+      if not isinstance(value, bool):
+        raise ValueError
+      return value
+    if isinstance(value, bool):
+      raise ValueError
+    typed = action.type(value)
+    if isinstance(value, float) and typed != value:
+      raise ValueError
+    return typed
+  except (TypeError, ValueError):
+    expected = "true or false" if action.type is None else "an integer" if action.type is int else "a number"
+    raise ValueError("Sweep configuration " + name + " sets " + argName + " to " + json.dumps(value) + ", expected " +
+                     expected)
 
-  return nghbrCnt
+
+#
+# Returns the configs the fires are detected with, those of the sweep if there is one
+#
+def detectionConfigs(config):
+  if config.sweepConfigs:
+    return [sweepConfig for name, sweepConfig in config.sweepConfigs]
+  return [config]
 
 
 #
-# Returns the number of neighbors rejected as background fires
+# Counts the 8 adjacent pixels set in a mask, edges are reflected in the same way as ndimage.generic_filter
+# With coords only the pixels at those (rows, cols) are counted, otherwise the whole mask is convolved
 #
-def nRejectBGfireFilt(kernel, kSize, minKsize):
-  nRejectBGfire = -4
-  kernel = kernel.reshape((kSize, kSize))
-  centerVal = kernel[((kSize - 1) / 2), ((kSize - 1) / 2)]
+def adjCount(mask, coords=None):
+  if coords is None:
+    return ndimage.convolve(np.asarray(mask, dtype=np.int32), ADJ_KERNEL, mode='reflect')
+
+  # Reflecting a single pixel beyond the edge is the same as clamping to the edge
+  nRows, nCols = np.shape(mask)
+  rows, cols = coords
+  count = np.zeros(len(rows), dtype=np.int32)
+  for dRow, dCol in zip(*np.nonzero(ADJ_KERNEL)):
+    count += mask[np.clip(rows + dRow - 1, 0, nRows - 1), np.clip(cols + dCol - 1, 0, nCols - 1)]
+  return count
+
+#
+# Counts the pixels set in a mask within the kSize x kSize window around every pixel using a summed-area table
+# Windows and edges are the same as ndimage.generic_filter's, an even window has its center at kSize // 2
+# Context tests must ignore the pixel the old filter callbacks took as center and those to its right and left,
+# excludeCenter drops those
+#
+def windowCount(mask, kSize, excludeCenter=False):
+  before = kSize // 2
+  after = kSize - 1 - before
+  nRows, nCols = np.shape(mask)
+  padMask = np.pad(mask.astype(np.int32), ((before, after), (before, after)), mode='symmetric')
+
+  sumTable = np.zeros((nRows + kSize, nCols + kSize), dtype=np.int32)
+  sumTable[1:, 1:] = np.cumsum(np.cumsum(padMask, axis=0), axis=1)
 
-  if (kSize == minKsize) | (centerVal == -4):
-    nRejectBGfire = len(kernel[np.where(kernel == -3)])
+  counts = sumTable[kSize:, kSize:] - sumTable[:-kSize, kSize:] - sumTable[kSize:, :-kSize] + sumTable[:-kSize, :-kSize]
 
-  return nRejectBGfire
+  if excludeCenter:
+
+    # The callbacks excluded kernel[(kSize - 1) // 2, (kSize - 1) // 2 - 1:(kSize - 1) // 2 + 2], slicing the same
+    # way keeps their behaviour for the smallest kernels
+    halfSize = (kSize - 1) // 2
+    centerRow = padMask[halfSize:halfSize + nRows]
+    for col in np.arange(kSize)[halfSize - 1:halfSize + 2]:
+      counts -= centerRow[:, col:col + nCols]
+
+  return counts
 
 
 #
-# Returns number of neighbors rejected as water
+# Returns the value the old filter callbacks took as the center of each pixel's window, kernel[(kSize - 1) // 2]
+# This is the pixel itself for odd kernel sizes and the pixel up and to the left of it for even ones
 #
-def nRejectWaterFilt(kernel, kSize, minKsize):
-  nRejectWater = -4
-  kernel = kernel.reshape((kSize, kSize))
+def windowCenter(band, kSize):
+  before = kSize // 2
+  halfSize = (kSize - 1) // 2
+  if halfSize == before:
+    return band
+  nRows, nCols = np.shape(band)
+  padBand = np.pad(band, ((before, kSize - 1 - before), (before, kSize - 1 - before)), mode='symmetric')
+  return padBand[halfSize:halfSize + nRows, halfSize:halfSize + nCols]
 
-  centerVal = kernel[((kSize - 1) / 2), ((kSize - 1) / 2)]
 
-  if (kSize == minKsize) | (centerVal == -4):
-    nRejectWater = len(kernel[np.where(kernel == -1)])
+#
+# Returns the number of valid (non-background fire, non-cloud, non-water) neighbors for context tests
+#
+def nValidFilt(band, kSize, minKsize):
+  with np.errstate(invalid='ignore'):
+    nghbrCnt = windowCount(band > 0, kSize, excludeCenter=True)
 
-  return nRejectWater
+  return np.where((kSize == minKsize) | (windowCenter(band, kSize) == -4), nghbrCnt, -4)
 
 
 #
-# Returns the number of 'unmasked water' neighbors
+# Returns the number of neighbors rejected as background fires
 #
-def nUnmaskedWaterFilt(kernel, kSize, minKsize):
-  nUnmaskedWater = -4
-  kernel = kernel.reshape((kSize, kSize))
+def nRejectBGfireFilt(band, kSize, minKsize):
+  nRejectBGfire = windowCount(band == -3, kSize)
+
+  return np.where((kSize == minKsize) | (windowCenter(band, kSize) == -4), nRejectBGfire, -4)
 
-  centerVal = kernel[((kSize - 1) / 2), ((kSize - 1) / 2)]
 
-  if ((kSize == minKsize) | (centerVal == -4)) & (centerVal not in (range(-3, 0))):
-    nUnmaskedWater = len(kernel[np.where(kernel == -6)])
+#
+# Returns number of neighbors rejected as water
+#
+def nRejectWaterFilt(band, kSize, minKsize):
+  nRejectWater = windowCount(band == -1, kSize)
+
+  return np.where((kSize == minKsize) | (windowCenter(band, kSize) == -4), nRejectWater, -4)
+
+
+#
+# Returns the number of 'unmasked water' neighbors
+#
+def nUnmaskedWaterFilt(band, kSize, minKsize):
+  nUnmaskedWater = windowCount(band == -6, kSize)
 
-  return nUnmaskedWater
+  center = windowCenter(band, kSize)
+  centerMasked = (center == -3) | (center == -2) | (center == -1)
+  return np.where(((kSize == minKsize) | (center == -4)) & ~centerMasked, nUnmaskedWater, -4)
 
 
 #
-# Generic ramp function used to calculate detection confidence
+# Keeps the candidates that survived a stage of the cascade, every array in candidates is aligned with the survive mask
+# Returns None once no candidates are left
 #
-def rampFn(band, rampMin, rampMax):
-  conf = 0
-  confVals = []
-  for bandVal in band:
-    if rampMin < bandVal < rampMax:
-      conf = (bandVal - rampMin) / (rampMax - rampMin)
-    if bandVal >= rampMax:
-      conf = 1
-    confVals.append(conf)
-  return np.asarray(confVals)
+def filterCandidates(candidates, survive, stage, verbose):
+  if verbose:
+    print(stage + ": " + str(np.count_nonzero(survive)) + " of " + str(len(survive)) + " candidates remain")
+  if not np.any(survive):
+    return None
+  return dict((name, values[survive]) for name, values in candidates.items())
 
 
 #
 # Runs filters on progressively larger kernel sizes and then combines the result from the smallest kSize
+# Each larger kSize filters the output of the previous one and only fills pixels that are still -4,
+# so once none are left the remaining sizes cannot change the result and are skipped
 #
 def runFilt(band, filtFunc, minKsize, maxKsize):
-  filtBand = band
-  kSize = minKsize
-  bandFilts = {}
-
-  while kSize <= maxKsize:
-    filtName = 'bandFilt' + str(kSize)
-    filtBand = ndimage.generic_filter(filtBand, filtFunc, size=kSize, extra_arguments=(kSize, minKsize))
-    bandFilts[filtName] = filtBand
-    kSize += 2
-
-  bandFilt = bandFilts['bandFilt' + str(minKsize)]
+  filtBand = filtFunc(band, minKsize, minKsize)
+  bandFilt = np.copy(filtBand)
   kSize = minKsize + 2
 
-  while kSize <= maxKsize:
-    bandFilt[np.where(bandFilt == -4)] = bandFilts['bandFilt' + str(kSize)][np.where(bandFilt == -4)]
+  while kSize <= maxKsize and np.any(bandFilt == -4):
+    filtBand = filtFunc(filtBand, kSize, minKsize)
+    fallback = np.where(bandFilt == -4)
+    bandFilt[fallback] = filtBand[fallback]
     kSize += 2
 
   return bandFilt
 
 #
-# Calculates mean and mean absolute deviation (MAD) of neighbouring pixels in a given band
-# Valid neighbouring pixels must match the waterMask state of the corresponding waterMask center pixel
-# Is used when both mean and MAD is required
+# Calculates the background mean, mean absolute deviation (MAD) and number of valid (> 0) neighbours
+# for a batch of pixels at once. The rows and cols index the padded band, the footprint holds the
+# neighbour offsets. Pixels are gathered in chunks so that memory stays bounded on full swaths.
 #
-def meanMadFilt(rawband, minKsize, maxKsize, footprintx, footprinty, ksizes, minNcount, minNfrac):
-  sizex, sizey = np.shape(rawband)
-  bSize = (maxKsize - 1) / 2
-  padsizex = sizex + 2 * bSize
-  padsizey = sizey + 2 * bSize
+def bgStats(band, rows, cols, footprintx, footprinty):
+  nPix = len(rows)
+  bgMean = np.zeros(nPix, dtype=np.float64)
+  bgMAD = np.zeros(nPix, dtype=np.float64)
+  nn = np.zeros(nPix, dtype=np.int_)
 
-  # This is the window which will be processed
-  band = np.pad(rawband, ((bSize, bSize), (bSize, bSize)), mode='symmetric')
+  chunkSize = max(1, BG_STATS_CHUNK // max(1, len(footprintx)))
 
-  meanFilt = np.full([padsizex, padsizey], -4.0, dtype=np.float32)
-  madFilt = np.full([padsizex, padsizey], -4.0, dtype=np.float32)
+  for start in range(0, nPix, chunkSize):
+    stop = min(start + chunkSize, nPix)
 
-  divTable = 1.0 / np.arange(1, maxKsize * maxKsize, dtype=np.float64)
-  divTable = np.insert(divTable, 0, 0)
+    # Get all possible neighbours of every pixel in the chunk, one row per pixel
+    neighbours = band[rows[start:stop, None] + footprintx, cols[start:stop, None] + footprinty]
+    with np.errstate(invalid='ignore'):
+      validNghbrs = neighbours > 0
 
-  nmin = min(minNcount, minNfrac * minKsize * minKsize)
+    nValid = np.sum(validNghbrs, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      divTable = 1.0 / nValid
+      mean = np.sum(np.where(validNghbrs, neighbours, 0), axis=1) * divTable
+      meanDists = np.where(validNghbrs, np.abs(neighbours - mean[:, None]), 0)
+      bgMAD[start:stop] = np.sum(meanDists, axis=1) * divTable
 
-  for y in range(bSize, sizey + bSize):
-    for x in range(bSize, sizex + bSize):
+    bgMean[start:stop] = mean
+    nn[start:stop] = nValid
 
-      # This is the center pixel of the window
-      centerVal = band[x, y]
+  return bgMean, bgMAD, nn
 
-      if (centerVal not in range(-2, 0)):
+#
+# Calculates mean and mean absolute deviation (MAD) of neighbouring pixels in a given band
+# Valid neighbouring pixels must match the waterMask state of the corresponding waterMask center pixel
+# Is used when both mean and MAD is required
+# If coords (rows, cols) is given only those pixels are calculated, e.g. the potential fires, and the rest stay -4
+# With compact set the values are returned as arrays aligned with coords instead of rasters
+#
+def meanMadFilt(rawband, minKsize, maxKsize, footprintx, footprinty, ksizes, minNcount, minNfrac, coords=None,
+                compact=False):
+  stats = meanMadStats(rawband, maxKsize, footprintx[0], footprinty[0], coords)
+  return meanMadFill(stats, np.shape(rawband), minKsize, ksizes, minNcount, minNfrac, compact)
 
-        if meanFilt[x, y] == -4:
 
-          # Get all possible neighbours of the current window
-          neighbours = band[x + footprintx[0], y + footprinty[0]]
+#
+# Calculates the background statistics of meanMadFilt before the valid neighbour thresholds are applied
+# Only the given footprint is used, so the statistics can be shared by every kernel range that starts with it
+# Returns the pixels' rows and cols, their center values, the indices of the pixels that are not cloud or water and
+# the mean, MAD and number of valid neighbours of those
+#
+def meanMadStats(rawband, maxKsize, footprintx, footprinty, coords=None):
+  bSize = (maxKsize - 1) // 2
 
-          neighbours = neighbours[np.where(neighbours > 0)]
+  # The footprint is used for every kernel size, so the pad must at least cover it
+  # A kernel of size 1 has no neighbours, its pixels then have no valid neighbours and stay -4
+  if len(footprintx) > 0:
+    bSize = max(bSize, np.max(np.abs(footprintx)), np.max(np.abs(footprinty)))
 
-          nn = len(neighbours)
+  # This is the window which will be processed
+  band = np.pad(rawband, ((bSize, bSize), (bSize, bSize)), mode='symmetric')
+
+  # Every pixel that is not cloud or water has its background computed
+  with np.errstate(invalid='ignore'):
+    if coords is None:
+      x, y = np.where((rawband != -1) & (rawband != -2))
+    else:
+      x, y = np.asarray(coords[0], dtype=np.intp), np.asarray(coords[1], dtype=np.intp)
+    centerVal = rawband[x, y]
+    bgPix = np.where((centerVal != -1) & (centerVal != -2))[0]
 
-          # The number of valid neighbours is more than what is required
-          if (nn > nmin):
-            bgMean = np.sum(neighbours) * divTable[nn]
-            meanFilt[x, y] = bgMean
-            meanDists = np.abs(neighbours - bgMean)
-            bgMAD = np.sum(meanDists) * divTable[nn]
-            madFilt[x, y] = bgMAD
+  if len(bgPix) > 0:
+    bgMean, bgMAD, nn = bgStats(band, x[bgPix] + bSize, y[bgPix] + bSize, footprintx, footprinty)
+  else:
+    bgMean, bgMAD, nn = np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int_)
 
-  for i in range(1, len(ksizes)):
+  return x, y, centerVal, bgPix, bgMean, bgMAD, nn
 
-    nmin = min(minNcount, minNfrac * ksizes[i] * ksizes[i])
 
-    for y in range(bSize, sizey + bSize):
-      for x in range(bSize, sizex + bSize):
+#
+# Applies the valid neighbour thresholds of meanMadFilt to statistics calculated by meanMadStats
+# Pixels without enough valid neighbours are -4, returns rasters of the given shape unless compact is set
+#
+def meanMadFill(stats, shape, minKsize, ksizes, minNcount, minNfrac, compact=False):
+  x, y, centerVal, bgPix, bgMean, bgMAD, nn = stats
 
-        # This is the center pixel of the window
-        centerVal = band[x, y]
+  meanVals = np.full(len(x), -4.0, dtype=np.float32)
+  madVals = np.full(len(x), -4.0, dtype=np.float32)
 
-        if centerVal == -4:
-          if meanFilt[x, y] == -4:
+  if len(bgPix) > 0:
 
-            # Get all possible neighbours of the current window
-            neighbours = band[x + footprintx[0], y + footprinty[0]]
+    # The number of valid neighbours is more than what is required
+    nmin = min(minNcount, minNfrac * minKsize * minKsize)
+    filled = nn > nmin
 
-            neighbours = neighbours[np.where(neighbours > 0)]
+    # Pixels flagged -4 that are still unfilled get another chance with the threshold of each larger kernel
+    for i in range(1, len(ksizes)):
 
-            nn = len(neighbours)
+      nmin = min(minNcount, minNfrac * ksizes[i] * ksizes[i])
 
-            if (nn > nmin):
-              bgMean = np.sum(neighbours) * divTable[nn]
-              meanFilt[x, y] = bgMean
-              meanDists = np.abs(neighbours - bgMean)
-              bgMAD = np.sum(meanDists) * divTable[nn]
-              madFilt[x, y] = bgMAD
+      filled |= (centerVal[bgPix] == -4) & (nn > nmin)
 
-  return meanFilt[bSize:-bSize, bSize:-bSize], madFilt[bSize:-bSize, bSize:-bSize]
+    meanVals[bgPix[filled]] = bgMean[filled]
+    madVals[bgPix[filled]] = bgMAD[filled]
+
+  if compact:
+    return meanVals, madVals
+
+  meanFilt = np.full(shape, -4.0, dtype=np.float32)
+  madFilt = np.full(shape, -4.0, dtype=np.float32)
+  meanFilt[x, y] = meanVals
+  madFilt[x, y] = madVals
+
+  return meanFilt, madFilt
 
 
 #
-# Main function for processing HDFs
+# Reads the given zero-based bands of a HDF layer within a (xoff, yoff, xsize, ysize) window
+# Returns a dictionary of arrays keyed by band index
 #
-def process(filMOD02, commandLineArgs, cwd, directory):
-  minNfrac = commandLineArgs.validFraction
-  decimal = commandLineArgs.decimal
-  minNcount = commandLineArgs.windowObservations
-  maxKsize = commandLineArgs.maximumKernel
-  minKsize = commandLineArgs.minimumKernel
-  reductionFactor = commandLineArgs.reductionFactor
-  maxLon = commandLineArgs.maximumLongitude
-  minLon = commandLineArgs.minimumLongitude
-  maxLat = commandLineArgs.maximumLatitude
-  minLat = commandLineArgs.minimumLatitude
+def readBands(g, bandIndices, window):
+  bands = {}
+  for bandIndex in bandIndices:
+    bands[bandIndex] = g.GetRasterBand(bandIndex + 1).ReadAsArray(*window)
+  return bands
 
-  # Value at which Band 22 saturates (L. Giglio, personal communication)
-  b22saturationVal = 331
-  increaseFactor = 1 + (1 - reductionFactor)
-  waterFlag = -1
-  cloudFlag = -2
-  bgFlag = -3
 
-  # Coefficients for radiance calculations
-  coeff1 = 119104200
-  coeff2 = 14387.752
-  lambda21and22 = 3.959
-  lambda31 = 11.009
-  lambda32 = 12.02
+#
+# Parses the comma separated per-band values of a HDF metadata entry (e.g. radiance_scales) for the given bands
+# Returns a dictionary of floats keyed by band index
+#
+def parseBandValues(metadata, key, bandIndices):
+  values = metadata[key].split(',')
+  bandValues = {}
+  for bandIndex in bandIndices:
+    bandValues[bandIndex] = float(values[bandIndex])
+  return bandValues
 
-  # Layers for reading in HDF files
-  layersMOD02 = ['EV_1KM_Emissive', 'EV_250_Aggr1km_RefSB', 'EV_500_Aggr1km_RefSB']
-  layersMOD03 = ['Land/SeaMask', 'Latitude', 'Longitude', 'SolarAzimuth', 'SolarZenith', 'SensorAzimuth',
-                 'SensorZenith']
 
-  # meanMadFilt
+#
+# Builds the neighbour offsets of each kernel size used by meanMadFilt
+# Pixels immediately to the left and right of the center are excluded
+# Returns the row offsets, column offsets and kernel sizes
+#
+def kernelFootprints(minKsize, maxKsize):
   footprintx = []
   footprinty = []
-  Ncount = []
   ksizes = []
   for s in range(minKsize, maxKsize + 2, 2):
-    halfSize = (s - 1) / 2
+    halfSize = (s - 1) // 2
     xlist = []
     ylist = []
     for x in range(-halfSize, halfSize + 1):
       for y in range(-halfSize, halfSize + 1):
-        if x is 0:
+        if x == 0:
           if abs(y) > 1:
             xlist.append(x)
             ylist.append(y)
         else:
           xlist.append(x)
           ylist.append(y)
-    footprintx.append(np.array(xlist))
-    footprinty.append(np.array(ylist))
-    Ncount.append(len(xlist))
+    footprintx.append(np.array(xlist, dtype=np.int_))
+    footprinty.append(np.array(ylist, dtype=np.int_))
     ksizes.append(s)
 
-  # Parse the HDF02
-  filSplt = filMOD02.split('.')
-  datTim = filSplt[1].replace('A', '') + filSplt[2]
-  t = datetime.datetime.strptime(datTim, "%Y%j%H%M")
-
-  julianDay = str(t.timetuple().tm_yday)
-  jZeros = 3 - len(julianDay)
-  julianDay = '0' * jZeros + julianDay
-  yr = str(t.year)
-  hr = str(t.hour)
-  hrZeros = 2 - len(hr)
-  hr = '0' * hrZeros + hr
-  mint = str(t.minute)
-  mintZeros = 2 - len(mint)
-  mint = '0' * mintZeros + mint
-  datNam = yr + julianDay + '.' + hr + mint
-
-  # Get the corresponding 03 HDF
-  filMOD03 = None
-  for filNamCandidate in HDF03:
-    if datNam in filNamCandidate:
-      filMOD03 = filNamCandidate
-      break
-
-  # The HDF03 does not exist - exit as we don't process a solitary HDF02
-  if filMOD03 is None:
-    return
+  return footprintx, footprinty, ksizes
+
+
+#
+# Reads the HDF02/HDF03 pair within the area given by the config and a halo around it
+# Returns the dictionary of arrays, the (row start, row end, col start, col end) of the area within the arrays and the
+# (row, col) of the arrays' origin in the swath, or None if the area is not in the swath
+# The halo defaults to the one needed by the largest kernel of the config
+# onGeolocation(lat, lon) is called with the whole swath's geolocation once it is read, e.g. to index its footprint
+#
+def readGranule(filMOD02, filMOD03, config, halo=None, onGeolocation=None):
+  maxLon = config.maximumLongitude
+  minLon = config.minimumLongitude
+  maxLat = config.maximumLatitude
+  minLat = config.minimumLatitude
 
-  # Creates a blank dictionary to hold the full MODIS swaths
-  fullArrays = {}
+  # Brightness temperatures are calculated in single precision in low memory mode
+  tempType = np.float32 if config.lowMemory else np.float64
+
+  # Layers for reading in HDF files
+  layersMOD02 = ['EV_1KM_Emissive', 'EV_250_Aggr1km_RefSB', 'EV_500_Aggr1km_RefSB']
+
+  # Zero-based indices of the bands used from each HDF02 layer, only these are read
+  # EV_1KM_Emissive: bands 21, 22, 31, 32 - EV_250_Aggr1km_RefSB: bands 1, 2 - EV_500_Aggr1km_RefSB: band 7
+  bandsMOD02 = {'EV_1KM_Emissive': [1, 2, 10, 11], 'EV_250_Aggr1km_RefSB': [0, 1], 'EV_500_Aggr1km_RefSB': [4]}
+  layersMOD03 = ['Land/SeaMask', 'SolarAzimuth', 'SolarZenith', 'SensorAzimuth', 'SensorZenith']
+
+  # Read the geolocation first so that the other layers only decode the rows and columns around the area
+  file_template = 'HDF4_EOS:EOS_SWATH:%s:MODIS_Swath_Type_GEO:%s'
+  g = gdal.Open(file_template % (filMOD03, 'Latitude'))
+  if g is None:
+    raise IOError("Cannot open the Latitude layer of " + filMOD03)
+  lat = g.ReadAsArray()
+  g = gdal.Open(file_template % (filMOD03, 'Longitude'))
+  if g is None:
+    raise IOError("Cannot open the Longitude layer of " + filMOD03)
+  lon = g.ReadAsArray()
+  if onGeolocation is not None:
+    onGeolocation(lat, lon)
+
+  # Clip area to bounding co-ordinates
+  boundCrds = np.where((minLat < lat) & (lat < maxLat) & (lon < maxLon) & (minLon < lon))
+
+  if np.size(boundCrds) == 0 or (np.min(boundCrds[0]) == np.max(boundCrds[0])) or (
+        np.min(boundCrds[1]) == np.max(boundCrds[1])):
+    return None
+
+  boundCrds0 = boundCrds[0]
+  boundCrds1 = boundCrds[1]
+  min0 = np.min(boundCrds0)
+  max0 = np.max(boundCrds0)
+  min1 = np.min(boundCrds1)
+  max1 = np.max(boundCrds1)
+
+  # Pad the window with a halo so that the context tests at the edge of the area see their real neighbours
+  if halo is None:
+    halo = config.maximumKernel // 2
+  [swathRows, swathCols] = np.shape(lat)
+  winMin0 = max(min0 - halo, 0)
+  winMax0 = min(max0 + halo, swathRows)
+  winMin1 = max(min1 - halo, 0)
+  winMax1 = min(max1 + halo, swathCols)
+  window = (int(winMin1), int(winMin0), int(winMax1 - winMin1), int(winMax0 - winMin0))
+
+  # Creates a blank dictionary to hold the MODIS data clipped to the window
+  allArrays = {'LAT': lat[winMin0:winMax0, winMin1:winMax1], 'LON': lon[winMin0:winMax0, winMin1:winMax1]}
+  del lat, lon
 
   # Invalid mask
   invalidMask = None;
@@ -531,30 +912,19 @@ def process(filMOD02, commandLineArgs, cwd, directory):
     this_file = file_template % (filMOD02, layer)
     g = gdal.Open(this_file)
     if g is None:
-      return
+      return None
     metadataMOD02 = g.GetMetadata()
-    dataMOD02 = g.ReadAsArray()
+    dataMOD02 = readBands(g, bandsMOD02[layer], window)
 
     # Initialise the invalid mask if it is not already
     if invalidMask is None:
-      invalidMask = np.zeros_like(dataMOD02[1])
+      invalidMask = np.zeros((window[3], window[2]), dtype=np.uint8)
 
     if layer == 'EV_1KM_Emissive':
-      B21index, B22index, B31index, B32index = 1, 2, 10, 11
-
-      radScales = metadataMOD02["radiance_scales"].split(',')
-      radScalesFlt = []
-      for radScale in radScales:
-        radScalesFlt.append(float(radScale))
-      radScales = radScalesFlt
-      del radScalesFlt
-
-      radOffset = metadataMOD02["radiance_offsets"].split(',')
-      radOffsetFlt = []
-      for radOff in radOffset:
-        radOffsetFlt.append(float(radOff))
-      radOffset = radOffsetFlt
-      del radOffsetFlt
+      B21index, B22index, B31index, B32index = bandsMOD02[layer]
+
+      radScales = parseBandValues(metadataMOD02, "radiance_scales", bandsMOD02[layer])
+      radOffset = parseBandValues(metadataMOD02, "radiance_offsets", bandsMOD02[layer])
 
       # Calculate temperature/reflectance based on scale and offset and correction term (L. Giglio, personal communication)
       B21, B22, B31, B32 = dataMOD02[B21index], dataMOD02[B22index], dataMOD02[B31index], dataMOD02[B32index]
@@ -565,47 +935,17 @@ def process(filMOD02, commandLineArgs, cwd, directory):
       invalidMask[(B31 == 65534)] = 1
       invalidMask[(B32 == 65534)] = 1
 
-      B21scale, B22scale, B31scale, B32scale = radScales[B21index], radScales[B22index], radScales[B31index], radScales[
-        B32index]
-      B21offset, B22offset, B31offset, B32offset = radOffset[B21index], radOffset[B22index], radOffset[B31index], \
-                                                   radOffset[B32index]
-
-      B21 = (B21 - B21offset) * B21scale
-      T21 = coeff2 / (lambda21and22 * (np.log(coeff1 / (((math.pow(lambda21and22, 5)) * B21) + 1))))
-      T21corr = 1.00009 * T21 - 0.05167
-      fullArrays['BAND21'] = T21corr
-
-      B22 = (B22 - B22offset) * B22scale
-      T22 = coeff2 / (lambda21and22 * (np.log(coeff1 / (((math.pow(lambda21and22, 5)) * B22) + 1))))
-      T22corr = 1.00010 * T22 - 0.05332
-      fullArrays['BAND22'] = T22corr
-
-      B31 = (B31 - B31offset) * B31scale
-      T31 = coeff2 / (lambda31 * (np.log(coeff1 / (((math.pow(lambda31, 5)) * B31) + 1))))
-      T31corr = 1.00046 * T31 - 0.09968
-      fullArrays['BAND31'] = T31corr
-
-      B32 = (B32 - B32offset) * B32scale
-      T32 = coeff2 / (lambda32 * (np.log(coeff1 / (((math.pow(lambda32, 5)) * B32) + 1))))
-      fullArrays['BAND32'] = T32
+      # Brightness temperatures are looked up per DN from tables built for the band's scale and offset
+      for band, bandIndex in ((21, B21index), (22, B22index), (31, B31index), (32, B32index)):
+        allArrays['BAND' + str(band)] = calibration.brightnessTemperature(
+          dataMOD02[bandIndex], band, radScales[bandIndex], radOffset[bandIndex], tempType)
 
     if layer == 'EV_250_Aggr1km_RefSB':
 
-      B1index, B2index = 0, 1
+      B1index, B2index = bandsMOD02[layer]
 
-      refScales = metadataMOD02["reflectance_scales"].split(',')
-      refScalesFlt = []
-      for refScale in refScales:
-        refScalesFlt.append(float(refScale))
-      refScales = refScalesFlt
-      del refScalesFlt
-
-      refOffset = metadataMOD02["reflectance_offsets"].split(',')
-      refOffsetFlt = []
-      for refOff in refOffset:
-        refOffsetFlt.append(float(refOff))
-      refOffset = refOffsetFlt
-      del refOffsetFlt
+      refScales = parseBandValues(metadataMOD02, "reflectance_scales", bandsMOD02[layer])
+      refOffset = parseBandValues(metadataMOD02, "reflectance_offsets", bandsMOD02[layer])
 
       B1, B2 = dataMOD02[B1index], dataMOD02[B2index]
 
@@ -617,28 +957,17 @@ def process(filMOD02, commandLineArgs, cwd, directory):
       B1offset, B2offset = refOffset[B1index], refOffset[B2index]
 
       B1 = ((B1 - B1offset) * B1scale) * 1000
-      B1 = B1.astype(int)
+      B1 = B1.astype(np.int32)
       B2 = ((B2 - B2offset) * B2scale) * 1000
-      B2 = B2.astype(int)
+      B2 = B2.astype(np.int32)
 
-      fullArrays['BAND1x1k'], fullArrays['BAND2x1k'] = B1, B2
+      allArrays['BAND1x1k'], allArrays['BAND2x1k'] = B1, B2
 
     if layer == 'EV_500_Aggr1km_RefSB':
-      B7index = 4
-
-      refScales = metadataMOD02["reflectance_scales"].split(',')
-      refScalesFlt = []
-      for refScale in refScales:
-        refScalesFlt.append(float(refScale))
-      refScales = refScalesFlt
-      del refScalesFlt
-
-      refOffset = metadataMOD02["reflectance_offsets"].split(',')
-      refOffsetFlt = []
-      for refOff in refOffset:
-        refOffsetFlt.append(float(refOff))
-      refOffset = refOffsetFlt
-      del refOffsetFlt
+      B7index, = bandsMOD02[layer]
+
+      refScales = parseBandValues(metadataMOD02, "reflectance_scales", bandsMOD02[layer])
+      refOffset = parseBandValues(metadataMOD02, "reflectance_offsets", bandsMOD02[layer])
 
       B7 = dataMOD02[B7index]
 
@@ -647,8 +976,8 @@ def process(filMOD02, commandLineArgs, cwd, directory):
 
       B7scale, B7offset = refScales[B7index], refOffset[B7index]
       B7 = ((B7 - B7offset) * B7scale) * 1000
-      B7 = B7.astype(int)
-      fullArrays['BAND7x1k'] = B7
+      B7 = B7.astype(np.int32)
+      allArrays['BAND7x1k'] = B7
 
   for i, layer in enumerate(layersMOD03):
 
@@ -656,406 +985,888 @@ def process(filMOD02, commandLineArgs, cwd, directory):
     this_file = file_template % (filMOD03, layer)
     g = gdal.Open(this_file)
     if g is None:
-      raise IOError
+      raise IOError("Cannot open the " + layer + " layer of " + filMOD03)
     if layer == 'Land/SeaMask':
       newLyrName = 'LANDMASK'
-    elif layer == 'Latitude':
-      newLyrName = 'LAT'
-    elif layer == 'Longitude':
-      newLyrName = 'LON'
     else:
       newLyrName = layer
-    fullArrays[newLyrName] = g.ReadAsArray()
+    allArrays[newLyrName] = g.ReadAsArray(*window)
 
-  # Clip area to bounding co-ordinates
-  boundCrds = np.where((minLat < fullArrays['LAT']) & (fullArrays['LAT'] < maxLat) & (fullArrays['LON'] < maxLon) & (
-    minLon < fullArrays['LON']))
-
-  if np.size(boundCrds) > 0 and (np.min(boundCrds[0]) != np.max(boundCrds[0])) and (
-        np.min(boundCrds[1]) != np.max(boundCrds[1])):
-
-    boundCrds0 = boundCrds[0]
-    boundCrds1 = boundCrds[1]
-    min0 = np.min(boundCrds0)
-    max0 = np.max(boundCrds0)
-    min1 = np.min(boundCrds1)
-    max1 = np.max(boundCrds1)
-
-    # Creates a blank dictionary to hold the cropped MODIS data
-    allArrays = {}  # Clipped to min/max lat/long
-    for b in fullArrays.keys():
-      cropB = fullArrays[b][min0:max0, min1:max1]
-      allArrays[b] = cropB
-
-    # Crop the invalid mask
-    invalidMask = invalidMask[min0:max0, min1:max1]
-
-    [nRows, nCols] = np.shape(allArrays['BAND22'])
-
-    # Test for b22 saturation - replace with values from B21
-    allArrays['BAND22'][np.where(allArrays['BAND22'] >= b22saturationVal)] = allArrays['BAND21'][
-      np.where(allArrays['BAND22'] >= b22saturationVal)]
-
-    # Day/Night flag (Giglio, 2003 Section 2.2.2)
-    dayFlag = np.zeros((nRows, nCols), dtype=np.int)
-    dayFlag[np.where(allArrays['SolarZenith'] < 8500)] = 1
-
-    # Create water mask
-    waterMask = np.zeros((nRows, nCols), dtype=np.int)
-    waterMask[np.where(allArrays['LANDMASK'] != 1)] = waterFlag
-
-    # Create cloud mask (Giglio, 2003 Section 2.1)
-    cloudMask = np.zeros((nRows, nCols), dtype=np.int)
-    cloudMask[((allArrays['BAND1x1k'] + allArrays['BAND2x1k']) > 900) & (dayFlag == 1)] = cloudFlag
-    cloudMask[(allArrays['BAND32'] < 265) & (dayFlag == 1)] = cloudFlag
-    cloudMask[(((allArrays['BAND1x1k'] + allArrays['BAND2x1k']) > 700) & (allArrays['BAND32'] < 285)) & (dayFlag ==1)] = cloudFlag
-    cloudMask[((allArrays['BAND32'] < 265) & (dayFlag == 0))] = cloudFlag
-
-    # Mask clouds and water from input bands
-    b21CloudWaterMasked = np.copy(allArrays['BAND21'])  # ONLY B21
-    b21CloudWaterMasked[np.where(waterMask == waterFlag)] = waterFlag
-    b21CloudWaterMasked[np.where(cloudMask == cloudFlag)] = cloudFlag
-
-    b22CloudWaterMasked = np.copy(allArrays['BAND22'])  # HAS B21 VALS WHERE B22 SATURATED
-    b22CloudWaterMasked[np.where(waterMask == waterFlag)] = waterFlag
-    b22CloudWaterMasked[np.where(cloudMask == cloudFlag)] = cloudFlag
-
-    b31CloudWaterMasked = np.copy(allArrays['BAND31'])
-    b31CloudWaterMasked[np.where(waterMask == waterFlag)] = waterFlag
-    b31CloudWaterMasked[np.where(cloudMask == cloudFlag)] = cloudFlag
-
-    deltaT = np.abs(allArrays['BAND22'] - allArrays['BAND31'])
-    deltaTCloudWaterMasked = np.copy(deltaT)
-    deltaTCloudWaterMasked[np.where(waterMask == waterFlag)] = waterFlag
-    deltaTCloudWaterMasked[np.where(cloudMask == cloudFlag)] = cloudFlag
-
-    # Potential fire test (Giglio 2003, Section 2.2.1)
-    potFire = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      potFire[(dayFlag == 1) & (allArrays['BAND22'] > (310 * reductionFactor)) & (deltaT > (10 * reductionFactor)) & (
-        allArrays['BAND2x1k'] < (300 * increaseFactor)) & (invalidMask == 0)] = 1
-      potFire[(dayFlag == 0) & (allArrays['BAND22'] > (305 * reductionFactor)) & (deltaT > (10 * reductionFactor)) & (invalidMask == 0)] = 1
+  allArrays['INVALID'] = invalidMask
+  core = (min0 - winMin0, max0 - winMin0, min1 - winMin1, max1 - winMin1)
+  return allArrays, core, (winMin0, winMin1)
 
-    # Absolute threshold test 1 (Giglio 2003, Section 2.2.2)
-    test1 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test1[(potFire == 1) & (dayFlag == 1) & (allArrays['BAND22'] > (360 * reductionFactor)) & (invalidMask == 0)] = 1
-      test1[(potFire == 1) & (dayFlag == 0) & (allArrays['BAND22'] > (320 * reductionFactor)) & (invalidMask == 0)] = 1
 
-    # Background fire test (Gilio 2003, Section 2.2.3, first paragraph)
-    bgMask = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      bgMask[
-        (potFire == 1) & (dayFlag == 1) & (allArrays['BAND22'] > (325 * reductionFactor)) & (
-        deltaT > (20 * reductionFactor)) & (invalidMask == 0)] = bgFlag
-      bgMask[
-        (potFire == 1) & (dayFlag == 0) & (allArrays['BAND22'] > (310 * reductionFactor)) & (
-        deltaT > (10 * reductionFactor)) & (invalidMask == 0)] = bgFlag
-
-    b22bgMask = np.copy(b22CloudWaterMasked)
-    b22bgMask[(potFire == 1) & (bgMask == bgFlag) & (invalidMask == 0)] = bgFlag
-
-    b31bgMask = np.copy(b31CloudWaterMasked)
-    b31bgMask[(potFire == 1) & (bgMask == bgFlag) & (invalidMask == 0)] = bgFlag
-
-    deltaTbgMask = np.copy(deltaTCloudWaterMasked)
-    deltaTbgMask[(potFire == 1) & (bgMask == bgFlag) & (invalidMask == 0)] = bgFlag
-
-    # Mean and mad filters - mad needed for confidence estimation
-    b22meanFilt, b22MADfilt = meanMadFilt(b22bgMask, maxKsize, minKsize, footprintx, footprinty, ksizes, minNcount,
-                                          minNfrac)
-    b22minusBG = np.copy(b22CloudWaterMasked) - np.copy(b22meanFilt)
-    b31meanFilt, b31MADfilt = meanMadFilt(b31bgMask, maxKsize, minKsize, footprintx, footprinty, ksizes, minNcount,
-                                          minNfrac)
-    deltaTmeanFilt, deltaTMADFilt = meanMadFilt(deltaTbgMask, maxKsize, minKsize, footprintx, footprinty, ksizes,
-                                                minNcount, minNfrac)
-
-    b22bgRej = np.copy(allArrays['BAND22'])
-    b22bgRej[(potFire == 1) & (bgMask != bgFlag) & (invalidMask == 0)] = bgFlag
-    b22rejMeanFilt, b22rejMADfilt = meanMadFilt(b22bgRej, maxKsize, minKsize, footprintx, footprinty, ksizes, minNcount,
-                                                minNfrac)
-
-    # CONTEXTUAL TESTS - (Giglio 2003, Section 2.2.4)
-    # The number associated with each test is the number of the equation in the paper
+#
+# Crops the arrays of a granule read with a larger halo to the given halo
+# Returns the cropped arrays, area and origin, the same as reading the granule with that halo
+#
+def cropGranule(allArrays, core, origin, halo):
+  [nRows, nCols] = np.shape(allArrays['BAND22'])
+  rowStart = max(core[0] - halo, 0)
+  rowEnd = min(core[1] + halo, nRows)
+  colStart = max(core[2] - halo, 0)
+  colEnd = min(core[3] + halo, nCols)
+
+  cropped = dict((name, band[rowStart:rowEnd, colStart:colEnd]) for name, band in allArrays.items())
+  return cropped, (core[0] - rowStart, core[1] - rowStart, core[2] - colStart, core[3] - colStart), (
+    origin[0] + rowStart, origin[1] + colStart)
+
+
+#
+# Warns that a footprint index cannot be used, once per index, and stops it being used again by this process
+#
+def disableFootprintIndex(footprintIndex, error):
+  if footprintIndex not in _unusableIndexes:
+    _unusableIndexes.add(footprintIndex)
+    print("Cannot use the footprint index " + footprintIndex + ", continuing without it - " + type(
+      error).__name__ + ": " + str(error))
+
+
+#
+# Looks up the footprint of a HDF03 in the footprint index, if there is one and it can be used
+# Returns whether the HDF03 is indexed and its footprint
+#
+def lookupIndexedFootprint(footprintIndex, filMOD03):
+  if not footprintIndex or footprintIndex in _unusableIndexes:
+    return False, None
+  try:
+    conn = footprints.openIndex(footprintIndex)
+    try:
+      return footprints.lookupFootprint(conn, filMOD03)
+    finally:
+      conn.close()
+  except sqlite3.Error as e:
+    disableFootprintIndex(footprintIndex, e)
+    return False, None
+
+
+#
+# Stores the footprint of a HDF03 calculated from its geolocation in the footprint index, if it can be used
+#
+def indexGeolocation(footprintIndex, filMOD03, lat, lon):
+  if footprintIndex in _unusableIndexes:
+    return
+  try:
+    conn = footprints.openIndex(footprintIndex)
+    try:
+      footprints.storeFootprint(conn, filMOD03, footprints.geolocationBounds(lat, lon))
+    finally:
+      conn.close()
+  except sqlite3.Error as e:
+    disableFootprintIndex(footprintIndex, e)
+
+
+#
+# Reads a HDF pair like readGranule, through the granule cache when the config has a cache directory
+# Granules are cached with CACHE_HALO and cropped to the halo of the config, granules whose swath misses the area are
+# cached too so that repeat runs do not open the HDFs at all. The halo covers the largest kernel of a sweep
+# With a footprint index pairs whose indexed footprint misses the area are skipped without opening the HDFs, HDF03s
+# that are not indexed yet are indexed from the geolocation readGranule reads anyway
+#
+def loadGranule(filMOD02, filMOD03, config, footprintIndex=None):
+  halo = max(detectionConfig.maximumKernel // 2 for detectionConfig in detectionConfigs(config))
+
+  indexed, bounds = lookupIndexedFootprint(footprintIndex, filMOD03)
+  if indexed and not footprints.intersects(bounds, config.minimumLatitude, config.maximumLatitude,
+                                           config.minimumLongitude, config.maximumLongitude):
+    if config.verbose:
+      print("Footprint of " + filMOD03 + " is outside the area, skipping")
+    return None
+
+  onGeolocation = None
+  if footprintIndex and not indexed:
+    onGeolocation = functools.partial(indexGeolocation, footprintIndex, filMOD03)
+
+  if not config.cacheDir:
+    return readGranule(filMOD02, filMOD03, config, halo, onGeolocation)
+
+  conn = granulecache.openCache(config.cacheDir)
+  try:
+    key = granulecache.entryKey(conn, [filMOD02, filMOD03], [
+      config.minimumLatitude, config.maximumLatitude, config.minimumLongitude, config.maximumLongitude,
+      config.lowMemory, CACHE_HALO])
+    entry = granulecache.load(conn, config.cacheDir, key)
+    if entry is None:
+      granule = readGranule(filMOD02, filMOD03, config, CACHE_HALO, onGeolocation)
+      allArrays, meta = None, None
+      if granule is not None:
+        allArrays, core, origin = granule
+        meta = {'core': [int(x) for x in core], 'origin': [int(x) for x in origin]}
+      granulecache.store(conn, config.cacheDir, key, allArrays, meta, config.cacheSize * 1048576)
+    else:
+      allArrays, meta = entry
+  finally:
+    conn.close()
+
+  if meta is None:
+    return None
+  return cropGranule(allArrays, meta['core'], meta['origin'], halo)
+
+
+#
+# Returns the result of a detection stage, computed the first time its key is seen when a memo is given
+# The key holds every parameter the stage depends on, the results kept in the memo must not be modified
+#
+def memoStage(memo, key, stage, *args):
+  if memo is None:
+    return stage(*args)
+  if key not in memo:
+    memo[key] = stage(*args)
+  return memo[key]
+
+
+#
+# Prepares the bands of the detection that do not depend on any parameter
+# Returns the invalid mask, B22 with B21 values where it saturated, the day flag, the water and cloud masks and deltaT
+#
+def prepareBands(allArrays):
+
+  # Value at which Band 22 saturates (L. Giglio, personal communication)
+  b22saturationVal = 331
+  waterFlag = -1
+  cloudFlag = -2
+
+  [nRows, nCols] = np.shape(allArrays['BAND22'])
+
+  # Invalid mask
+  invalidMask = allArrays.get('INVALID')
+  if invalidMask is None:
+    invalidMask = np.zeros((nRows, nCols), dtype=np.uint8)
+
+  # Test for b22 saturation - replace with values from B21
+  b22 = np.copy(allArrays['BAND22'])
+  saturated = b22 >= b22saturationVal
+  b22[saturated] = allArrays['BAND21'][saturated]
+  del saturated
+
+  # Day/Night flag (Giglio, 2003 Section 2.2.2)
+  dayFlag = allArrays['SolarZenith'] < 8500
+
+  # Create water mask
+  waterMask = np.zeros((nRows, nCols), dtype=np.int8)
+  waterMask[allArrays['LANDMASK'] != 1] = waterFlag
+
+  # Create cloud mask (Giglio, 2003 Section 2.1)
+  cloudMask = np.zeros((nRows, nCols), dtype=np.int8)
+  b1plusb2 = allArrays['BAND1x1k'] + allArrays['BAND2x1k']
+  cloudMask[(b1plusb2 > 900) & dayFlag] = cloudFlag
+  cloudMask[(allArrays['BAND32'] < 265) & dayFlag] = cloudFlag
+  cloudMask[((b1plusb2 > 700) & (allArrays['BAND32'] < 285)) & dayFlag] = cloudFlag
+  cloudMask[(allArrays['BAND32'] < 265) & ~dayFlag] = cloudFlag
+  del b1plusb2
+
+  deltaT = np.abs(b22 - allArrays['BAND31'])
+
+  return {'invalid': invalidMask, 'b22': b22, 'dayFlag': dayFlag, 'water': waterMask, 'cloud': cloudMask,
+          'deltaT': deltaT}
+
+
+#
+# Runs the potential fire test and the background fire test (Giglio 2003, Sections 2.2.1 and 2.2.3)
+# Returns the potential fires and the background fire mask
+#
+def potentialFires(bands, allArrays, reductionFactor):
+  increaseFactor = 1 + (1 - reductionFactor)
+  bgFlag = -3
+  b22, deltaT, dayFlag, invalidMask = bands['b22'], bands['deltaT'], bands['dayFlag'], bands['invalid']
+
+  # Potential fire test (Giglio 2003, Section 2.2.1)
+  with np.errstate(invalid='ignore'):
+    potFire = dayFlag & (b22 > (310 * reductionFactor)) & (deltaT > (10 * reductionFactor)) & (
+      allArrays['BAND2x1k'] < (300 * increaseFactor)) & (invalidMask == 0)
+    potFire |= ~dayFlag & (b22 > (305 * reductionFactor)) & (deltaT > (10 * reductionFactor)) & (
+      invalidMask == 0)
+
+  # Background fire test (Gilio 2003, Section 2.2.3, first paragraph)
+  bgMask = np.zeros(np.shape(b22), dtype=np.int8)
+  with np.errstate(invalid='ignore'):
+    bgMask[
+      potFire & dayFlag & (b22 > (325 * reductionFactor)) & (deltaT > (20 * reductionFactor)) & (
+        invalidMask == 0)] = bgFlag
+    bgMask[
+      potFire & ~dayFlag & (b22 > (310 * reductionFactor)) & (deltaT > (10 * reductionFactor)) & (
+        invalidMask == 0)] = bgFlag
+
+  return potFire, bgMask
+
+
+#
+# Masks clouds and water and then background fires from the bands used for the background statistics
+# Returns the masked B22, B31 and deltaT, B22 with the rejected potential fires masked, and the cloud and water masked
+# B22 and B31 values at the candidates. With inPlace the prepared B22 and deltaT are reused instead of copied
+#
+def maskBackground(bands, allArrays, potFire, bgMask, fireCrds, inPlace):
+  waterFlag = -1
+  cloudFlag = -2
+  bgFlag = -3
+  bgFire = bgMask == bgFlag
+
+  # B22 has B21 values where it saturated and is copied once as the background rejection below reuses it
+  isWater = bands['water'] == waterFlag
+  isCloud = bands['cloud'] == cloudFlag
+  b22bgMask = np.copy(bands['b22'])
+  b31bgMask = np.copy(allArrays['BAND31'])
+  deltaTbgMask = bands['deltaT'] if inPlace else np.copy(bands['deltaT'])
+  masked = {}
+  for name, band in (('b22CloudWaterMasked', b22bgMask), ('b31CloudWaterMasked', b31bgMask),
+                     (None, deltaTbgMask)):
+    band[isWater] = waterFlag
+    band[isCloud] = cloudFlag
+    if name is not None:
+      masked[name] = band[fireCrds]
+    band[bgFire] = bgFlag
+  del isWater, isCloud
+
+  b22bgRej = bands['b22'] if inPlace else np.copy(bands['b22'])
+  b22bgRej[potFire & ~bgFire & (bands['invalid'] == 0)] = bgFlag
+
+  masked.update({'b22': b22bgMask, 'b31': b31bgMask, 'deltaT': deltaTbgMask, 'b22rej': b22bgRej})
+  return masked
+
+
+#
+# Builds the band of potential fires that look like unmasked water for the coastal false alarm rejection
+# The unmasked water flags cover every potential fire as they are counted in the neighbourhood of the candidates
+#
+def unmaskedWaterBand(allArrays, potFire, bgMask):
+  potFireCrds = np.where(potFire)
+  b1 = allArrays['BAND1x1k'][potFireCrds]
+  b2 = allArrays['BAND2x1k'][potFireCrds]
+  with np.errstate(invalid='ignore', divide='ignore'):
+    ndvi = (b2 - b1) / (b2 + b1)
+    waterLike = (ndvi < 0) & (allArrays['BAND7x1k'][potFireCrds] < 50) & (b2 < 150)
+  unmaskedWater = np.zeros(np.shape(potFire), dtype=np.int8)
+  unmaskedWater[potFireCrds[0][waterLike], potFireCrds[1][waterLike]] = -6
+  unmaskedWater[potFire & (bgMask == -3)] = -3
+  return unmaskedWater
+
+
+#
+# Calculates the sun glint angle (Giglio 2003, section 2.2.6) in degrees at the given (rows, cols), everywhere without
+#
+def sunGlintAngle(allArrays, coords=None):
+  if coords is None:
+    coords = (slice(None), slice(None))
+  relAzimuth = allArrays['SensorAzimuth'][coords] - allArrays['SolarAzimuth'][coords]
+  sensorZenith = allArrays['SensorZenith'][coords]
+  solarZenith = allArrays['SolarZenith'][coords]
+  cosThetaG = (np.cos(sensorZenith) * np.cos(solarZenith)) - (
+    np.sin(sensorZenith) * np.sin(solarZenith) * np.cos(relAzimuth))
+  with np.errstate(invalid='ignore'):
+    thetaG = np.arccos(cosThetaG)
+  return (thetaG / 3.141592) * 180
+
+
+#
+# Runs the fire detection on in-memory arrays, e.g. those returned by readGranule
+# allArrays holds the bands (BAND1x1k, BAND2x1k, BAND7x1k, BAND21, BAND22, BAND31, BAND32), the geolocation (LAT, LON,
+# LANDMASK, SolarAzimuth, SolarZenith, SensorAzimuth, SensorZenith) and optionally the INVALID mask. The arrays are
+# not modified. Only fires within core (row start, row end, col start, col end) are reported, all of them without it,
+# and origin is added to the reported line and sample
+# Calls with different configs on the same arrays and core can share a memo dictionary, the stages that depend only
+# on parameters that two configs have in common are then computed once, see detectFiresSweep
+# Returns the detections, see makeDetections
+#
+def detectFires(allArrays, config, core=None, origin=(0, 0), memo=None):
+  minNfrac = config.validFraction
+  minNcount = config.windowObservations
+  maxKsize = config.maximumKernel
+  minKsize = config.minimumKernel
+  reductionFactor = config.reductionFactor
+  verbose = config.verbose
+  legacyConfidence = config.legacyConfidence
+
+  waterFlag = -1
+  cloudFlag = -2
+
+  footprintx, footprinty, ksizes = kernelFootprints(minKsize, maxKsize)
+
+  [nRows, nCols] = np.shape(allArrays['BAND22'])
+
+  # Only fires inside the area are reported, the halo is there for context
+  aoiMask = np.zeros((nRows, nCols), dtype=bool)
+  if core is None:
+    aoiMask[:, :] = True
+  else:
+    aoiMask[core[0]:core[1], core[2]:core[3]] = True
+
+  bands = memoStage(memo, ('bands',), prepareBands, allArrays)
+  dayFlag, waterMask, cloudMask = bands['dayFlag'], bands['water'], bands['cloud']
+  potFire, bgMask = memoStage(memo, ('potentialFires', reductionFactor), potentialFires, bands, allArrays,
+                              reductionFactor)
+
+  # The remaining tests run as a cascade over the potential fires inside the area, each stage only evaluates the
+  # candidates that survived the previous one. Potential fires in the halo only provide context
+  fireRows, fireCols = np.where(potFire & aoiMask)
+  if verbose:
+    print("potential fire test: " + str(len(fireRows)) + " candidates")
+  if len(fireRows) == 0:
+    return makeDetections()
+
+  # Per-candidate values, every array is aligned with the candidate rows and columns
+  fires = {'row': fireRows, 'col': fireCols}
+  for name, band in (('dayFlag', dayFlag), ('b22', bands['b22']), ('b31', allArrays['BAND31']),
+                     ('deltaT', bands['deltaT'])):
+    fires[name] = band[fireRows, fireCols]
+
+  # Without a memo nothing else needs the prepared B22 and deltaT, so they are masked in place rather than copied
+  fireCrds = (fireRows, fireCols)
+  masked = memoStage(memo, ('maskBackground', reductionFactor), maskBackground, bands, allArrays, potFire, bgMask,
+                     fireCrds, memo is None)
+  fires['b22CloudWaterMasked'] = masked['b22CloudWaterMasked']
+  fires['b31CloudWaterMasked'] = masked['b31CloudWaterMasked']
+  b22bgMask, b31bgMask, deltaTbgMask, b22bgRej = masked['b22'], masked['b31'], masked['deltaT'], masked['b22rej']
+
+  # Absolute threshold test 1 (Giglio 2003, Section 2.2.2)
+  with np.errstate(invalid='ignore'):
+    fires['test1'] = (fires['dayFlag'] & (fires['b22'] > (360 * reductionFactor))) | (
+      ~fires['dayFlag'] & (fires['b22'] > (320 * reductionFactor)))
+
+  # Mean and mad filters - mad needed for confidence estimation
+  # The statistics only depend on the first footprint, the thresholds of the kernel range are applied to them after
+  for name, band, meanName, madName in (('b22', b22bgMask, 'b22meanFilt', 'b22MADfilt'),
+                                        ('b31', b31bgMask, 'b31meanFilt', 'b31MADfilt'),
+                                        ('deltaT', deltaTbgMask, 'deltaTmeanFilt', 'deltaTMADFilt'),
+                                        ('b22rej', b22bgRej, 'b22rejMeanFilt', 'b22rejMADfilt')):
+    stats = memoStage(memo, ('meanMadStats', name, reductionFactor, minKsize), meanMadStats, band, minKsize,
+                      footprintx[0], footprinty[0], fireCrds)
+    fires[meanName], fires[madName] = meanMadFill(stats, (nRows, nCols), maxKsize, ksizes, minNcount, minNfrac,
+                                                  compact=True)
+
+  # CONTEXTUAL TESTS - (Giglio 2003, Section 2.2.4)
+  # The number associated with each test is the number of the equation in the paper
+  with np.errstate(invalid='ignore'):
 
     # Context fire test 2 (Giglio 2003, Section 2.2.4)
-    test2 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test2[(potFire == 1) & (deltaT > (deltaTmeanFilt + (3.5 * deltaTMADFilt))) & (invalidMask == 0)] = 1
+    test2 = fires['deltaT'] > (fires['deltaTmeanFilt'] + (3.5 * fires['deltaTMADFilt']))
 
     # Context fire test 3 (Giglio 2003, Section 2.2.4)
-    test3 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test3[(potFire == 1) & (deltaT > (deltaTmeanFilt + 6)) & (invalidMask == 0)] = 1
+    test3 = fires['deltaT'] > (fires['deltaTmeanFilt'] + 6)
 
     # Context fire test 4 (Giglio 2003, Section 2.2.4)
-    test4 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test4[(potFire == 1) & (b22CloudWaterMasked > (b22meanFilt + (3 * b22MADfilt))) & (invalidMask == 0)] = 1
+    test4 = fires['b22CloudWaterMasked'] > (fires['b22meanFilt'] + (3 * fires['b22MADfilt']))
 
     # Context fire test 5 (Giglio 2003, Section 2.2.4)
-    test5 = np.zeros((nRows, nCols), dtype=np.int)
-    test5[(potFire == 1) & (b31CloudWaterMasked > (b31meanFilt + b31MADfilt - 4)) & (invalidMask == 0)] = 1
+    test5 = fires['b31CloudWaterMasked'] > (fires['b31meanFilt'] + fires['b31MADfilt'] - 4)
 
     # Context fire test 6 (Giglio 2003, Section 2.2.4)
-    test6 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test6[(potFire == 1) & (b22rejMADfilt > 5) & (invalidMask == 0)] = 1
+    test6 = fires['b22rejMADfilt'] > 5
 
-    # Combine tests to create tentative fires (Giglio 2003, section 2.2.5)
-    tests2and3and4 = test2 * test3 * test4
+  # Combine tests to create tentative fires (Giglio 2003, section 2.2.5)
+  tests2and3and4 = test2 & test3 & test4
+  dayFires = fires['dayFlag'] & (fires['test1'] | (tests2and3and4 & (test5 | test6)))
 
-    test5or6 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      test5or6[(test5 == 1) | (test6 == 1)] = 1
-    fireLocTentativeDay = potFire * tests2and3and4 * test5or6
+  # Nighttime definite fire tests (Giglio 2003, section 2.2.5)
+  nightFires = ~fires['dayFlag'] & (tests2and3and4 | fires['test1'])
 
-    dayFires = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dayFires[(potFire == 1) & (dayFlag == 1) & ((test1 == 1) | (fireLocTentativeDay == 1)) & (invalidMask == 0)] = 1
+  fires = filterCandidates(fires, dayFires | nightFires, "contextual tests", verbose)
+  if fires is None:
+    return makeDetections()
 
-    # Nighttime definite fire tests (Giglio 2003, section 2.2.5)
-    nightFires = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      nightFires[(potFire == 1) & ((dayFlag == 0) & ((tests2and3and4 == 1) | test1 == 1)) & (invalidMask == 0)] = 1
+  # Sun glint rejection 7 (Giglio 2003, section 2.2.6)
+  # The angle is only calculated at the candidates, unless it is shared by every config of a memo
+  fireCrds = (fires['row'], fires['col'])
+  if memo is None:
+    thetaG = sunGlintAngle(allArrays, fireCrds)
+  else:
+    thetaG = memoStage(memo, ('sunGlintAngle',), sunGlintAngle, allArrays)[fireCrds]
 
-    # Sun glint rejection 7 (Giglio 2003, section 2.2.6)
-    relAzimuth = allArrays['SensorAzimuth'] - allArrays['SolarAzimuth']
-    cosThetaG = (np.cos(allArrays['SensorZenith']) * np.cos(allArrays['SolarZenith'])) - (
-      np.sin(allArrays['SensorZenith']) * np.sin(allArrays['SolarZenith']) * np.cos(relAzimuth))
-    thetaG = np.arccos(cosThetaG)
-    thetaG = (thetaG / 3.141592) * 180
+  with np.errstate(invalid='ignore'):
 
     # Sun glint test 8 (Giglio 2003, section 2.2.6)
-    sgTest8 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      sgTest8[(potFire == 1) & (thetaG < 2)] = 1
+    sgTest8 = thetaG < 2
 
     # Sun glint test 9 (Giglio 2003, section 2.2.6)
-    sgTest9 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      sgTest9[(potFire == 1) & ((thetaG < 8) & (allArrays['BAND1x1k'] > 100) & (allArrays['BAND2x1k'] > 200)) & (
-        allArrays['BAND7x1k'] > 120) & (invalidMask == 0)] = 1
+    sgTest9 = (thetaG < 8) & (allArrays['BAND1x1k'][fireCrds] > 100) & (allArrays['BAND2x1k'][fireCrds] > 200) & (
+      allArrays['BAND7x1k'][fireCrds] > 120)
 
-    # Sun glint test 10 (Giglio 2003, section 2.2.6)
-    waterLoc = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      waterLoc[(potFire == 1) & (waterMask == waterFlag)] = 1
-    nWaterAdj = ndimage.generic_filter(waterLoc, adj, size=3)
-    nRejectedWater = runFilt(waterMask, nRejectWaterFilt, minKsize, maxKsize)
-    with np.errstate(invalid='ignore'):
-      nRejectedWater[(potFire == 1) & (nRejectedWater < 0) & (invalidMask == 0)] = 0
+  # Sun glint test 10 (Giglio 2003, section 2.2.6)
+  nWaterAdj = adjCount(potFire & (waterMask == waterFlag), fireCrds)
+  nRejectedWater = memoStage(memo, ('nRejectWater', minKsize, maxKsize), runFilt, waterMask, nRejectWaterFilt,
+                             minKsize, maxKsize)[fireCrds]
+  nRejectedWater[nRejectedWater < 0] = 0
 
-    sgTest10 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      sgTest10[(potFire == 1) & ((thetaG < 12) & ((nWaterAdj + nRejectedWater) > 0)) & (invalidMask == 0)] = 1
+  with np.errstate(invalid='ignore'):
+    sgTest10 = (thetaG < 12) & ((nWaterAdj + nRejectedWater) > 0)
 
-    sgAll = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      sgAll[(sgTest8 == 1) | (sgTest9 == 1) | (sgTest10 == 1)] = 1
+  fires = filterCandidates(fires, ~(sgTest8 | sgTest9 | sgTest10), "sun glint rejection", verbose)
+  if fires is None:
+    return makeDetections()
 
-    # Desert boundary rejection (Giglio 2003, section 2.2.7)
-    nValid = runFilt(b22bgMask, nValidFilt, minKsize, maxKsize)
-    nRejectedBG = runFilt(bgMask, nRejectBGfireFilt, minKsize, maxKsize)
+  # Desert boundary rejection (Giglio 2003, section 2.2.7)
+  fireCrds = (fires['row'], fires['col'])
+  fires['nValid'] = memoStage(memo, ('nValid', reductionFactor, minKsize, maxKsize), runFilt, b22bgMask, nValidFilt,
+                              minKsize, maxKsize)[fireCrds]
+  nRejectedBG = memoStage(memo, ('nRejectBG', reductionFactor, minKsize, maxKsize), runFilt, bgMask,
+                          nRejectBGfireFilt, minKsize, maxKsize)[fireCrds]
+  nRejectedBG[nRejectedBG < 0] = 0
 
-    with np.errstate(invalid='ignore'):
-      nRejectedBG[(potFire == 1) & (nRejectedBG < 0) & (invalidMask == 0)] = 0
+  with np.errstate(invalid='ignore'):
 
     # Desert boundary test 11 (Giglio 2003, section 2.2.7)
-    dbTest11 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest11[(potFire == 1) & ((nRejectedBG > (0.1 * nValid))) & (invalidMask == 0)] = 1
+    dbTest11 = nRejectedBG > (0.1 * fires['nValid'])
 
     # Desert boundary test 12 (Giglio 2003, section 2.2.7)
-    dbTest12 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest12[(potFire == 1) & (nRejectedBG >= 4) & (invalidMask == 0)] = 1
+    dbTest12 = nRejectedBG >= 4
 
     # Desert boundary test 13 (Giglio 2003, section 2.2.7)
-    dbTest13 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest13[(potFire == 1) & (allArrays['BAND2x1k'] > 150) & (invalidMask == 0)] = 1
+    dbTest13 = allArrays['BAND2x1k'][fireCrds] > 150
 
     # Desert boundary test 14 (Giglio 2003, section 2.2.7)
-    dbTest14 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest14[(potFire == 1) & (b22rejMeanFilt < 345) & (invalidMask == 0)] = 1
+    dbTest14 = fires['b22rejMeanFilt'] < 345
 
     # Desert boundary test 15 (Giglio 2003, section 2.2.7)
-    dbTest15 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest15[(potFire == 1) & (b22rejMADfilt < 3) & (invalidMask == 0)] = 1
+    dbTest15 = fires['b22rejMADfilt'] < 3
 
     # Desert boundary test 16 (Giglio 2003, section 2.2.7)
-    dbTest16 = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      dbTest16[(potFire == 1) & (b22CloudWaterMasked < (b22rejMeanFilt + (6 * b22rejMADfilt))) & (invalidMask == 0)] = 1
+    dbTest16 = fires['b22CloudWaterMasked'] < (fires['b22rejMeanFilt'] + (6 * fires['b22rejMADfilt']))
+
+  # Reject anything that fulfills desert boundary criteria
+  dbAll = dbTest11 & dbTest12 & dbTest13 & dbTest14 & dbTest15 & dbTest16
+
+  fires = filterCandidates(fires, ~dbAll, "desert boundary rejection", verbose)
+  if fires is None:
+    return makeDetections()
+
+  # Coastal false alarm rejection (Giglio 2003, Section 2.2.8)
+  unmaskedWater = memoStage(memo, ('unmaskedWater', reductionFactor), unmaskedWaterBand, allArrays, potFire, bgMask)
+
+  fireCrds = (fires['row'], fires['col'])
+  Nuw = memoStage(memo, ('nUnmaskedWater', reductionFactor, minKsize, maxKsize), runFilt, unmaskedWater,
+                  nUnmaskedWaterFilt, minKsize, maxKsize)[fireCrds]
+  rejUnmaskedWater = ~fires['test1'] & (Nuw > 0)
+
+  fires = filterCandidates(fires, ~rejUnmaskedWater, "coastal false alarm rejection", verbose)
+  if fires is None:
+    return makeDetections()
+
+  # Calculate Fire Radiative Power (FRP) for the detected fires
+  fireCrds = (fires['row'], fires['col'])
+  b22maskEXP = np.power(fires['b22'], 8)
+  b22bgEXP = np.power(fires['b22meanFilt'].astype(np.float64), 8)
+
+  frpMW = (4.34 * (math.pow(10, -19))) * (b22maskEXP - b22bgEXP)
+
+  # Detection confidence (Giglio 2003, Section 2.3)
+  nCloudAdj = adjCount(cloudMask == cloudFlag, fireCrds)
+  nWaterAdj = adjCount(waterMask == waterFlag, fireCrds)
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+
+    # Fire detection confidence test 17
+    z4 = (fires['b22CloudWaterMasked'] - fires['b22meanFilt']) / fires['b22MADfilt']
+
+    # Fire detection confidence test 18
+    zDeltaT = (deltaTbgMask[fireCrds] - fires['deltaTmeanFilt']) / fires['deltaTMADFilt']
+
+  # Fire detection confidence tests 19 to 23
+  detnConf = confidence.detectionConfidence(b22bgMask[fireCrds], z4, zDeltaT, nCloudAdj, nWaterAdj, fires['dayFlag'],
+                                            legacy=legacyConfidence)
+
+  return makeDetections([
+    fires['row'] + origin[0],  # line
+    fires['col'] + origin[1],  # sample
+    allArrays['LAT'][fireCrds],
+    allArrays['LON'][fireCrds],
+    fires['b22'],
+    fires['b31'],
+    fires['b22meanFilt'],
+    fires['b31meanFilt'],
+    fires['deltaTmeanFilt'],
+    fires['b22MADfilt'],
+    fires['b31MADfilt'],
+    fires['deltaTMADFilt'],
+    frpMW,
+    nCloudAdj,
+    nWaterAdj,
+    fires['nValid'],
+    detnConf * 100
+  ])
 
-    # Reject anything that fulfills desert boundary criteria
-    dbAll = dbTest11 * dbTest12 * dbTest13 * dbTest14 * dbTest15 * dbTest16
 
-    # Coastal false alarm rejection (Giglio 2003, Section 2.2.8)
-    with np.errstate(invalid='ignore'):
-      ndvi = (allArrays['BAND2x1k'] - allArrays['BAND1x1k']) / (allArrays['BAND2x1k'] + allArrays['BAND1x1k'])
-    unmaskedWater = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      unmaskedWater[(potFire == 1) & ((ndvi < 0) & (allArrays['BAND7x1k'] < 50) & (allArrays['BAND2x1k'] < 150))] = -6
-      unmaskedWater[(potFire == 1) & (bgMask == bgFlag)] = bgFlag
-    Nuw = runFilt(unmaskedWater, nUnmaskedWaterFilt, minKsize, maxKsize)
-    rejUnmaskedWater = np.zeros((nRows, nCols), dtype=np.int)
-    with np.errstate(invalid='ignore'):
-      rejUnmaskedWater[(potFire == 1) & ((test1 == 0) & (Nuw > 0)) & (invalidMask == 0)] = 1
-
-    # Combine all masks
-    allFires = dayFires + nightFires  # All potential fires
-    with np.errstate(invalid='ignore'):  # Reject sun glint, desert boundary, coastal false alarms
-      allFires[(sgAll == 1) | (dbAll == 1) | (rejUnmaskedWater == 1)] = 0
-
-    # If any fires have been detected, calculate Fire Radiative Power (FRP)
-    if np.max(allFires) > 0:
-
-      b22firesAllMask = allFires * allArrays['BAND22']
-      b22bgAllMask = allFires * b22meanFilt
-
-      b22maskEXP = np.power(b22firesAllMask, 8)
-      b22bgEXP = np.power(b22bgAllMask, 8)
-
-      frpMW = (4.34 * (math.pow(10, -19))) * (b22maskEXP - b22bgEXP)
-
-      # Detection confidence (Giglio 2003, Section 2.3)
-      cloudLoc = np.zeros((nRows, nCols), dtype=np.int)
-      with np.errstate(invalid='ignore'):
-        cloudLoc[cloudMask == cloudFlag] = 1
-      nCloudAdj = ndimage.generic_filter(cloudLoc, adj, size=3)
-
-      waterLoc = np.zeros((nRows, nCols), dtype=np.int)
-      with np.errstate(invalid='ignore'):
-        waterLoc[waterMask == waterFlag] = 1
-      nWaterAdj = ndimage.generic_filter(waterLoc, adj, size=3)
-
-      # Fire detection confidence test 17
-      z4 = b22minusBG / b22MADfilt
-
-      # Fire detection confidence test 18
-      zDeltaT = (deltaTbgMask - deltaTmeanFilt) / deltaTMADFilt
-
-      with np.errstate(invalid='ignore'):
-        firesNclouds = nCloudAdj[(allFires == 1)]
-        firesZ4 = z4[(allFires == 1)]
-        firesZdeltaT = zDeltaT[(allFires == 1)]
-        firesB22bgMask = b22bgMask[(allFires == 1)]
-        firesNwater = nWaterAdj[(allFires == 1)]
-        firesDayFlag = dayFlag[(allFires == 1)]
-
-      # Fire detection confidence test 19
-      C1day = rampFn(firesB22bgMask, 310, 340)
-      C1night = rampFn(firesB22bgMask, 305, 320)
-
-      # Fire detection confidence test 20
-      C2 = rampFn(firesZ4, 2.5, 6)
-
-      # Fire detection confidence test 21
-      C3 = rampFn(firesZdeltaT, 3, 6)
-
-      # Fire detection confidence test 22 - not used for night fires
-      C4 = 1 - rampFn(firesNclouds, 0, 6)  # zero adjacent clouds = zero confidence
-
-      # Fire detection confidence test 23 - not used for night fires
-      C5 = 1 - rampFn(firesNwater, 0, 6)
-
-      # Detection confidence for the daytime
-      confArrayDay = np.row_stack((C1day, C2, C3, C4, C5))
-      detnConfDay = gmean(confArrayDay, axis=0)
-
-      # Detection confidence for the nighttime
-      confArrayNight = np.row_stack((C1night, C2, C3))
-      detnConfNight = gmean(confArrayNight, axis=0)
-
-      # Detection confidence for both day and night
-      detnConf = np.zeros_like(detnConfDay, dtype=np.float)
-      detnConf[firesDayFlag == 1] = detnConfDay[firesDayFlag == 1]
-      detnConf[firesDayFlag == 0] = detnConfNight[firesDayFlag == 0]
-
-      with np.errstate(invalid='ignore'):
-        FRPx = np.where((allFires == 1))[1]
-        FRPsample = FRPx + min1
-        FRPy = np.where((allFires == 1))[0]
-        FRPline = FRPy + min0
-        FRPlats = allArrays['LAT'][(allFires == 1)]
-        FRPlons = allArrays['LON'][(allFires == 1)]
-        FRPT21 = allArrays['BAND22'][(allFires == 1)]
-        FRPT31 = allArrays['BAND31'][(allFires == 1)]
-        FRPMeanT21 = b22meanFilt[(allFires == 1)]
-        FRPMeanT31 = b31meanFilt[(allFires == 1)]
-        FRPMeanDT = deltaTmeanFilt[(allFires == 1)]
-        FRPMADT21 = b22MADfilt[(allFires == 1)]
-        FRPMADT31 = b31MADfilt[(allFires == 1)]
-        FRP_MAD_DT = deltaTMADFilt[(allFires == 1)]
-        FRP_AdjCloud = nCloudAdj[(allFires == 1)]
-        FRP_AdjWater = nWaterAdj[(allFires == 1)]
-        FRP_NumValid = nValid[(allFires == 1)]
-        FRP_confidence = detnConf * 100
-        FRPpower = frpMW[(allFires == 1)]
-
-      exportCSV = np.column_stack(
-        [FRPline, FRPsample, FRPlats, FRPlons, FRPT21, FRPT31, FRPMeanT21, FRPMeanT31, FRPMeanDT, FRPMADT21, FRPMADT31,
-         FRP_MAD_DT, FRPpower, FRP_AdjCloud, FRP_AdjWater, FRP_NumValid, FRP_confidence])
-
-      exportCSV = [x for x in exportCSV if -4 not in x]
-
-      if len(exportCSV) > 0:
-
-        hdr = '"FRPline",' \
-              '"FRPsample",' \
-              '"FRPlats",' \
-              '"FRPlons",' \
-              '"FRPT21",' \
-              '"FRPT31",' \
-              '"FRPMeanT21",' \
-              '"FRPMeanT31",' \
-              '"FRPMeanDT",' \
-              '"FRPMADT21",' \
-              '"FRPMADT31",' \
-              '"FRP_MAD_DT",' \
-              '"FRPpower",' \
-              '"FRP_AdjCloud",' \
-              '"FRP_AdjWater",' \
-              '"FRP_NumValid",' \
-              '"FRP_confidence"'
-        os.chdir(cwd)
-        np.savetxt(
-          filMOD02.replace('hdf', '') + "csv", exportCSV, delimiter=",", header=hdr,
-          fmt=[
-            "%d", # line
-            "%d", # sample
-            "%.5f", # lats
-            "%.5f", # lons
-            "%.2f", # t21
-            "%.2f", # t31
-            "%.2f", # mean t21
-            "%.2f", # mean t31
-            "%.2f", # mean dt
-            "%.2f", # mad t21
-            "%.2f", # mad t31
-            "%.2f", # mad dt
-            "%." + str(decimal) + "f", # power
-            "%d", # cloud
-            "%d", # water
-            "%d", # valid
-            "%.2f" # conf
-          ]
-        )
-        os.chdir(directory)
-
-# HDFs
-cwd = os.getcwd()
-os.chdir(args.directory)
-HDF03 = [hdf for hdf in os.listdir('.') if ".hdf" in hdf and "D03" in hdf]
-HDF02 = [hdf for hdf in os.listdir('.') if ".hdf" in hdf and "D02" in hdf]
-[process(hdf02, args, cwd, args.directory) for hdf02 in HDF02]
-
-# End time
-end = time.time()
-
-if (args.verbose):
-  print("Execution time " + str(end - start))
+#
+# Builds the detections structure, an ordered dictionary of the CSV columns in DETECTION_COLUMNS order
+# Fires with a -4 (no background could be calculated) in any column are dropped, without columns there are no fires
+#
+def makeDetections(columns=None):
+  if columns is None:
+    columns = [np.zeros(0)] * len(DETECTION_COLUMNS)
+  keep = ~np.any(np.column_stack(columns) == -4, axis=1)
+  return collections.OrderedDict((name, np.asarray(values)[keep]) for name, values in zip(DETECTION_COLUMNS, columns))
+
+
+#
+# Joins the detections of several blocks, in the order given
+#
+def mergeDetections(blockDetections):
+  return collections.OrderedDict(
+    (name, np.concatenate([detections[name] for detections in blockDetections])) for name in DETECTION_COLUMNS)
+
+
+#
+# Keeps the fires of the detections selected by a mask
+#
+def selectDetections(detections, keep):
+  return collections.OrderedDict((name, values[keep]) for name, values in detections.items())
+
+
+#
+# Runs detectFires on row blocks of the area in parallel threads and joins their detections
+# Each block is padded with enough rows of context that its neighbourhoods see the same pixels as the whole area
+# would, the largest kernel sets the halo, so the detections are identical to detectFires on the whole area
+# The legacy confidence depends on the fire before, across the whole area, so it is always run as a single block
+#
+def detectFiresBlocks(allArrays, config, core=None, origin=(0, 0)):
+  return detectFiresSweep(allArrays, [config], core, origin)[0]
+
+
+#
+# Runs detectFires with every config on the same arrays, in row blocks as detectFiresBlocks does
+# The configs of a block share a memo, so stages such as the masks of a reduction factor or the background statistics
+# of a minimum kernel size are computed once for all configs with those parameters
+# Returns the detections of each config, in the order given
+#
+def detectFiresSweep(allArrays, configs, core=None, origin=(0, 0)):
+  [nRows, nCols] = np.shape(allArrays['BAND22'])
+  if core is None:
+    core = (0, nRows, 0, nCols)
+
+  def detectBlock(block):
+    memo = {} if len(configs) > 1 else None
+    return [detectFires(block[0], config, block[1], block[2], memo) for config in configs]
+
+  nBlocks = min(configs[0].blocks, core[1] - core[0])
+  if nBlocks <= 1 or any(config.legacyConfidence for config in configs):
+    return detectBlock((allArrays, core, origin))
+
+  halo = max(max(config.maximumKernel // 2, config.minimumKernel // 2, 1) for config in configs)
+  bounds = [core[0] + ((core[1] - core[0]) * i) // nBlocks for i in range(nBlocks + 1)]
+  blocks = []
+  for blockStart, blockEnd in zip(bounds[:-1], bounds[1:]):
+    tileStart = max(blockStart - halo, 0)
+    tileEnd = min(blockEnd + halo, nRows)
+    tileArrays = dict((name, band[tileStart:tileEnd]) for name, band in allArrays.items())
+    blocks.append((tileArrays, (blockStart - tileStart, blockEnd - tileStart, core[2], core[3]),
+                   (origin[0] + tileStart, origin[1])))
+
+  pool = multiprocessing.pool.ThreadPool(nBlocks)
+  try:
+    blockDetections = pool.map(detectBlock, blocks)
+  finally:
+    pool.close()
+  return [mergeDetections([detections[i] for detections in blockDetections]) for i in range(len(configs))]
+
+
+#
+# Writes the detections to a CSV file, the power is written with the given number of decimal places
+#
+def writeDetections(detections, path, decimal):
+  hdr = ','.join('"' + name + '"' for name in detections)
+  np.savetxt(
+    path, np.column_stack(list(detections.values())), delimiter=",", header=hdr,
+    fmt=[
+      "%d", # line
+      "%d", # sample
+      "%.5f", # lats
+      "%.5f", # lons
+      "%.2f", # t21
+      "%.2f", # t31
+      "%.2f", # mean t21
+      "%.2f", # mean t31
+      "%.2f", # mean dt
+      "%.2f", # mad t21
+      "%.2f", # mad t31
+      "%.2f", # mad dt
+      "%." + str(decimal) + "f", # power
+      "%d", # cloud
+      "%d", # water
+      "%d", # valid
+      "%.2f" # conf
+    ]
+  )
+
+
+#
+# Returns a detection config with the default value of every command line argument, validated after applying any
+# overrides given by argument name, e.g. makeConfig(minimumLatitude=60, maximumKernel=15)
+#
+def makeConfig(**overrides):
+  config = buildParser().parse_args([])
+  for name, value in overrides.items():
+    if not hasattr(config, name):
+      raise TypeError("Unknown config argument " + name)
+    setattr(config, name, value)
+  return validateArgs(config)
+
+
+#
+# Main function for processing HDFs
+# Reads the HDF02/HDF03 pair, writes any detected fires to a CSV in outputDirectory and returns the number of fires
+# Pairs are first checked against the footprint index if one is given, see loadGranule
+#
+def process(filMOD02, filMOD03, config, outputDirectory, footprintIndex=None):
+  granule = loadGranule(filMOD02, filMOD03, config, footprintIndex)
+  if granule is None:
+    return 0
+
+  allArrays, core, origin = granule
+  return processArrays(filMOD02, allArrays, core, origin, config, outputDirectory)
+
+
+#
+# Detects the fires in the arrays read from a HDF02, writes them to a CSV in outputDirectory and returns their number
+# The fires of each area of an area file and of each configuration of a sweep are written to a directory named after
+# it, in that order, and their numbers summed
+#
+def processArrays(filMOD02, allArrays, core, origin, config, outputDirectory):
+  csvName = os.path.basename(filMOD02).replace('hdf', '') + "csv"
+  configs = detectionConfigs(config)
+  sweepNames = [name for name, sweepConfig in config.sweepConfigs]
+
+  # Fires are detected once over every area in the swath and then split between the areas, each area keeps the fires
+  # that a run with its own bounding co-ordinates would report, within its polygon if it has one
+  areaCores = []
+  for area in config.areas:
+    areaCore = aoi.areaCore(allArrays['LAT'], allArrays['LON'], area)
+    if areaCore is not None:
+      areaCores.append((area, areaCore))
+  if config.areas:
+    if not areaCores:
+      return 0
+    core = (min(areaCore[0] for area, areaCore in areaCores), max(areaCore[1] for area, areaCore in areaCores),
+            min(areaCore[2] for area, areaCore in areaCores), max(areaCore[3] for area, areaCore in areaCores))
+
+  outputs = []
+  for i, detections in enumerate(detectFiresSweep(allArrays, configs, core, origin)):
+    sweepName = sweepNames[i:i + 1]
+    if not config.areas:
+      outputs.append((os.path.join(outputDirectory, *sweepName), configs[i], detections))
+    for area, areaCore in areaCores:
+      line = detections['FRPline'] - origin[0]
+      sample = detections['FRPsample'] - origin[1]
+      keep = (areaCore[0] <= line) & (line < areaCore[1]) & (areaCore[2] <= sample) & (sample < areaCore[3])
+      if area.polygon is not None:
+        keep &= aoi.inPolygon(detections['FRPlats'], detections['FRPlons'], area.polygon)
+      outputs.append((os.path.join(outputDirectory, area.name, *sweepName), configs[i],
+                      selectDetections(detections, keep)))
+
+  nFires = 0
+  for directory, outputConfig, detections in outputs:
+    if len(detections['FRPline']) > 0:
+      if not os.path.isdir(directory):
+        try:
+          os.makedirs(directory)
+        except OSError:
+
+          # Another worker created it first
+          if not os.path.isdir(directory):
+            raise
+      writeDetections(detections, os.path.join(directory, csvName), outputConfig.decimal)
+    nFires += len(detections['FRPline'])
+
+  return nFires
+
+
+#
+# Processes a single HDF pair, catching any failure so that one bad HDF cannot stop the batch
+# Returns the HDF02, the number of fires detected and the error if processing failed
+#
+def processPair(pair):
+  filMOD02, filMOD03, commandLineArgs, outputDirectory = pair
+  try:
+    return filMOD02, process(filMOD02, filMOD03, commandLineArgs, outputDirectory,
+                             commandLineArgs.footprintIndex), None
+  except Exception as e:
+    return filMOD02, None, type(e).__name__ + ": " + str(e)
+
+
+#
+# Reads a HDF pair in a prefetching reader process
+# Returns the arrays and their (core, origin), or no arrays if the area is not in the swath
+#
+def readPair(pair):
+  filMOD02, filMOD03, config, outputDirectory = pair
+  granule = loadGranule(filMOD02, filMOD03, config, config.footprintIndex)
+  if granule is None:
+    return None, None
+  allArrays, core, origin = granule
+  return allArrays, (core, origin)
+
+
+#
+# Detects the fires of a HDF pair read by readPair in a prefetching worker process, returns the number of fires
+#
+def computePair(pair, allArrays, meta):
+  filMOD02, filMOD03, config, outputDirectory = pair
+  if allArrays is None:
+    return 0
+  core, origin = meta
+  return processArrays(filMOD02, allArrays, core, origin, config, outputDirectory)
+
+
+#
+# Downloads the orders given by the arguments to their directory in a background thread, only the pairs intersecting
+# the area, and yields each pair as soon as both of its HDFs have arrived and been verified, so that detection starts
+# on the first pairs while the rest are downloading
+# Once every pair has been yielded downloads holds the number of pairs that failed to download under 'nFailed', or
+# the error under 'error' if the orders could not be downloaded at all
+#
+def streamOrders(args, outputDirectory, downloads):
+  if hdf_ftp is None:
+    raise RuntimeError("Downloading orders needs pycurl")
+
+  arrived = queue.Queue()
+
+  def download():
+    try:
+      downloads['nFailed'] = hdf_ftp.main(
+        args.orders, 0, args.verbose, args.connections, args.host or hdf_ftp.DEF_HOST,
+        bbox=(args.minimumLatitude, args.maximumLatitude, args.minimumLongitude, args.maximumLongitude),
+        directory=args.directory, onPair=lambda hdf02, hdf03: arrived.put((hdf02, hdf03)))
+    except Exception as e:
+      downloads['error'] = type(e).__name__ + ": " + str(e)
+    finally:
+      arrived.put(None)
+
+  downloader = threading.Thread(target=download)
+  downloader.daemon = True
+  downloader.start()
+  for hdf02, hdf03 in iter(arrived.get, None):
+    yield hdf02, hdf03, args, outputDirectory
+  downloader.join()
+
+
+#
+# Command line entry point, processes every HDF pair in the directory given by the arguments
+# With orders the pairs are processed as they are downloaded instead
+# Returns the exit status, non-zero if any pair failed to process, the orders could not be downloaded or some of their
+# pairs failed to download
+#
+def main(argv=None):
+
+  # Start time
+  start = time.time()
+
+  args = validateArgs(buildParser().parse_args(argv))
+
+  # Verbose output configured settings
+  if args.verbose:
+    print("Minimum latitude set to", args.minimumLatitude)
+    print("Maximum latitude set to", args.maximumLatitude)
+    print("Minimum longitude set to", args.minimumLongitude)
+    print("Maximum longitude set to", args.maximumLongitude)
+    print("Reduction factor set to", args.reductionFactor)
+    print("Minimum kernel size set to", args.minimumKernel)
+    print("Maximum kernel size set to", args.maximumKernel)
+    print("Window observation count set to", args.windowObservations)
+    print("Valid fraction of observations set to", args.validFraction)
+    print("Decimal output set to", args.decimal)
+    print("HDF loading directory set to", args.directory)
+    print("Footprint index set to", args.footprintIndex)
+    print("Worker count set to", args.workers)
+    print("Thread count set to", args.threads)
+    print("Row block count set to", args.blocks)
+    print("Prefetch depth set to", args.prefetch)
+    print("Reader count set to", args.readers)
+    print("Orders set to", args.orders)
+    print("Connection count set to", args.connections)
+    print("Granule cache set to", args.cacheDir)
+    print("Granule cache size set to", args.cacheSize)
+    print("Area file set to", args.areaFile)
+    for area in args.areas:
+      print("Area " + area.name + ": " + str(area.minLat) + " to " + str(area.maxLat) + " latitude, " + str(
+        area.minLon) + " to " + str(area.maxLon) + " longitude" + (" within a polygon" if area.polygon else ""))
+    print("Sweep set to", args.sweep)
+    for name, sweepConfig in args.sweepConfigs:
+      print("Sweep configuration " + name + ": " + ", ".join(
+        argName + "=" + str(getattr(sweepConfig, argName)) for argName in SWEEP_ARGUMENTS))
+
+  # Orders are downloaded to the directory, it is created first so that the footprint index can be opened in it
+  if args.orders and not os.path.isdir(args.directory):
+    os.makedirs(args.directory)
+
+  # An index that cannot be opened, e.g. in a read-only HDF directory, is disabled here rather than in every worker
+  if args.footprintIndex:
+    try:
+      footprints.openIndex(args.footprintIndex).close()
+    except sqlite3.Error as e:
+      disableFootprintIndex(args.footprintIndex, e)
+      args.footprintIndex = ""
+
+  # HDFs
+  cwd = os.getcwd()
+
+  # The downloader already skips the pairs outside the area by their footprints
+  downloads = {}
+  if args.orders:
+    pairs = streamOrders(args, cwd, downloads)
+  else:
+
+    # Pair every HDF02 with its HDF03 - we don't process a solitary HDF02
+    hdfPairs, solitary = catalog.pairGranules(os.listdir(args.directory))
+    if args.verbose:
+      for hdf02 in solitary:
+        print("No HDF03 found for " + hdf02 + ", skipping")
+    pairs = [(os.path.join(args.directory, hdf02), os.path.join(args.directory, hdf03), args, cwd)
+             for hdf02, hdf03 in hdfPairs]
+
+  # Spread the pairs across a pool of worker processes, or of threads within this process, results are streamed back
+  # as they complete. Each pair is checked against the footprint index by the worker that loads it. Threads overlap
+  # the HDF decoding of one pair with the NumPy work on another, which both release the GIL, without the memory of a
+  # copy of the interpreter per worker
+  processStart = time.time()
+  pool = None
+  if args.prefetch > 0:
+
+    # Reader processes decode the next pairs into shared memory while the worker processes detect fires
+    results = ((pair[0], nFires, error) for pair, nFires, error in pipeline.run(
+      pairs, readPair, computePair, args.readers, args.workers, args.prefetch))
+  elif args.workers > 1:
+    pool = multiprocessing.Pool(args.workers)
+    results = pool.imap_unordered(processPair, pairs)
+  elif args.threads > 1:
+    pool = multiprocessing.pool.ThreadPool(args.threads)
+    results = pool.imap_unordered(processPair, pairs)
+  else:
+    results = (processPair(pair) for pair in pairs)
+
+  nProcessed = 0
+  nFailed = 0
+  for filMOD02, nFires, error in results:
+    nProcessed += 1
+    if error is not None:
+      nFailed += 1
+      print("Failed to process " + filMOD02 + " - " + error)
+    elif args.verbose:
+      print("Processed " + filMOD02 + ", " + str(nFires) + " fires detected")
+
+  if pool is not None:
+    pool.close()
+    pool.join()
+
+  status = 0
+  if 'error' in downloads:
+    print("Failed to download the orders - " + downloads['error'])
+    status = 1
+  elif downloads.get('nFailed'):
+    print(str(downloads['nFailed']) + " pairs failed to download - please rerun to download them")
+    status = 1
+
+  if nFailed > 0:
+    status = 1
+
+  # End time
+  end = time.time()
+
+  print("Processed " + str(nProcessed) + " granules (" + str(nFailed) + " failed) at " + str(
+    nProcessed / max(end - processStart, 1e-9)) + " granules/s")
+  if (args.verbose):
+    print("Execution time " + str(end - start))
+
+  return status
+
+
+# We are running from the command line
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+import numpy as np
+import cksum
+
+# Name of the cache index, kept in the cache directory next to the entries
+INDEX_NAME = "index.sqlite"
+
+# Name of the metadata file of an entry
+META_NAME = "meta.json"
+
+#
+# On-disk cache of arrays, e.g. the calibrated bands of a granule clipped to an area. Every entry is a directory of
+# .npy files that are memory-mapped when loaded, so a cached granule is read straight from the page cache. Entries
+# are keyed by the checksums of the files they were read from plus any parameters, and the least recently used
+# entries are evicted once the cache grows beyond its maximum size.
+#
+
+
+#
+# Opens the cache in the given directory, creating it if it does not exist yet
+#
+def openCache(directory):
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  conn = sqlite3.connect(os.path.join(directory, INDEX_NAME), timeout=60)
+  conn.execute(
+    "CREATE TABLE IF NOT EXISTS checksums (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, checksum TEXT)")
+  conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, bytes INTEGER, lastUsed REAL)")
+  conn.commit()
+  return conn
+
+
+#
+# Returns the CRC32 checksum of a file's content as hex
+# Checksums are stored in the index and only recalculated when the file has changed since
+#
+def fileChecksum(conn, path):
+  path = os.path.abspath(path)
+  stat = os.stat(path)
+
+  row = conn.execute("SELECT mtime, size, checksum FROM checksums WHERE path = ?", (path,)).fetchone()
+  if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+    return row[2]
+
+  crc = 0
+  for chunk in cksum.readChunks(path):
+    crc = zlib.crc32(chunk, crc)
+  checksum = "%08x" % (crc & 0xffffffff)
+
+  conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?)", (path, stat.st_mtime, stat.st_size, checksum))
+  conn.commit()
+  return checksum
+
+
+#
+# Returns the key of the entry read from the given files with the given (JSON serialisable) parameters
+#
+def entryKey(conn, paths, params):
+  checksums = [fileChecksum(conn, path) for path in paths]
+  return hashlib.sha1(json.dumps([checksums, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+#
+# Loads an entry from the cache
+# Returns the dictionary of memory-mapped (read only) arrays and the metadata, or None if the entry is not cached
+#
+def load(conn, directory, key):
+  entryDir = os.path.join(directory, key)
+  try:
+    with open(os.path.join(entryDir, META_NAME)) as f:
+      entry = json.load(f)
+    arrays = {}
+    for name in entry['arrays']:
+      arrays[name] = np.load(os.path.join(entryDir, name + ".npy"), mmap_mode='r')
+  except (IOError, OSError, ValueError):
+    return None
+
+  conn.execute("UPDATE entries SET lastUsed = ? WHERE key = ?", (time.time(), key))
+  conn.commit()
+  return arrays, entry['meta']
+
+
+#
+# Stores an entry in the cache and evicts the least recently used entries until it is within maxBytes
+# The metadata must be JSON serialisable, arrays may be None for entries that only hold metadata
+#
+def store(conn, directory, key, arrays, meta, maxBytes):
+  arrays = arrays or {}
+
+  # Write the entry next to its final location and move it there in one step, so that readers never see part of it
+  tmpDir = tempfile.mkdtemp(prefix=key + ".", dir=directory)
+  nBytes = 0
+  for name, array in arrays.items():
+    np.save(os.path.join(tmpDir, name + ".npy"), array)
+    nBytes += os.path.getsize(os.path.join(tmpDir, name + ".npy"))
+  with open(os.path.join(tmpDir, META_NAME), 'w') as f:
+    json.dump({'arrays': sorted(arrays), 'meta': meta}, f)
+
+  try:
+    os.rename(tmpDir, os.path.join(directory, key))
+  except OSError:
+
+    # Another process stored the same entry first
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    return
+
+  conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, nBytes, time.time()))
+  conn.commit()
+  evict(conn, directory, maxBytes)
+
+
+#
+# Removes the least recently used entries until the cache is within maxBytes
+#
+def evict(conn, directory, maxBytes):
+  total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+  for key, nBytes in conn.execute("SELECT key, bytes FROM entries ORDER BY lastUsed").fetchall():
+    if total <= maxBytes:
+      break
+    shutil.rmtree(os.path.join(directory, key), ignore_errors=True)
+    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+    total -= nBytes
+  conn.commit()
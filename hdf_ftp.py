@@ -3,104 +3,285 @@
 import argparse
 import pycurl
 import os.path
+import sys
+import threading
+import time
+import multiprocessing.pool
 from io import BytesIO
-import datetime
+import catalog
+import cksum
 
-def main(order, downloadLimit, verbose):
+# FTP directory holding the orders default
+DEF_HOST = "ftp://ladsweb.nascom.nasa.gov/orders/"
 
-  if verbose:
-    print("Connecting to order " + order)
+# Concurrent connection count default, minimum and maximum
+DEF_CONNECTIONS = 1
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 32
+
+# Retries of a failed transfer default, minimum and maximum
+DEF_RETRIES = 5
+MIN_RETRIES = 0
+MAX_RETRIES = 100
+
+# Delay before the first retry of a transfer in seconds, doubled for every further retry up to the maximum
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 120
+
+# Suffix of a file while it is downloaded, it is only given its own name once complete
+PART_SUFFIX = ".part"
+
+# Words in the name of an order's checksum file, which lists the POSIX cksum of each HDF in the order
+CHECKSUM_NAMES = ("checksum", "cksum")
+
+# Curl handle of each download thread, reused for every file so that its connection to the host stays open
+_connection = threading.local()
+
+# Serialises the progress output of the download threads
+_outputLock = threading.Lock()
+
+
+#
+# Prints a line of progress output, whole, even while other download threads are printing
+#
+def report(message):
+  with _outputLock:
+    sys.stdout.write(message + "\n")
+
+
+#
+# Returns the curl handle of the calling thread, creating it on first use
+#
+def connection():
+  curl = getattr(_connection, 'curl', None)
+  if curl is None:
+    curl = pycurl.Curl()
 
-  # Build the ftp host with the order id
-  host = "ftp://ladsweb.nascom.nasa.gov/orders/" + order + "/"
+    # Signals cannot be used for timeouts outside the main thread
+    curl.setopt(pycurl.NOSIGNAL, 1)
+    _connection.curl = curl
+  return curl
 
-  # Initiate curl
-  c = pycurl.Curl()
-  c.setopt(pycurl.URL, host)
 
-  # String output buffer for curl return
+#
+# Lists an order directory on the host
+# Returns the ordered dictionary of file sizes keyed by name
+#
+def listOrder(url):
+  curl = connection()
   output = BytesIO()
-  c.setopt(pycurl.WRITEFUNCTION, output.write)
-
-  # Execute curl and get the order from the output buffer
-  c.perform()
-  order = output.getvalue().decode('UTF-8').split()
-
-  dlCount = 0
-
-  # Let's get a list of both the HDF03s and HDF02s
-  HDF03 = [hdf for hdf in order if ".hdf" in hdf and "D03" in hdf]
-  HDF02 = [hdf for hdf in order if ".hdf" in hdf and "D02" in hdf]
-
-  # Download all HDF02s with the corresponding HDF03s if they exist
-  for hdf02 in HDF02:
-
-    # Parse the HDF02 in order to get the corresponding HDF03
-    filSplt = hdf02.split('.')
-    datTim = filSplt[1].replace('A', '') + filSplt[2]
-    t = datetime.datetime.strptime(datTim, "%Y%j%H%M")
-
-    julianDay = str(t.timetuple().tm_yday)
-    jZeros = 3 - len(julianDay)
-    julianDay = '0' * jZeros + julianDay
-    yr = str(t.year)
-    hr = str(t.hour)
-    hrZeros = 2 - len(hr)
-    hr = '0' * hrZeros + hr
-    mint = str(t.minute)
-    mintZeros = 2 - len(mint)
-    mint = '0' * mintZeros + mint
-    datNam = yr + julianDay + '.' + hr + mint
-
-    # Check to see if the HDF03 exists in the HDF03 list
-    for filNamCandidate in HDF03:
-      if datNam in filNamCandidate:
-        hdf03 = filNamCandidate
-        break
-
-    # Both a HDF02 and HDF03 have been found
-    if hdf03:
-      if os.path.exists(hdf02) and int(order[order.index(hdf02) - 4]) == os.path.getsize(hdf02):
-        if verbose:
-          print("Skipping download of " + hdf02)
-      else:
-        if verbose:
-          print("Attempting download of " + hdf02)
-        fp = open(os.path.join('.', hdf02), "wb")
-        curl = pycurl.Curl()
-        curl.setopt(pycurl.URL, host + hdf02)
-        curl.setopt(pycurl.WRITEDATA, fp)
-        curl.perform()
-        curl.close()
-        fp.close()
-        if verbose:
-          print("Successfully downloaded " + hdf02)
+  curl.setopt(pycurl.URL, url)
+  curl.setopt(pycurl.WRITEFUNCTION, output.write)
+  curl.perform()
+  return catalog.parseListing(output.getvalue().decode('UTF-8'))
+
+
+#
+# Downloads a file of the given size to path on the calling thread's connection
+# The file is written to a .part file that is renamed to path once complete, so path never holds part of a file.
+# A .part file left by an interrupted download is resumed from where it stopped, and a failed or short transfer is
+# resumed again after a delay that doubles with every retry
+# Returns the number of bytes transferred
+#
+def downloadFile(url, path, size, retries=DEF_RETRIES, verbose=False):
+  curl = connection()
+  partPath = path + PART_SUFFIX
+  nBytes = 0
+
+  for attempt in range(retries + 1):
+    offset = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+
+    # A part larger than the file cannot be from it
+    if offset > size:
+      os.remove(partPath)
+      offset = 0
+
+    # An empty file needs no transfer, its .part is created so that it is renamed like any other
+    if size == 0:
+      open(partPath, "ab").close()
+
+    error = None
+    if offset < size:
+      try:
+        with open(partPath, "ab") as fp:
+          curl.setopt(pycurl.URL, url)
+          curl.setopt(pycurl.WRITEFUNCTION, fp.write)
+          curl.setopt(pycurl.RESUME_FROM_LARGE, offset)
+          curl.perform()
+      except pycurl.error as e:
+        error = e
+      finally:
+        curl.setopt(pycurl.RESUME_FROM_LARGE, 0)
+      nBytes += os.path.getsize(partPath) - offset
+
+    if os.path.exists(partPath) and os.path.getsize(partPath) == size:
+      if os.path.exists(path):
+        os.remove(path)
+      os.rename(partPath, path)
+      return nBytes
 
-      if os.path.exists(hdf03) and int(order[order.index(hdf03) - 4]) == os.path.getsize(hdf03):
+    if error is None:
+      error = IOError("Downloaded " + str(os.path.getsize(partPath)) + " of " + str(size) + " bytes")
+    if attempt == retries:
+      raise error
+
+    delay = min(RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY)
+    if verbose:
+      report("Retrying download of " + os.path.basename(path) + " in " + str(delay) + " s - " + str(error))
+    time.sleep(delay)
+
+
+#
+# Finds the checksum file in the listing of an order, returns its name or None if the order has none
+#
+def checksumFile(sizes):
+  for name in sizes:
+    if not name.endswith(".hdf") and any(word in name.lower() for word in CHECKSUM_NAMES):
+      return name
+  return None
+
+
+#
+# Tests a downloaded HDF against the checksums of its order, a dictionary of (checksum, size) keyed by file name
+# HDFs the order has no checksum for pass, their size has already been checked against the listing
+#
+def verifyFile(path, checksums):
+  expected = checksums.get(os.path.basename(path))
+  return expected is None or cksum.posixChecksum(path) == expected
+
+
+#
+# Downloads the HDF03 and HDF02 of a pair that are not already complete in the download directory
+# Each HDF is verified against the checksums of the order, a HDF that does not match is removed so that it is
+# downloaded again, and the pair fails if the download does not match either
+# With a bounding box (minLat, maxLat, minLon, maxLon) the HDF02 is only downloaded if the footprint of the HDF03
+# intersects it, the footprint is stored in the footprint index of the download directory for frp.py to reuse
+# Returns the HDF02, the HDF03, the number of bytes transferred, whether the HDF02 was skipped as it is outside the
+# bounding box and the error if a download failed, any failure only fails the pair so that one bad pair cannot stop the
+# order
+#
+def downloadPair(task):
+  url, hdf02, hdf03, sizes, checksums, retries, bbox, directory, verbose = task
+  nBytes = 0
+  try:
+    for hdf in (hdf03, hdf02):
+      path = os.path.join(directory, hdf)
+      if hdf == hdf02 and bbox is not None:
+
+        # Reading footprints needs gdal, plain downloads only need pycurl
+        import footprints
+        conn = footprints.openIndex(os.path.join(directory, footprints.DEF_INDEX_NAME))
+        try:
+          bounds = footprints.footprint(conn, os.path.join(directory, hdf03))
+        finally:
+          conn.close()
+        if not footprints.intersects(bounds, *bbox):
+          if verbose:
+            report("Footprint of " + hdf03 + " is outside the area, skipping download of " + hdf02)
+          return hdf02, hdf03, nBytes, True, None
+
+      if os.path.exists(path) and sizes[hdf] == os.path.getsize(path) and verifyFile(path, checksums):
         if verbose:
-          print("Skipping download of " + hdf03)
+          report("Skipping download of " + hdf)
       else:
+        if os.path.exists(path):
+          os.remove(path)
         if verbose:
-          print("Attempting download of " + hdf03)
-        fp = open(os.path.join('.', hdf03), "wb")
-        curl = pycurl.Curl()
-        curl.setopt(pycurl.URL, host + hdf03)
-        curl.setopt(pycurl.WRITEDATA, fp)
-        curl.perform()
-        curl.close()
-        fp.close()
+          report("Attempting download of " + hdf)
+        nBytes += downloadFile(url + hdf, path, sizes[hdf], retries, verbose)
+        if not verifyFile(path, checksums):
+          os.remove(path)
+          raise IOError("Checksum of " + hdf + " does not match the order")
         if verbose:
-          print("Successfully downloaded " + hdf03)
+          report("Successfully downloaded " + hdf)
+  except Exception as e:
+    return hdf02, hdf03, nBytes, False, type(e).__name__ + ": " + str(e)
+  return hdf02, hdf03, nBytes, False, None
+
+
+#
+# Downloads every HDF pair of the orders to the directory
+# onPair(hdf02, hdf03) is called with the paths of each pair as soon as both of its files are complete, while the
+# later pairs are still downloading, e.g. to start processing the pair. Returns the number of pairs that failed
+#
+def main(orders, downloadLimit, verbose, connections=DEF_CONNECTIONS, host=DEF_HOST, retries=DEF_RETRIES,
+         bbox=None, directory=".", onPair=None):
 
-    dlCount += 1
+  # A single order can be given on its own
+  if not isinstance(orders, (list, tuple)):
+    orders = [orders]
 
-    if downloadLimit == dlCount:
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  retries = max(MIN_RETRIES, min(retries, MAX_RETRIES))
+
+  tasks = []
+  hdfSizes = {}
+  for order in orders:
+
+    if verbose:
+      report("Connecting to order " + order)
+
+    # Build the ftp url with the order id
+    url = host.rstrip('/') + "/" + order + "/"
+    sizes = listOrder(url)
+    hdfSizes.update(sizes)
+
+    # Fetch the checksum file of the order so that the HDFs can be verified, without one only sizes are checked
+    checksums = {}
+    checksumName = checksumFile(sizes)
+    if checksumName is not None:
+      checksumPath = os.path.join(directory, checksumName)
+      downloadFile(url + checksumName, checksumPath, sizes[checksumName], retries, verbose)
+      for vChecksum, vSize, vFile in cksum.readChecksumFile(checksumPath):
+        checksums[os.path.basename(vFile)] = (vChecksum, vSize)
+    elif verbose:
+      report("No checksum file found for order " + order + ", only file sizes are checked")
+
+    # Pair the HDF02s with their HDF03s
+    pairs, solitary = catalog.pairGranules(sizes.keys())
+
+    if 0 < downloadLimit < len(pairs):
+      pairs = pairs[:downloadLimit]
       if verbose:
-        print("HDF download limit reached")
-      break
+        report("HDF download limit reached")
+
+    tasks += [(url, hdf02, hdf03, sizes, checksums, retries, bbox, directory, verbose) for hdf02, hdf03 in pairs]
+
+  # Download all HDF02s with the corresponding HDF03s, several pairs at once on their own connections
+  # pycurl releases the GIL during a transfer so the threads download in parallel
+  start = time.time()
+  pool = multiprocessing.pool.ThreadPool(max(MIN_CONNECTIONS, min(connections, MAX_CONNECTIONS)))
+  totalBytes = 0
+  nFailed = 0
+  nSkipped = 0
+  skippedBytes = 0
+  for i, (hdf02, hdf03, nBytes, skipped, error) in enumerate(pool.imap_unordered(downloadPair, tasks)):
+    totalBytes += nBytes
+    if skipped:
+      nSkipped += 1
+      skippedBytes += hdfSizes[hdf02]
+    if error is not None:
+      nFailed += 1
+      report("Failed to download " + hdf02 + " - " + error)
+    elif not skipped and onPair is not None:
+      onPair(os.path.join(directory, hdf02), os.path.join(directory, hdf03))
+    if error is None and verbose:
+      report("Finished pair " + str(i + 1) + " of " + str(len(tasks)) + ", " + str(
+        round(totalBytes / 1048576.0, 1)) + " MB at " + str(
+        round(totalBytes / 1048576.0 / max(time.time() - start, 1e-9), 2)) + " MB/s")
+  pool.close()
+  pool.join()
 
   if verbose:
-    print("FTP download of order successful")
+    report("FTP download of " + str(len(tasks) - nFailed) + " of " + str(len(tasks)) + " pairs successful, " + str(
+      round(totalBytes / 1048576.0, 1)) + " MB in " + str(round(time.time() - start, 1)) + " s")
+    if bbox is not None:
+      report(str(nSkipped) + " HDF02s outside the area not downloaded, " + str(
+        round(skippedBytes / 1048576.0, 1)) + " MB")
+
+  return nFailed
 
 # We are running from the command line
 if __name__ == "__main__":
@@ -112,9 +293,32 @@ if __name__ == "__main__":
   parser.add_argument("ORDER", help="the data order id", type=str, nargs='+')
   # Max download count for HDFs
   parser.add_argument("-dl", "--downloadLimit", help="limit the amount of HDF file pairs to download", default=0, type=int)
+  # Concurrent connections
+  parser.add_argument("-c", "--connections",
+                      help="the number of files downloaded at once, each on its own connection default:" + str(
+                        DEF_CONNECTIONS) + " min:" + str(MIN_CONNECTIONS) + " max:" + str(MAX_CONNECTIONS),
+                      default=DEF_CONNECTIONS, type=int)
+  # FTP host
+  parser.add_argument("--host", help="the FTP directory holding the orders default:" + DEF_HOST, default=DEF_HOST,
+                      type=str)
+  # Retries of a failed transfer
+  parser.add_argument("-r", "--retries",
+                      help="the number of times a failed transfer is resumed default:" + str(DEF_RETRIES) + " min:" + str(
+                        MIN_RETRIES) + " max:" + str(MAX_RETRIES),
+                      default=DEF_RETRIES, type=int)
+  # Area of interest
+  parser.add_argument("--bbox",
+                      help="only download the HDF02s whose HDF03 footprint intersects the bounding co-ordinates, the "
+                           "HDF03s are downloaded first to check",
+                      nargs=4, metavar=("MINLAT", "MAXLAT", "MINLON", "MAXLON"), default=None, type=float)
+  # Download directory
+  parser.add_argument("-dir", "--directory", help="Set the directory to download the HDFs to default:.", default=".",
+                      type=str)
   # Verbosity output
   parser.add_argument("-v", "--verbose", help="turn on verbose output", action="store_true")
 
   args = parser.parse_args()
 
-  [main(order, args.downloadLimit, args.verbose) for order in args.ORDER]
+  # Exit with an error if any pair failed to download, so that a following command does not run on a partial order
+  sys.exit(1 if main(args.ORDER, args.downloadLimit, args.verbose, args.connections, args.host, args.retries,
+                     args.bbox, args.directory) else 0)
@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+import multiprocessing
+import queue
+import threading
+import numpy as np
+
+try:
+  from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+  resource_tracker = shared_memory = None
+
+# Seconds between checks that the processes are still alive while waiting for a result
+POLL_INTERVAL = 0.5
+
+# Seconds to wait for anything left on the queues of processes that have been stopped
+DRAIN_TIMEOUT = 0.1
+
+#
+# Prefetching pipeline, reader processes decode the next items into shared memory while compute processes work on
+# the items already read. A bounded queue between them sets how far the readers run ahead, so throughput approaches
+# the slower of reading and computing rather than their sum without holding more than a few items in memory.
+#
+
+
+#
+# Copies a dictionary of arrays into a single new shared memory block
+# Returns the block and the layout needed to attach to the arrays, a list of (name, dtype, shape, offset)
+#
+def shareArrays(arrays):
+  layout = []
+  size = 0
+  for name, array in arrays.items():
+    array = np.asarray(array)
+    size = (size + 63) // 64 * 64  # keep every array aligned
+    layout.append((name, array.dtype.str, array.shape, size))
+    size += array.nbytes
+
+  shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+  for name, dtype, shape, offset in layout:
+    view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    view[...] = arrays[name]
+  return shm, layout
+
+
+#
+# Attaches to the arrays of a shared memory block made by shareArrays
+# Returns the block and a dictionary of arrays backed by it, the arrays must be released before the block is closed
+#
+def attachArrays(name, layout):
+  shm = shared_memory.SharedMemory(name=name)
+  arrays = {}
+  for arrayName, dtype, shape, offset in layout:
+    arrays[arrayName] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+  return shm, arrays
+
+
+#
+# Reader process, reads every item from tasks until a None and queues its arrays in shared memory on ready
+# current holds the index of the item being read, so that it can be failed if the process dies, -1 between items
+#
+def readerLoop(read, tasks, ready, current):
+  for index, item in iter(tasks.get, None):
+    current.value = index
+    try:
+      arrays, meta = read(item)
+    except Exception as e:
+      ready.put((index, item, None, None, None, type(e).__name__ + ": " + str(e)))
+      current.value = -1
+      continue
+
+    if arrays is None:
+      ready.put((index, item, None, None, meta, None))
+    else:
+      shm, layout = shareArrays(arrays)
+      del arrays
+      ready.put((index, item, shm.name, layout, meta, None))
+      shm.close()
+    current.value = -1
+
+
+#
+# Compute process, computes every item from ready until a None and puts (index, result, error) on results
+# The shared memory of an item is unlinked once it has been computed, current is set as in readerLoop
+#
+def computeLoop(compute, ready, results, current):
+  for index, item, name, layout, meta, error in iter(ready.get, None):
+    current.value = index
+    if error is not None:
+      results.put((index, None, error))
+      current.value = -1
+      continue
+
+    shm = None
+    arrays = None
+    try:
+      if name is not None:
+        shm, arrays = attachArrays(name, layout)
+      results.put((index, compute(item, arrays, meta), None))
+    except Exception as e:
+      results.put((index, None, type(e).__name__ + ": " + str(e)))
+    finally:
+      arrays = None
+      if shm is not None:
+        try:
+          shm.close()
+        except BufferError:
+          pass
+        shm.unlink()
+    current.value = -1
+
+
+#
+# Queues every item on the tasks of the running processes as it arrives and then a None per reader, and sets the
+# number of items in state once they are all queued. Items may arrive slowly, e.g. as they are downloaded, and the
+# readers start on the first ones straight away. If the items raise, the error is kept in state for run to raise
+#
+def feedLoop(items, state, nReaders):
+  nItems = 0
+  try:
+    for item in items:
+      with state['lock']:
+        state['received'].append(item)
+        state['running']['tasks'].put((nItems, item))
+      nItems += 1
+  except Exception as e:
+    state['error'] = e
+  finally:
+    with state['lock']:
+      state['nItems'] = nItems
+      for i in range(nReaders):
+        state['running']['tasks'].put(None)
+
+
+#
+# Starts the reader and compute processes with their queues
+# Returns a dictionary of the queues and the list of (process, kind, current index) of every process
+#
+def startProcesses(read, compute, nReaders, nWorkers, depth):
+  tasks = multiprocessing.Queue()
+  ready = multiprocessing.Queue(max(depth, 1))
+  results = multiprocessing.Queue()
+
+  processes = []
+  for kind, target, args, count in (("Reader", readerLoop, (read, tasks, ready), nReaders),
+                                    ("Compute", computeLoop, (compute, ready, results), nWorkers)):
+    for i in range(count):
+      current = multiprocessing.RawValue('l', -1)
+      process = multiprocessing.Process(target=target, args=args + (current,))
+      process.daemon = True
+      process.start()
+      processes.append((process, kind, current))
+
+  return {'tasks': tasks, 'ready': ready, 'results': results, 'processes': processes}
+
+
+#
+# Gets everything left on a queue of stopped processes, a process may have died while writing to it
+#
+def drainQueue(q):
+  drained = []
+  while True:
+    try:
+      drained.append(q.get(timeout=DRAIN_TIMEOUT))
+    except Exception:
+      return drained
+
+
+#
+# Terminates the processes after one has died and restarts them on the items that have not completed
+# The item each dead process held is failed, the results that were already queued are kept and the arrays read for
+# the other items are freed, those items are read again
+# Returns the new processes and a list of (index, result, error) for the items completed or failed by the old ones
+#
+def restartProcesses(state, dead, read, compute, nReaders, nWorkers, depth, done):
+  old = state['running']
+  for process, kind, current in old['processes']:
+    process.terminate()
+  for process, kind, current in old['processes']:
+    process.join()
+
+  completed = [(index, result, error) for index, result, error in drainQueue(old['results']) if index not in done]
+  for index, item, name, layout, meta, error in drainQueue(old['ready']):
+    if name is not None:
+      try:
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+      except FileNotFoundError:
+        pass
+
+  # Nothing reads the old queues again, so exiting must not wait to flush them
+  for q in (old['tasks'], old['ready'], old['results']):
+    q.cancel_join_thread()
+    q.close()
+
+  finished = done | set(index for index, result, error in completed)
+  for process, kind, current in dead:
+    if current.value >= 0 and current.value not in finished:
+      completed.append((current.value, None, kind + " process exited with code " + str(process.exitcode)))
+      finished.add(current.value)
+
+  # Without an item to fail the same processes could die again and again
+  if not any(current.value >= 0 for process, kind, current in dead):
+    process, kind, current = dead[0]
+    raise RuntimeError(kind + " process exited with code " + str(process.exitcode))
+
+  processes = startProcesses(read, compute, nReaders, nWorkers, depth)
+  for index, item in enumerate(state['received']):
+    if index not in finished:
+      processes['tasks'].put((index, item))
+  if state['nItems'] is not None:
+    for i in range(nReaders):
+      processes['tasks'].put(None)
+  return processes, completed
+
+
+#
+# Runs read then compute on every item, with nReaders reader processes running up to depth items ahead of nWorkers
+# compute processes. read(item) returns a dictionary of arrays (or None) and any picklable metadata, compute(item,
+# arrays, meta) returns a picklable result. Both must be importable top-level functions
+# items can be any iterable, including a generator whose items are not all known yet
+# If a process dies, e.g. killed for its memory, the item it held fails and the processes are restarted on the rest
+# Yields (item, result, error) as the items complete, error is None unless read or compute failed
+# An error raised by items is raised once the items received before it have completed
+#
+def run(items, read, compute, nReaders, nWorkers, depth):
+  if shared_memory is None:
+    raise RuntimeError("The prefetching pipeline needs multiprocessing.shared_memory (Python 3.8 or later)")
+
+  # Every process shares one resource tracker, otherwise a reader's own tracker would unlink the blocks it created
+  # but that are not computed yet when the reader exits
+  resource_tracker.ensure_running()
+
+  state = {'lock': threading.Lock(), 'received': [], 'nItems': None, 'error': None,
+           'running': startProcesses(read, compute, nReaders, nWorkers, depth)}
+
+  # The items are fed from a thread once the processes are running, so the processes never inherit the feeder
+  feeder = threading.Thread(target=feedLoop, args=(items, state, nReaders))
+  feeder.daemon = True
+  feeder.start()
+
+  completed = False
+  try:
+    done = set()
+    while state['nItems'] is None or len(done) < state['nItems']:
+      try:
+        finished = [state['running']['results'].get(timeout=POLL_INTERVAL)]
+      except queue.Empty:
+
+        # Readers exit cleanly once the items run out, any other exit means the process died
+        dead = [(process, kind, current) for process, kind, current in state['running']['processes'] if
+                process.exitcode not in (None, 0)]
+        if not dead:
+          continue
+        with state['lock']:
+          state['running'], finished = restartProcesses(state, dead, read, compute, nReaders, nWorkers, depth,
+                                                          done)
+
+      for index, result, error in finished:
+        if index not in done:
+          done.add(index)
+          yield state['received'][index], result, error
+    completed = True
+  finally:
+    processes = state['running']
+    if completed:
+      for i in range(nWorkers):
+        processes['ready'].put(None)
+    else:
+      for process, kind, current in processes['processes']:
+        process.terminate()
+    for process, kind, current in processes['processes']:
+      process.join()
+
+  if state['error'] is not None:
+    raise state['error']
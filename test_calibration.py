@@ -0,0 +1,35 @@
+#!/usr/bin/python
+
+import numpy as np
+import pytest
+import calibration
+
+# Radiance scale and offset of each band, as found in the metadata of a HDF02
+SCALES = {21: (0.0032487, 2730.5833), 22: (0.00068478, 2730.5833), 31: (0.00084002, 1577.3397),
+          32: (0.00072969, 1658.2213)}
+
+
+#
+# DNs of a band with the fill and saturated values, and 0, among them
+#
+def dnBand(seed, shape=(40, 30)):
+  dn = np.random.RandomState(seed).randint(0, 32768, shape).astype(np.uint16)
+  dn.flat[:4] = [0, 32767, 65534, 65535]
+  return dn
+
+
+@pytest.mark.parametrize("band", sorted(SCALES))
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_lookup_matches_planck_inversion(band, dtype):
+  scale, offset = SCALES[band]
+  for seed in range(2):
+    dn = dnBand(seed)
+    expected = calibration.planckInversion((dn.astype(dtype) - offset) * scale, band)
+
+    temperature = calibration.brightnessTemperature(dn, band, scale, offset, dtype)
+    assert temperature.dtype == dtype
+    np.testing.assert_array_equal(temperature, expected)
+
+    # DNs that are not 16 bit integers are converted directly
+    np.testing.assert_array_equal(calibration.brightnessTemperature(dn.astype(np.int32), band, scale, offset, dtype),
+                                  expected)
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+
+import datetime
+import catalog
+
+
+def test_parseName():
+  granule = catalog.parseName('MYD021KM.A2015189.2140.006.2015190083030.hdf')
+  assert granule.product == 'MYD021KM'
+  assert granule.platform == 'Aqua'
+  assert granule.acquired == datetime.datetime(2015, 7, 8, 21, 40)
+  assert granule.collection == '006'
+  assert catalog.isMOD02(granule) and not catalog.isMOD03(granule)
+
+
+def test_parseName_rejects_partial_and_other_files():
+  assert catalog.parseName('MOD03.A2015189.2140.006.2015190062323.hdf.part') is None
+  assert catalog.parseName('VNP02MOD.A2015189.2140.001.2015190083030.hdf') is None
+  assert catalog.parseName('MOD03.A2015189.2199.006.2015190062323.hdf') is None
+  assert catalog.parseName('footprints.sqlite') is None
+
+
+def test_pairGranules_matches_platform_and_collection():
+  names = ['MOD021KM.A2015189.2140.006.2015190083030.hdf', 'MYD021KM.A2015189.2140.006.2015190083031.hdf',
+           'MYD03.A2015189.2140.006.2015190062324.hdf', 'MOD03.A2015189.2140.005.2015190062320.hdf',
+           'MOD03.A2015189.2140.006.2015190062323.hdf', 'MOD021KM.A2015189.2145.006.2015190083032.hdf',
+           'MOD03.A2015189.2140.006.2015190062323.hdf.part']
+
+  pairs, solitary = catalog.pairGranules(names)
+  assert pairs == [('MOD021KM.A2015189.2140.006.2015190083030.hdf', 'MOD03.A2015189.2140.006.2015190062323.hdf'),
+                   ('MYD021KM.A2015189.2140.006.2015190083031.hdf', 'MYD03.A2015189.2140.006.2015190062324.hdf')]
+  assert solitary == ['MOD021KM.A2015189.2145.006.2015190083032.hdf']
+
+
+def test_pairGranules_falls_back_to_another_collection():
+  pairs, solitary = catalog.pairGranules(['MOD021KM.A2015189.2140.061.2015190083030.hdf',
+                                          'MOD03.A2015189.2140.006.2015190062323.hdf'])
+  assert pairs == [('MOD021KM.A2015189.2140.061.2015190083030.hdf', 'MOD03.A2015189.2140.006.2015190062323.hdf')]
+  assert solitary == []
+
+
+def test_parseListing():
+  listing = ("-rw-r--r--   1 owner    group      307352 Jul 09 08:30 MOD021KM.A2015189.2140.006.2015190083030.hdf\r\n"
+             "drwxr-xr-x   2 owner    group        4096 Jul 09  2015 subdir\r\n"
+             "total 12\r\n"
+             "-rw-r--r--   1 owner    group       70001 Jul 09 06:23 MOD03.A2015189.2140.006.2015190062323.hdf\r\n")
+  sizes = catalog.parseListing(listing)
+  assert list(sizes.items()) == [('MOD021KM.A2015189.2140.006.2015190083030.hdf', 307352), ('subdir', 4096),
+                                 ('MOD03.A2015189.2140.006.2015190062323.hdf', 70001)]
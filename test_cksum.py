@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+import json
+import pytest
+import cksum
+
+# Contents and their checksums and sizes as output by the POSIX cksum utility
+KNOWN = [
+  (b"", 4294967295),
+  (b"123456789", 930766865),
+  (bytes(bytearray(range(256))) * 2, 3765074165),
+  (b"a" * 70000, 3508083167),
+  (bytes(bytearray((i * 7 + 3) % 256 for i in range(300000))), 2641636907),
+]
+
+
+@pytest.mark.parametrize("data, checksum", KNOWN)
+def test_posixChecksum_matches_cksum(tmp_path, data, checksum):
+  path = tmp_path / "file.hdf"
+  path.write_bytes(data)
+  assert cksum.posixChecksum(str(path)) == (checksum, len(data))
+
+
+@pytest.mark.parametrize("data, checksum", KNOWN[2:])
+def test_posixChecksum_across_chunks(tmp_path, monkeypatch, data, checksum):
+  monkeypatch.setattr(cksum, 'CHUNK_SIZE', 1000)
+  path = tmp_path / "file.hdf"
+  path.write_bytes(data)
+  assert cksum.posixChecksum(str(path)) == (checksum, len(data))
+
+
+def test_report(tmp_path, monkeypatch, capsys):
+  monkeypatch.chdir(tmp_path)
+  (tmp_path / "a.hdf").write_bytes(KNOWN[1][0])
+  (tmp_path / "b.hdf").write_bytes(KNOWN[3][0] + b"corrupt")
+  (tmp_path / "sums").write_text(
+    "checksum size file.hdf\n"
+    "930766865 9 a.hdf\n"
+    "3508083167 70000 b.hdf\n"
+    "4294967295 0 c.hdf\n"
+    "12345 truncated.hdf\n")
+
+  cksum.main(["-f", "sums", "-w", "2", "-s", "summary.json"])
+
+  out = capsys.readouterr().out
+  assert "a.hdf verified" in out
+  assert "Skipping unreadable checksum line: checksum size file.hdf" in out
+  assert "Skipping unreadable checksum line: 12345 truncated.hdf" in out
+  summary = json.loads((tmp_path / "summary.json").read_text())
+  assert summary["verified"] == {"count": 1, "files": ["a.hdf"]}
+  assert summary["corrupt"] == {"count": 1, "files": ["b.hdf"]}
+  assert summary["missing"] == {"count": 1, "files": ["c.hdf"]}
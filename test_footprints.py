@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+import os
+import numpy as np
+import footprints
+
+HDF03 = 'MOD03.A2015189.2140.006.2015190062323.hdf'
+
+
+def test_footprint_is_stored_and_looked_up(tmp_path):
+  hdf03 = tmp_path / HDF03
+  hdf03.write_bytes(b'geolocation')
+  conn = footprints.openIndex(str(tmp_path / footprints.DEF_INDEX_NAME))
+
+  assert footprints.lookupFootprint(conn, str(hdf03)) == (False, None)
+  footprints.storeFootprint(conn, str(hdf03), (64.0, 65.5, -150.0, -145.0))
+  assert footprints.lookupFootprint(conn, str(hdf03)) == (True, (64.0, 65.5, -150.0, -145.0))
+
+  # A swath without valid geolocation is indexed without a footprint
+  footprints.storeFootprint(conn, str(hdf03), None)
+  assert footprints.lookupFootprint(conn, str(hdf03)) == (True, None)
+  conn.close()
+
+
+def test_changed_file_is_not_indexed(tmp_path):
+  hdf03 = tmp_path / HDF03
+  hdf03.write_bytes(b'geolocation')
+  conn = footprints.openIndex(str(tmp_path / footprints.DEF_INDEX_NAME))
+  footprints.storeFootprint(conn, str(hdf03), (64.0, 65.5, -150.0, -145.0))
+
+  stat = os.stat(str(hdf03))
+  os.utime(str(hdf03), (stat.st_atime, stat.st_mtime + 10))
+  assert footprints.lookupFootprint(conn, str(hdf03)) == (False, None)
+
+  footprints.storeFootprint(conn, str(hdf03), (64.0, 65.5, -150.0, -145.0))
+  with open(str(hdf03), 'ab') as f:
+    f.write(b'more')
+  os.utime(str(hdf03), (stat.st_atime, stat.st_mtime + 10))
+  assert footprints.lookupFootprint(conn, str(hdf03)) == (False, None)
+  conn.close()
+
+
+def test_geolocationBounds_ignores_fill_values():
+  lat = np.array([[64.2, -999], [65.1, 64.8]])
+  lon = np.array([[-149.5, -148.0], [-999, -147.25]])
+  assert footprints.geolocationBounds(lat, lon) == (64.2, 65.1, -149.5, -147.25)
+  assert footprints.geolocationBounds(np.full((2, 2), -999.0), lon) is None
+
+
+def test_intersects():
+  bounds = (64.0, 65.5, -150.0, -145.0)
+  assert footprints.intersects(bounds, 65, 66, -148, -146)
+  assert not footprints.intersects(bounds, 66, 67, -148, -146)
+  assert not footprints.intersects(bounds, 65, 66, -144, -140)
+  assert not footprints.intersects(None, 65, 66, -148, -146)
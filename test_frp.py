@@ -0,0 +1,549 @@
+#!/usr/bin/python
+
+from scipy import ndimage
+import json
+import os
+import sys
+import numpy as np
+import pytest
+import aoi
+import confidence
+import footprints
+import frp
+
+
+#
+# Python 3 ports of the generic_filter callbacks that runFilt replaced, kept as the reference for its results
+#
+def makeFootprint(kSize):
+  fpZeroLine = (kSize - 1) // 2
+  fpZeroColStart = fpZeroLine - 1
+  fpZeroColEnd = fpZeroColStart + 3
+  fp = np.ones((kSize, kSize), dtype='int_')
+  fp[fpZeroLine, fpZeroColStart:fpZeroColEnd] = -5
+  return fp
+
+
+def nValidFilt(kernel, kSize, minKsize):
+  nghbrCnt = -4
+  kernel = kernel.reshape((kSize, kSize))
+
+  centerVal = kernel[((kSize - 1) // 2), ((kSize - 1) // 2)]
+
+  if (kSize == minKsize) | (centerVal == -4):
+    fpMask = makeFootprint(kSize)
+    kernel[np.where(fpMask < 0)] = -5
+    nghbrs = kernel[np.where(kernel > 0)]
+    nghbrCnt = len(nghbrs)
+
+  return nghbrCnt
+
+
+def nRejectBGfireFilt(kernel, kSize, minKsize):
+  nRejectBGfire = -4
+  kernel = kernel.reshape((kSize, kSize))
+  centerVal = kernel[((kSize - 1) // 2), ((kSize - 1) // 2)]
+
+  if (kSize == minKsize) | (centerVal == -4):
+    nRejectBGfire = len(kernel[np.where(kernel == -3)])
+
+  return nRejectBGfire
+
+
+def nRejectWaterFilt(kernel, kSize, minKsize):
+  nRejectWater = -4
+  kernel = kernel.reshape((kSize, kSize))
+
+  centerVal = kernel[((kSize - 1) // 2), ((kSize - 1) // 2)]
+
+  if (kSize == minKsize) | (centerVal == -4):
+    nRejectWater = len(kernel[np.where(kernel == -1)])
+
+  return nRejectWater
+
+
+def nUnmaskedWaterFilt(kernel, kSize, minKsize):
+  nUnmaskedWater = -4
+  kernel = kernel.reshape((kSize, kSize))
+
+  centerVal = kernel[((kSize - 1) // 2), ((kSize - 1) // 2)]
+
+  if ((kSize == minKsize) | (centerVal == -4)) & (centerVal not in (range(-3, 0))):
+    nUnmaskedWater = len(kernel[np.where(kernel == -6)])
+
+  return nUnmaskedWater
+
+
+def rampFn(band, rampMin, rampMax):
+  conf = 0
+  confVals = []
+  for bandVal in band:
+    if rampMin < bandVal < rampMax:
+      conf = (bandVal - rampMin) / (rampMax - rampMin)
+    if bandVal >= rampMax:
+      conf = 1
+    confVals.append(conf)
+  return np.asarray(confVals)
+
+
+def meanMadFilt(rawband, minKsize, maxKsize, footprintx, footprinty, ksizes, minNcount, minNfrac):
+  sizex, sizey = np.shape(rawband)
+  bSize = (maxKsize - 1) // 2
+  padsizex = sizex + 2 * bSize
+  padsizey = sizey + 2 * bSize
+
+  # This is the window which will be processed
+  band = np.pad(rawband, ((bSize, bSize), (bSize, bSize)), mode='symmetric')
+
+  meanFilt = np.full([padsizex, padsizey], -4.0, dtype=np.float32)
+  madFilt = np.full([padsizex, padsizey], -4.0, dtype=np.float32)
+
+  divTable = 1.0 / np.arange(1, maxKsize * maxKsize, dtype=np.float64)
+  divTable = np.insert(divTable, 0, 0)
+
+  nmin = min(minNcount, minNfrac * minKsize * minKsize)
+
+  for y in range(bSize, sizey + bSize):
+    for x in range(bSize, sizex + bSize):
+
+      # This is the center pixel of the window
+      centerVal = band[x, y]
+
+      if (centerVal not in range(-2, 0)):
+
+        if meanFilt[x, y] == -4:
+
+          # Get all possible neighbours of the current window
+          neighbours = band[x + footprintx[0], y + footprinty[0]]
+
+          neighbours = neighbours[np.where(neighbours > 0)]
+
+          nn = len(neighbours)
+
+          # The number of valid neighbours is more than what is required
+          if (nn > nmin):
+            bgMean = np.sum(neighbours) * divTable[nn]
+            meanFilt[x, y] = bgMean
+            meanDists = np.abs(neighbours - bgMean)
+            bgMAD = np.sum(meanDists) * divTable[nn]
+            madFilt[x, y] = bgMAD
+
+  for i in range(1, len(ksizes)):
+
+    nmin = min(minNcount, minNfrac * ksizes[i] * ksizes[i])
+
+    for y in range(bSize, sizey + bSize):
+      for x in range(bSize, sizex + bSize):
+
+        # This is the center pixel of the window
+        centerVal = band[x, y]
+
+        if centerVal == -4:
+          if meanFilt[x, y] == -4:
+
+            # Get all possible neighbours of the current window
+            neighbours = band[x + footprintx[0], y + footprinty[0]]
+
+            neighbours = neighbours[np.where(neighbours > 0)]
+
+            nn = len(neighbours)
+
+            if (nn > nmin):
+              bgMean = np.sum(neighbours) * divTable[nn]
+              meanFilt[x, y] = bgMean
+              meanDists = np.abs(neighbours - bgMean)
+              bgMAD = np.sum(meanDists) * divTable[nn]
+              madFilt[x, y] = bgMAD
+
+  return meanFilt[bSize:-bSize, bSize:-bSize], madFilt[bSize:-bSize, bSize:-bSize]
+
+
+def runFilt(band, filtFunc, minKsize, maxKsize):
+  filtBand = band
+  kSize = minKsize
+  bandFilts = {}
+
+  while kSize <= maxKsize:
+    filtName = 'bandFilt' + str(kSize)
+    filtBand = ndimage.generic_filter(filtBand, filtFunc, size=kSize, extra_arguments=(kSize, minKsize))
+    bandFilts[filtName] = filtBand
+    kSize += 2
+
+  bandFilt = bandFilts['bandFilt' + str(minKsize)]
+  kSize = minKsize + 2
+
+  while kSize <= maxKsize:
+    bandFilt[np.where(bandFilt == -4)] = bandFilts['bandFilt' + str(kSize)][np.where(bandFilt == -4)]
+    kSize += 2
+
+  return bandFilt
+
+
+#
+# A band of the flag values the filters look for, mostly -4 so that the larger kernels fill pixels too
+#
+def flagBand(seed, shape=(23, 31)):
+  rng = np.random.RandomState(seed)
+  values = np.array([-6, -4, -4, -4, -4, -3, -2, -1, 0, 1, 290.5, np.nan])
+  return values[rng.randint(0, len(values), shape)]
+
+
+@pytest.mark.parametrize("minKsize, maxKsize", [(1, 5), (2, 6), (3, 9), (4, 12), (5, 21), (6, 6)])
+@pytest.mark.parametrize("newFilt, oldFilt", [(frp.nValidFilt, nValidFilt),
+                                              (frp.nRejectBGfireFilt, nRejectBGfireFilt),
+                                              (frp.nRejectWaterFilt, nRejectWaterFilt),
+                                              (frp.nUnmaskedWaterFilt, nUnmaskedWaterFilt)])
+def test_runFilt_matches_generic_filter(minKsize, maxKsize, newFilt, oldFilt):
+  for seed in range(3):
+    band = flagBand(seed)
+    expected = runFilt(np.copy(band), oldFilt, minKsize, maxKsize)
+    np.testing.assert_array_equal(frp.runFilt(np.copy(band), newFilt, minKsize, maxKsize), expected)
+
+
+#
+# A masked background band, brightness temperatures with cloud (-2), water (-1), rejected (-3 and -4) and NaN pixels
+#
+def backgroundBand(seed, dtype, shape=(27, 33)):
+  rng = np.random.RandomState(seed)
+  band = rng.uniform(270, 330, shape)
+  flags = rng.randint(0, 10, shape)
+  band[flags == 0] = -1
+  band[flags == 1] = -2
+  band[flags == 2] = -3
+  band[(flags == 3) | (flags == 4)] = -4
+  band[rng.randint(0, 50, shape) == 0] = np.nan
+  return band.astype(dtype)
+
+
+#
+# Statistics must be identical for float64 bands. Single precision bands (low memory mode) were summed in float32 in
+# a different order by the pixel loop, so they must fill the same pixels and agree to a few float32 steps of the band
+# values, the rounding of the mean carries over to the MAD as it is
+#
+def assertStatsEqual(actual, expected, band):
+  if band.dtype == np.float64:
+    np.testing.assert_array_equal(actual, expected)
+  else:
+    np.testing.assert_array_equal(actual == -4, expected == -4)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=4 * np.spacing(np.nanmax(band)))
+
+
+# The kernel ranges are given in the order detectFires passes them, the largest kernel first
+@pytest.mark.parametrize("minKsize, maxKsize", [(5, 21), (3, 9), (7, 11), (5, 5)])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_meanMadFilt_matches_pixel_loop(minKsize, maxKsize, dtype):
+  footprintx, footprinty, ksizes = frp.kernelFootprints(minKsize, maxKsize)
+  for seed in range(2):
+    band = backgroundBand(seed, dtype)
+    expected = meanMadFilt(band, maxKsize, minKsize, footprintx, footprinty, ksizes, 8, 0.25)
+
+    meanFilt, madFilt = frp.meanMadFilt(band, maxKsize, minKsize, footprintx, footprinty, ksizes, 8, 0.25)
+    assertStatsEqual(meanFilt, expected[0], band)
+    assertStatsEqual(madFilt, expected[1], band)
+
+    # Only calculating some pixels gives the same values for those
+    rows, cols = np.nonzero(np.random.RandomState(seed).randint(0, 4, np.shape(band)) == 0)
+    meanVals, madVals = frp.meanMadFilt(band, maxKsize, minKsize, footprintx, footprinty, ksizes, 8, 0.25,
+                                        coords=(rows, cols), compact=True)
+    assertStatsEqual(meanVals, expected[0][rows, cols], band)
+    assertStatsEqual(madVals, expected[1][rows, cols], band)
+
+
+#
+# A small synthetic granule, as readGranule would return it, with a day half and a night half, scattered hot pixels,
+# clouds and water, so that fires are found in both halves and the rejection tests have something to reject
+#
+def syntheticGranule(seed, shape=(60, 48)):
+  rng = np.random.RandomState(seed)
+  rows, cols = np.indices(shape)
+  b31 = rng.uniform(282, 296, shape)
+  b22 = b31 + rng.uniform(0, 8, shape)
+  hot = rng.randint(0, 25, shape) == 0
+  b22[hot] += rng.uniform(12, 60, np.count_nonzero(hot))
+  b32 = b31 - rng.uniform(0, 2, shape)
+  b32[rng.randint(0, 30, shape) == 0] = 260
+  return {'LAT': 64 + rows * 0.01, 'LON': -150 + cols * 0.01,
+          'BAND21': np.copy(b22), 'BAND22': b22, 'BAND31': b31, 'BAND32': b32,
+          'BAND1x1k': rng.randint(20, 300, shape), 'BAND2x1k': rng.randint(20, 320, shape),
+          'BAND7x1k': rng.randint(20, 200, shape), 'LANDMASK': np.where(rng.randint(0, 20, shape) == 0, 0, 1),
+          'SolarZenith': np.where(rows < shape[0] // 2, 4000, 9000), 'SolarAzimuth': rng.uniform(-3, 3, shape),
+          'SensorZenith': rng.uniform(0, 1, shape), 'SensorAzimuth': rng.uniform(-3, 3, shape),
+          'INVALID': np.zeros(shape, dtype=np.uint8)}
+
+
+def assertDetectionsEqual(actual, expected):
+  assert list(actual) == list(expected)
+  for name in expected:
+    np.testing.assert_array_equal(actual[name], expected[name])
+
+
+@pytest.mark.parametrize("minKsize, maxKsize", [(5, 21), (7, 15)])
+@pytest.mark.parametrize("core", [None, (7, 52, 3, 45)])
+def test_row_blocks_match_whole_area(minKsize, maxKsize, core):
+  for seed in range(2):
+    allArrays = syntheticGranule(seed)
+    expected = frp.detectFires(allArrays, frp.makeConfig(minimumKernel=minKsize, maximumKernel=maxKsize), core,
+                               (100, 200))
+    assert len(expected['FRPline']) > 0
+
+    config = frp.makeConfig(minimumKernel=minKsize, maximumKernel=maxKsize, blocks=5)
+    assertDetectionsEqual(frp.detectFiresBlocks(allArrays, config, core, (100, 200)), expected)
+
+
+#
+# Writes a sweep file of the configurations given by name and returns a config that runs it
+#
+def sweepConfig(tmp_path, configs, **overrides):
+  path = tmp_path / "sweep.json"
+  path.write_text(json.dumps([dict(overrideArgs, name=name) for name, overrideArgs in configs]))
+  return frp.makeConfig(sweep=str(path), **overrides)
+
+
+SWEEP = [('default', {}), ('rf09', {'reductionFactor': 0.9}), ('k7', {'minimumKernel': 7, 'maximumKernel': 15}),
+         ('obs4', {'windowObservations': 4}), ('frac', {'validFraction': 0.5})]
+
+
+@pytest.mark.parametrize("blocks", [1, 3])
+def test_sweep_matches_separate_runs(tmp_path, blocks):
+  config = sweepConfig(tmp_path, SWEEP, blocks=blocks)
+  assert [name for name, sweepConfig in config.sweepConfigs] == [name for name, overrideArgs in SWEEP]
+  for seed in range(2):
+    allArrays = syntheticGranule(seed)
+    sweepDetections = frp.detectFiresSweep(allArrays, frp.detectionConfigs(config), (4, 56, 2, 46), (10, 20))
+    for (name, overrideArgs), detections in zip(SWEEP, sweepDetections):
+      expected = frp.detectFires(allArrays, frp.makeConfig(**overrideArgs), (4, 56, 2, 46), (10, 20))
+      assertDetectionsEqual(detections, expected)
+
+
+def test_sweep_decimal_places(tmp_path):
+  config = sweepConfig(tmp_path, [('d3', {'decimal': 3}), ('d0', {'decimal': 0})])
+  assert [sweepConfig.decimal for name, sweepConfig in config.sweepConfigs] == [3, 0]
+  with pytest.raises(ValueError):
+    sweepConfig(tmp_path, [('d', {'decimal': 2.5})])
+
+  allArrays = syntheticGranule(0)
+  nFires = frp.processArrays('MOD021KM.A2015189.2140.006.2015190083030.hdf', allArrays, None, (0, 0), config,
+                             str(tmp_path))
+  assert nFires == 2 * len(frp.detectFires(allArrays, config)['FRPline'])
+  for name, places in (('d3', 3), ('d0', 0)):
+    lines = (tmp_path / name / 'MOD021KM.A2015189.2140.006.2015190083030.csv').read_text().splitlines()
+    power = lines[1].split(',')[12]
+    assert len(power.partition('.')[2]) == places
+
+
+#
+# Loads the fires written to a CSV by processArrays, no fires without the file
+#
+def loadFires(path):
+  if not path.exists():
+    return np.zeros((0, len(frp.DETECTION_COLUMNS)))
+  return np.loadtxt(str(path), delimiter=',', ndmin=2)
+
+
+def test_areas_match_separate_runs(tmp_path):
+  areas = [{'name': 'west', 'minimumLatitude': 64.05, 'maximumLatitude': 64.3, 'minimumLongitude': -149.97,
+            'maximumLongitude': -149.7},
+           {'name': 'overlap', 'minimumLatitude': 64.2, 'maximumLatitude': 64.52, 'minimumLongitude': -149.8,
+            'maximumLongitude': -149.56},
+           {'name': 'outside', 'minimumLatitude': 60, 'maximumLatitude': 61, 'minimumLongitude': -149.9,
+            'maximumLongitude': -149.6},
+           {'name': 'triangle', 'polygon': [[64.02, -149.98], [64.57, -149.9], [64.3, -149.55]]}]
+  areaFile = tmp_path / "areas.json"
+  areaFile.write_text(json.dumps(areas))
+  csvName = 'MOD021KM.A2015189.2140.006.2015190083030.csv'
+
+  for seed in range(2):
+    allArrays = syntheticGranule(seed)
+    directory = tmp_path / str(seed)
+    nFires = frp.processArrays(csvName.replace('csv', 'hdf'), allArrays, None, (10, 20),
+                               frp.makeConfig(areaFile=str(areaFile)), str(directory / 'areas'))
+
+    # A run with the area's own bounding co-ordinates reads the area and the halo of the largest kernel around it
+    nExpected = 0
+    for area in aoi.loadAreas(str(areaFile)):
+      config = frp.makeConfig(minimumLatitude=area.minLat, maximumLatitude=area.maxLat,
+                              minimumLongitude=area.minLon, maximumLongitude=area.maxLon)
+      core = aoi.areaCore(allArrays['LAT'], allArrays['LON'], area)
+      if core is not None:
+        areaArrays, areaCore, origin = frp.cropGranule(allArrays, core, (10, 20), config.maximumKernel // 2)
+        frp.processArrays(csvName.replace('csv', 'hdf'), areaArrays, areaCore, origin, config,
+                          str(directory / 'runs' / area.name))
+
+      expected = loadFires(directory / 'runs' / area.name / csvName)
+      if area.polygon is not None:
+        expected = expected[aoi.inPolygon(expected[:, 2], expected[:, 3], area.polygon)]
+      np.testing.assert_array_equal(loadFires(directory / 'areas' / area.name / csvName), expected)
+      nExpected += len(expected)
+
+    assert nExpected > 0 and nFires == nExpected
+
+
+#
+# Values around a confidence ramp from rampMin to rampMax, including NaN and values at or below rampMin
+#
+def rampValues(seed, rampMin, rampMax, n=200):
+  rng = np.random.RandomState(seed)
+  values = rng.uniform(rampMin - (rampMax - rampMin), rampMax + (rampMax - rampMin), n)
+  values[rng.randint(0, n, n // 10)] = np.nan
+  values[rng.randint(0, n, n // 10)] = rampMin
+  values[rng.randint(0, n, n // 10)] = rampMax
+  return values
+
+
+@pytest.mark.parametrize("rampMin, rampMax", [(310, 340), (305, 320), (2.5, 6), (3, 6), (0, 6)])
+def test_legacy_ramp_matches_old_loop(rampMin, rampMax):
+  for seed in range(3):
+    values = rampValues(seed, rampMin, rampMax)
+    np.testing.assert_array_equal(confidence.ramp(values, rampMin, rampMax, legacy=True),
+                                  rampFn(values, rampMin, rampMax))
+
+  # Values at or below the ramp before any value above it carry the initial zero
+  values = np.array([np.nan, rampMin, rampMin - 1, rampMax, np.nan, rampMin])
+  np.testing.assert_array_equal(confidence.ramp(values, rampMin, rampMax, legacy=True), [0, 0, 0, 1, 1, 1])
+
+
+@pytest.mark.parametrize("rampMin, rampMax", [(310, 340), (2.5, 6), (0, 6)])
+def test_ramp_scores_values_below_ramp_zero(rampMin, rampMax):
+  values = rampValues(0, rampMin, rampMax)
+  conf = confidence.ramp(values, rampMin, rampMax)
+
+  below = np.isnan(values) | (values <= rampMin)
+  assert np.any(below) and np.all(conf[below] == 0)
+  np.testing.assert_array_equal(conf[~below], rampFn(values[~below], rampMin, rampMax))
+
+
+def test_main_exit_status_when_pairs_fail(tmp_path, monkeypatch, capsys):
+  for name in ('MOD021KM.A2015189.2140.006.2015190083030.hdf', 'MOD03.A2015189.2140.006.2015190062323.hdf'):
+    (tmp_path / name).write_bytes(b'not a HDF')
+  monkeypatch.chdir(tmp_path)
+
+  assert frp.main(["-dir", str(tmp_path)]) == 1
+  out = capsys.readouterr().out
+  assert "Failed to process " + str(tmp_path / 'MOD021KM.A2015189.2140.006.2015190083030.hdf') in out
+  assert "Processed 1 granules (1 failed)" in out
+
+
+#
+# Replaces readGranule with one that reads the area of the config and its halo from a synthetic granule, calling
+# onGeolocation with the granule's geolocation as readGranule does, and records the pairs it is called with
+#
+@pytest.fixture
+def readCalls(monkeypatch):
+  calls = []
+
+  def readGranule(filMOD02, filMOD03, config, halo=None, onGeolocation=None):
+    calls.append((filMOD02, filMOD03, halo))
+    allArrays = syntheticGranule(0)
+    if onGeolocation is not None:
+      onGeolocation(allArrays['LAT'], allArrays['LON'])
+    core = aoi.areaCore(allArrays['LAT'], allArrays['LON'], aoi.Area(
+      'config', config.minimumLatitude, config.maximumLatitude, config.minimumLongitude, config.maximumLongitude, None))
+    if core is None:
+      return None
+    return frp.cropGranule(allArrays, core, (0, 0), halo)
+
+  monkeypatch.setattr(frp, 'readGranule', readGranule)
+  monkeypatch.setattr(frp, '_unusableIndexes', set())
+  return calls
+
+
+#
+# Writes a HDF pair with placeholder contents, returns the paths of the HDF02 and HDF03
+#
+def hdfPair(directory):
+  paths = []
+  for name in ('MOD021KM.A2015189.2140.006.2015190083030.hdf', 'MOD03.A2015189.2140.006.2015190062323.hdf'):
+    (directory / name).write_bytes(name.encode('utf-8'))
+    paths.append(str(directory / name))
+  return paths
+
+
+def test_footprint_index_skips_granules_outside_area(tmp_path, readCalls):
+  filMOD02, filMOD03 = hdfPair(tmp_path)
+  index = str(tmp_path / footprints.DEF_INDEX_NAME)
+  inside = frp.makeConfig(minimumLatitude=64.1, maximumLatitude=64.4, minimumLongitude=-149.9,
+                          maximumLongitude=-149.6)
+  outside = frp.makeConfig(minimumLatitude=60, maximumLatitude=61, minimumLongitude=-149.9, maximumLongitude=-149.6)
+
+  # The first read indexes the footprint of the HDF03 from its geolocation
+  assert frp.loadGranule(filMOD02, filMOD03, inside, index) is not None
+  conn = footprints.openIndex(index)
+  assert footprints.lookupFootprint(conn, filMOD03) == (True, (64.0, 64.59, -150.0, -149.53))
+  conn.close()
+
+  # Once indexed a granule outside the area is skipped without being read
+  assert frp.loadGranule(filMOD02, filMOD03, outside, index) is None
+  assert len(readCalls) == 1
+  assert frp.loadGranule(filMOD02, filMOD03, inside, index) is not None
+  assert len(readCalls) == 2
+
+
+def test_unusable_footprint_index_is_disabled(tmp_path, readCalls, capsys):
+  filMOD02, filMOD03 = hdfPair(tmp_path)
+  index = str(tmp_path / "missing" / footprints.DEF_INDEX_NAME)
+  config = frp.makeConfig(minimumLatitude=64.1, maximumLatitude=64.4, minimumLongitude=-149.9,
+                          maximumLongitude=-149.6)
+
+  for i in range(2):
+    assert frp.loadGranule(filMOD02, filMOD03, config, index) is not None
+  assert len(readCalls) == 2
+  assert index in frp._unusableIndexes
+  assert capsys.readouterr().out.count("Cannot use the footprint index " + index) == 1
+
+
+def assertGranulesEqual(actual, expected):
+  assert actual[1:] == expected[1:]
+  assert sorted(actual[0]) == sorted(expected[0])
+  for name in expected[0]:
+    np.testing.assert_array_equal(actual[0][name], expected[0][name])
+
+
+def test_granule_cache(tmp_path, readCalls):
+  filMOD02, filMOD03 = hdfPair(tmp_path)
+  cacheDir = str(tmp_path / "cache")
+  area = dict(minimumLatitude=64.1, maximumLatitude=64.4, minimumLongitude=-149.9, maximumLongitude=-149.6)
+
+  # The granule is read once with the cache halo and every later run loads it memory-mapped, cropped to its halo
+  for maximumKernel in (21, 21, 11):
+    expected = frp.loadGranule(filMOD02, filMOD03, frp.makeConfig(maximumKernel=maximumKernel, **area))
+    granule = frp.loadGranule(filMOD02, filMOD03, frp.makeConfig(maximumKernel=maximumKernel, cacheDir=cacheDir,
+                                                                 **area))
+    assertGranulesEqual(granule, expected)
+  assert isinstance(granule[0]['BAND22'], np.memmap)
+  assert [halo for filMOD02, filMOD03, halo in readCalls].count(frp.CACHE_HALO) == 1
+
+  # A granule that misses the area is cached without arrays, so it is not read again either
+  outside = frp.makeConfig(minimumLatitude=60, maximumLatitude=61, minimumLongitude=-149.9, maximumLongitude=-149.6,
+                           cacheDir=cacheDir)
+  nCalls = len(readCalls)
+  for i in range(2):
+    assert frp.loadGranule(filMOD02, filMOD03, outside) is None
+  assert len(readCalls) == nCalls + 1
+
+  # A changed HDF is read again
+  with open(filMOD02, 'ab') as f:
+    f.write(b'reprocessed')
+  expected = frp.loadGranule(filMOD02, filMOD03, frp.makeConfig(**area))
+  nCalls = len(readCalls)
+  assertGranulesEqual(frp.loadGranule(filMOD02, filMOD03, frp.makeConfig(cacheDir=cacheDir, **area)), expected)
+  assert len(readCalls) == nCalls + 1
+
+
+def test_orders_to_new_directory_use_footprint_index(tmp_path, monkeypatch, capsys):
+  directory = tmp_path / "orders" / "new"
+  downloads = []
+
+  def download(orders, downloadLimit, verbose, connections, host, bbox=None, directory=".", onPair=None):
+    downloads.append(directory)
+    return 0
+
+  monkeypatch.setattr(frp, 'hdf_ftp', type(sys)('hdf_ftp'))
+  monkeypatch.setattr(frp.hdf_ftp, 'main', download, raising=False)
+  monkeypatch.setattr(frp.hdf_ftp, 'DEF_HOST', "ftp://localhost/orders/", raising=False)
+  monkeypatch.setattr(frp, '_unusableIndexes', set())
+  monkeypatch.chdir(tmp_path)
+
+  assert frp.main(["-o", "1", "-dir", str(directory)]) == 0
+  assert downloads == [str(directory)]
+  assert os.path.exists(str(directory / footprints.DEF_INDEX_NAME))
+  assert "Cannot use the footprint index" not in capsys.readouterr().out
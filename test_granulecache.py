@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+import os
+import numpy as np
+import granulecache
+
+
+#
+# A clock that ticks once per call, so that every use of an entry has its own time
+#
+class Clock(object):
+  def __init__(self):
+    self.now = 0
+
+  def time(self):
+    self.now += 1
+    return self.now
+
+
+def test_store_and_load(tmp_path):
+  directory = str(tmp_path / "cache")
+  conn = granulecache.openCache(directory)
+  arrays = {'BAND22': np.arange(12, dtype=np.float32).reshape(3, 4), 'LANDMASK': np.ones((3, 4), dtype=np.uint8)}
+
+  assert granulecache.load(conn, directory, 'granule') is None
+  granulecache.store(conn, directory, 'granule', arrays, {'core': [0, 2, 0, 3]}, 1048576)
+  loaded, meta = granulecache.load(conn, directory, 'granule')
+  assert meta == {'core': [0, 2, 0, 3]}
+  assert sorted(loaded) == sorted(arrays)
+  for name in arrays:
+    assert isinstance(loaded[name], np.memmap) and loaded[name].dtype == arrays[name].dtype
+    np.testing.assert_array_equal(loaded[name], arrays[name])
+
+  # Entries without arrays only hold their metadata
+  granulecache.store(conn, directory, 'outside', None, None, 1048576)
+  assert granulecache.load(conn, directory, 'outside') == ({}, None)
+  conn.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+  monkeypatch.setattr(granulecache, 'time', Clock())
+  directory = str(tmp_path / "cache")
+  conn = granulecache.openCache(directory)
+  arrays = {'BAND22': np.zeros(10000)}
+
+  for key in ('a', 'b', 'c'):
+    granulecache.store(conn, directory, key, arrays, None, 4 * arrays['BAND22'].nbytes)
+  assert granulecache.load(conn, directory, 'a') is not None
+
+  # Storing a fourth entry evicts b, the least recently used now that a has been loaded
+  granulecache.store(conn, directory, 'd', arrays, None, 3.5 * arrays['BAND22'].nbytes)
+  assert granulecache.load(conn, directory, 'b') is None
+  for key in ('a', 'c', 'd'):
+    assert granulecache.load(conn, directory, key) is not None
+  assert sorted(os.listdir(directory)) == ['a', 'c', 'd', granulecache.INDEX_NAME]
+  conn.close()
+
+
+def test_entry_key_changes_with_the_files(tmp_path):
+  conn = granulecache.openCache(str(tmp_path / "cache"))
+  hdf = tmp_path / "MOD021KM.A2015189.2140.006.2015190083030.hdf"
+  hdf.write_bytes(b'calibrated radiances')
+
+  key = granulecache.entryKey(conn, [str(hdf)], [64, 65])
+  assert granulecache.entryKey(conn, [str(hdf)], [64, 65]) == key
+  assert granulecache.entryKey(conn, [str(hdf)], [64, 66]) != key
+
+  # The stored checksum is only trusted while the file's size and modification time are unchanged
+  stat = os.stat(str(hdf))
+  hdf.write_bytes(b'reprocessed radiances')
+  os.utime(str(hdf), (stat.st_atime, stat.st_mtime))
+  assert granulecache.entryKey(conn, [str(hdf)], [64, 65]) != key
+  conn.close()
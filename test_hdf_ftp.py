@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+import os
+import subprocess
+import sys
+import threading
+import pytest
+
+pytest.importorskip("pycurl")
+pytest.importorskip("pyftpdlib")
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+import hdf_ftp
+
+# Acquisition times of the HDF pairs in the test order
+TIMES = ['A2015189.2140', 'A2015189.2145', 'A2015190.0320']
+
+
+#
+# FTP handler that refuses to send a file as many times as given in failures, keyed by file name
+#
+class FailingHandler(FTPHandler):
+  failures = {}
+
+  def ftp_RETR(self, file):
+    name = os.path.basename(file)
+    if self.failures.get(name, 0) > 0:
+      self.failures[name] -= 1
+      self.respond("550 Forced failure.")
+      return
+    return FTPHandler.ftp_RETR(self, file)
+
+
+#
+# Serves an order of HDF pairs with random contents from a local FTP server
+# Yields the host URL, the order directory and the failures of the handler
+#
+@pytest.fixture
+def order(tmp_path):
+  orderDir = tmp_path / "orders" / "1"
+  orderDir.mkdir(parents=True)
+  for i, t in enumerate(TIMES):
+    for product, size in (('MOD021KM', 300000 + i), ('MOD03', 70000 + i)):
+      (orderDir / (product + "." + t + ".006.1.hdf")).write_bytes(os.urandom(size))
+
+  authorizer = DummyAuthorizer()
+  authorizer.add_anonymous(str(tmp_path))
+  handler = type('Handler', (FailingHandler,), {'authorizer': authorizer, 'failures': {}})
+  server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  try:
+    yield "ftp://127.0.0.1:" + str(server.address[1]) + "/orders/", orderDir, handler.failures
+  finally:
+    server.close_all()
+    thread.join()
+
+
+@pytest.fixture(autouse=True)
+def noRetryDelay(monkeypatch):
+  monkeypatch.setattr(hdf_ftp, 'RETRY_DELAY', 0)
+
+
+def test_threaded_download(order, tmp_path):
+  host, orderDir, failures = order
+  directory = str(tmp_path / "download")
+  arrived = []
+
+  nFailed = hdf_ftp.main("1", 0, False, connections=3, host=host, directory=directory,
+                         onPair=lambda hdf02, hdf03: arrived.append(hdf02))
+
+  assert nFailed == 0
+  assert len(arrived) == len(TIMES)
+  for name in os.listdir(str(orderDir)):
+    with open(os.path.join(directory, name), 'rb') as f:
+      assert f.read() == (orderDir / name).read_bytes()
+
+
+def test_resume_from_part(order, tmp_path):
+  host, orderDir, failures = order
+  name = "MOD021KM." + TIMES[0] + ".006.1.hdf"
+  data = (orderDir / name).read_bytes()
+  path = str(tmp_path / name)
+  with open(path + hdf_ftp.PART_SUFFIX, 'wb') as f:
+    f.write(data[:100000])
+
+  nBytes = hdf_ftp.downloadFile(host + "1/" + name, path, len(data))
+
+  assert nBytes == len(data) - 100000
+  assert not os.path.exists(path + hdf_ftp.PART_SUFFIX)
+  with open(path, 'rb') as f:
+    assert f.read() == data
+
+
+def test_retry_after_failure(order, tmp_path):
+  host, orderDir, failures = order
+  name = "MOD03." + TIMES[1] + ".006.1.hdf"
+  data = (orderDir / name).read_bytes()
+  path = str(tmp_path / name)
+  failures[name] = 2
+
+  assert hdf_ftp.downloadFile(host + "1/" + name, path, len(data), retries=2) == len(data)
+  assert failures[name] == 0
+  with open(path, 'rb') as f:
+    assert f.read() == data
+
+
+def test_failed_pair_exit_status(order, tmp_path):
+  host, orderDir, failures = order
+  name = "MOD03." + TIMES[2] + ".006.1.hdf"
+  failures[name] = 100
+
+  directory = str(tmp_path / "download")
+  assert hdf_ftp.main("1", 0, False, connections=2, host=host, retries=1, directory=directory) == 1
+  assert not os.path.exists(os.path.join(directory, name))
+
+  status = subprocess.call([sys.executable, hdf_ftp.__file__, "1", "--host", host, "-r", "0", "-dir", directory])
+  assert status == 1
+
+
+def test_empty_file(order, tmp_path):
+  host, orderDir, failures = order
+  (orderDir / "empty.hdf").write_bytes(b"")
+  path = str(tmp_path / "empty.hdf")
+
+  assert hdf_ftp.downloadFile(host + "1/empty.hdf", path, 0) == 0
+  assert os.path.getsize(path) == 0
+  assert not os.path.exists(path + hdf_ftp.PART_SUFFIX)
+
+
+def test_verbose_output_lines_are_whole(order, tmp_path, capsys):
+  host, orderDir, failures = order
+  failures["MOD03." + TIMES[0] + ".006.1.hdf"] = 1
+
+  assert hdf_ftp.main("1", 0, True, connections=3, host=host, directory=str(tmp_path / "download")) == 0
+  prefixes = ("Connecting to order ", "No checksum file found ", "Attempting download of ", "Retrying download of ",
+              "Successfully downloaded ", "Finished pair ", "FTP download of ")
+  lines = capsys.readouterr().out.splitlines()
+  assert len(lines) == 4 + 5 * len(TIMES)
+  for line in lines:
+    assert line.startswith(prefixes) and line.count(" download of ") <= 1
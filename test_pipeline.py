@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import os
+import numpy as np
+import pytest
+import pipeline
+
+if pipeline.shared_memory is None:
+  pytest.skip("The prefetching pipeline needs multiprocessing.shared_memory", allow_module_level=True)
+
+
+#
+# Reads a number into a shared array, the process dies reading the item 'crash'
+#
+def readItem(item):
+  if item == 'crash':
+    os._exit(1)
+  if not isinstance(item, int):
+    return None, None
+  return {'values': np.full(3, item)}, 2 * item
+
+
+#
+# Sums the shared array and the metadata, the process dies computing the item 'crash-compute'
+#
+def computeItem(item, arrays, meta):
+  if item == 'crash-compute':
+    os._exit(1)
+  if item == 'fail':
+    raise ValueError("bad item")
+  return int(np.sum(arrays['values'])) + meta
+
+
+def runItems(items, nReaders=1, nWorkers=1, depth=2):
+  return dict((item, (result, error)) for item, result, error in pipeline.run(
+    items, readItem, computeItem, nReaders, nWorkers, depth))
+
+
+def test_run_computes_every_item():
+  assert runItems(range(6), 2, 2) == dict((i, (5 * i, None)) for i in range(6))
+
+
+def test_run_reports_failed_items():
+  assert runItems([1, 'fail']) == {1: (5, None), 'fail': (None, "ValueError: bad item")}
+
+
+# The items queued before the process died are still completed, only the item it held fails
+@pytest.mark.parametrize("crash, kind", [('crash', "Reader"), ('crash-compute', "Compute")])
+def test_run_fails_the_item_of_a_dead_process(crash, kind):
+  results = runItems([0, 1, crash, 3, 4])
+  assert results == {0: (0, None), 1: (5, None), crash: (None, kind + " process exited with code 1"), 3: (15, None),
+                     4: (20, None)}
+
+
+def test_run_raises_the_error_of_the_items():
+  def items():
+    yield 1
+    yield 2
+    raise IOError("Order listing failed")
+
+  completed = []
+  with pytest.raises(IOError, match="Order listing failed"):
+    for item, result, error in pipeline.run(items(), readItem, computeItem, 1, 1, 2):
+      completed.append((item, result, error))
+  assert sorted(completed) == [(1, 5, None), (2, 10, None)]